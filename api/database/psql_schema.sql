@@ -5,20 +5,29 @@ CREATE TABLE IF NOT EXISTS main.users (
     user_partner_id INTEGER UNIQUE NOT NULL,
     user_code INTEGER UNIQUE NOT NULL,
     user_name TEXT NOT NULL,
-    last_provider_activity TEXT,
-    last_receiver_activity TEXT
+    last_provider_activity TIMESTAMPTZ,
+    last_receiver_activity TIMESTAMPTZ
 );
 
 CREATE TABLE IF NOT EXISTS main.redeem (
     redeem_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     odoo_pos_id INTEGER NOT NULL,
-    redeem_datetime TEXT NOT NULL,
+    redeem_datetime TIMESTAMPTZ NOT NULL,
     redeem_user INTEGER NOT NULL REFERENCES main.users(user_id),
     redeem_value REAL NOT NULL,
     redeem_barcode TEXT NOT NULL,
     anomaly BOOL NOT NULL
 );
 
+CREATE TABLE IF NOT EXISTS main.directory (
+    directory_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    partner_id INTEGER UNIQUE NOT NULL,
+    barcode_base INTEGER,
+    display_name TEXT NOT NULL,
+    cooperative_state TEXT,
+    write_date TEXT
+);
+
 CREATE TABLE IF NOT EXISTS main.consigne (
     consigne_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     consigne_pattern TEXT,
@@ -28,6 +37,12 @@ CREATE TABLE IF NOT EXISTS main.consigne (
     consigne_active BOOL
 );
 
+CREATE TABLE IF NOT EXISTS main.consigne_sequence (
+    sequence_id INTEGER PRIMARY KEY,
+    sequence_position INTEGER NOT NULL,
+    ring_version INTEGER NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS main.product_returns (
     product_return_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     odoo_product_return_id INTEGER UNIQUE,
@@ -36,6 +51,16 @@ CREATE TABLE IF NOT EXISTS main.product_returns (
     return_value REAL
 );
 
+CREATE TABLE IF NOT EXISTS main.catalog (
+    catalog_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    odoo_product_id INTEGER UNIQUE NOT NULL,
+    barcode TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    returnable BOOL NOT NULL,
+    product_return_id INTEGER REFERENCES main.product_returns(product_return_id),
+    write_date TEXT
+);
+
 CREATE TABLE IF NOT EXISTS main.products (
     product_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     odoo_product_id INTEGER UNIQUE NOT NULL,
@@ -48,25 +73,44 @@ CREATE TABLE IF NOT EXISTS main.deposits(
     deposit_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     receiver_id INTEGER NOT NULL REFERENCES main.users(user_id),
     provider_id INTEGER NOT NULL REFERENCES main.users(user_id),
-    deposit_datetime TEXT NOT NULL,
+    deposit_datetime TIMESTAMPTZ NOT NULL,
     closed BOOL NOT NULL,
     deposit_barcode TEXT,
     deposit_barcode_base_id INTEGER REFERENCES main.consigne(consigne_id),
-    redeemed INTEGER REFERENCES main.redeem(redeem_id)
+    redeemed INTEGER REFERENCES main.redeem(redeem_id),
+    deposit_lines_count INTEGER NOT NULL DEFAULT 0,
+    deposit_value REAL NOT NULL DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS main.deposit_lines (
     deposit_line_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     deposit_id INTEGER NOT NULL REFERENCES main.deposits(deposit_id),
     product_id INTEGER NOT NULL REFERENCES main.products(product_id),
-    deposit_line_datetime TEXT NOT NULL,
-    canceled BOOL NOT NULL
+    deposit_line_datetime TIMESTAMPTZ NOT NULL,
+    canceled BOOL NOT NULL,
+    line_value REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS main.deposit_return_totals (
+    deposit_id INTEGER NOT NULL REFERENCES main.deposits(deposit_id),
+    product_return_id INTEGER NOT NULL REFERENCES main.product_returns(product_return_id),
+    returns_count INTEGER NOT NULL,
+    returns_value REAL NOT NULL,
+    PRIMARY KEY (deposit_id, product_return_id)
 );
 
 CREATE UNIQUE INDEX IF NOT EXISTS idx_users_partner_id ON main.users(user_partner_id);
 CREATE UNIQUE INDEX IF NOT EXISTS idx_users_codes ON main.users(user_code);
 CREATE UNIQUE INDEX IF NOT EXISTS idx_opid ON main.products(odoo_product_id);
 CREATE UNIQUE INDEX IF NOT EXISTS idx_return_opid ON main.product_returns(odoo_product_return_id);
+CREATE INDEX IF NOT EXISTS idx_catalog_barcode ON main.catalog(barcode);
+-- keep aligned with src/migrations.py
+CREATE INDEX IF NOT EXISTS idx_deposit_lines_deposit_id ON main.deposit_lines(deposit_id);
+CREATE INDEX IF NOT EXISTS idx_deposits_barcode ON main.deposits(deposit_barcode);
+CREATE INDEX IF NOT EXISTS idx_deposits_redeem_state ON main.deposits(redeemed, closed);
+CREATE INDEX IF NOT EXISTS idx_deposits_barcode_base ON main.deposits(deposit_id, deposit_barcode_base_id) WHERE deposit_barcode_base_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_redeem_datetime ON main.redeem(redeem_datetime);
+CREATE INDEX IF NOT EXISTS idx_deposits_datetime ON main.deposits(deposit_datetime);
 
 INSERT INTO main.product_returns (product_return_name, odoo_product_return_id, returnable, return_value)
 VALUES ('Non Retournable', 0, false, NULL)
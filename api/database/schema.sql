@@ -3,27 +3,38 @@ CREATE TABLE IF NOT EXISTS users (
     user_partner_id INTEGER UNIQUE NOT NULL,
     user_code INTEGER UNIQUE NOT NULL,
     user_name TEXT NOT NULL,
-    last_provider_activity TEXT,
-    last_receiver_activity TEXT
+    last_provider_activity TIMESTAMP,
+    last_receiver_activity TIMESTAMP
 );
 
 CREATE TABLE IF NOT EXISTS  deposits(
     deposit_id INTEGER PRIMARY KEY,
     receiver_id INTEGER NOT NULL REFERENCES users(user_id),
     provider_id INTEGER NOT NULL REFERENCES users(user_id),
-    deposit_datetime TEXT NOT NULL,
+    deposit_datetime TIMESTAMP NOT NULL,
     closed BOOL NOT NULL,
     deposit_barcode TEXT,
     deposit_barcode_base_id INTEGER REFERENCES consigne(consigne_id),
-    redeemed INTEGER REFERENCES redeem(redeem_id)
+    redeemed INTEGER REFERENCES redeem(redeem_id),
+    deposit_lines_count INTEGER NOT NULL DEFAULT 0,
+    deposit_value REAL NOT NULL DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS deposit_lines (
     deposit_line_id INTEGER PRIMARY KEY,
     deposit_id INTEGER NOT NULL REFERENCES deposits(deposit_id),
     product_id INTEGER NOT NULL REFERENCES products(product_id),
-    deposit_line_datetime TEXT NOT NULL,
-    canceled BOOL NOT NULL
+    deposit_line_datetime TIMESTAMP NOT NULL,
+    canceled BOOL NOT NULL,
+    line_value REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS deposit_return_totals (
+    deposit_id INTEGER NOT NULL REFERENCES deposits(deposit_id),
+    product_return_id INTEGER NOT NULL REFERENCES product_returns(product_return_id),
+    returns_count INTEGER NOT NULL,
+    returns_value REAL NOT NULL,
+    PRIMARY KEY (deposit_id, product_return_id)
 );
 
 CREATE TABLE IF NOT EXISTS products (
@@ -42,16 +53,35 @@ CREATE TABLE IF NOT EXISTS product_returns (
     return_value REAL
 );
 
+CREATE TABLE IF NOT EXISTS catalog (
+    catalog_id INTEGER PRIMARY KEY,
+    odoo_product_id INTEGER UNIQUE NOT NULL,
+    barcode TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    returnable BOOL NOT NULL,
+    product_return_id INTEGER REFERENCES product_returns(product_return_id),
+    write_date TEXT
+);
+
 CREATE TABLE IF NOT EXISTS redeem (
     redeem_id INTEGER PRIMARY KEY,
     odoo_pos_id INTEGER NOT NULL,
-    redeem_datetime TEXT NOT NULL,
+    redeem_datetime TIMESTAMP NOT NULL,
     redeem_user INTEGER NOT NULL REFERENCES users(user_id),
     redeem_value REAL NOT NULL,
     redeem_barcode TEXT NOT NULL,
     anomaly BOOL NOT NULL
 );
 
+CREATE TABLE IF NOT EXISTS directory (
+    directory_id INTEGER PRIMARY KEY,
+    partner_id INTEGER UNIQUE NOT NULL,
+    barcode_base INTEGER,
+    display_name TEXT NOT NULL,
+    cooperative_state TEXT,
+    write_date TEXT
+);
+
 CREATE TABLE IF NOT EXISTS consigne (
     consigne_id INTEGER PRIMARY KEY,
     consigne_pattern TEXT,
@@ -61,11 +91,25 @@ CREATE TABLE IF NOT EXISTS consigne (
     consigne_active BOOL
 );
 
+CREATE TABLE IF NOT EXISTS consigne_sequence (
+    sequence_id INTEGER PRIMARY KEY,
+    sequence_position INTEGER NOT NULL,
+    ring_version INTEGER NOT NULL
+);
+
 
 CREATE UNIQUE INDEX IF NOT EXISTS idx_users_partner_id ON users(user_partner_id);
 CREATE UNIQUE INDEX IF NOT EXISTS idx_users_codes ON users(user_code);
 CREATE UNIQUE INDEX IF NOT EXISTS idx_opid ON products(odoo_product_id);
 CREATE UNIQUE INDEX IF NOT EXISTS idx_return_opid ON product_returns(odoo_product_return_id);
+CREATE INDEX IF NOT EXISTS idx_catalog_barcode ON catalog(barcode);
+-- keep aligned with src/migrations.py
+CREATE INDEX IF NOT EXISTS idx_deposit_lines_deposit_id ON deposit_lines(deposit_id);
+CREATE INDEX IF NOT EXISTS idx_deposits_barcode ON deposits(deposit_barcode);
+CREATE INDEX IF NOT EXISTS idx_deposits_redeem_state ON deposits(redeemed, closed);
+CREATE INDEX IF NOT EXISTS idx_deposits_barcode_base ON deposits(deposit_id, deposit_barcode_base_id) WHERE deposit_barcode_base_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_redeem_datetime ON redeem(redeem_datetime);
+CREATE INDEX IF NOT EXISTS idx_deposits_datetime ON deposits(deposit_datetime);
 
 INSERT OR IGNORE INTO product_returns (product_return_name, odoo_product_return_id, returnable, return_value)
 VALUES ("Non Retournable", 0, false, NULL), ("Réutilisable", 1, true, 0.0);
\ No newline at end of file
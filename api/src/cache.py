@@ -1,58 +1,272 @@
+from __future__ import annotations
+
+import os
+import hmac
 import json
-from hashlib import sha1
+import time
+import asyncio
+import logging
+from hashlib import sha1, pbkdf2_hmac
 from datetime import datetime
 from functools import wraps
+from contextvars import ContextVar
 from pymemcache.client.hash import HashClient
 
-from typing import Any, Type
+from typing import Any, Type, Callable, Awaitable
+
+from src.exceptions import OdooUnavailable
+from src.odoo import odoo_deadline
+from src.metrics import rpc_stats
+
+"""
+Cached values are stored in an envelope {"v": value, "t": fresh until timestamp}.
+Entries outlive their freshness by STALE_TTL so that the last known value can be served,
+marked as stale, while odoo is unavailable. A background task refreshes them once odoo recovers.
+
+Misses are single-flighted: concurrent misses on a key share one odoo call within a worker (in flight futures),
+and across workers through a memcached lock key, holders of the lock fetch while the others poll the cache for their result.
+"""
+
+TTL = 86400
+STALE_TTL = 7 * 86400
+LOCK_TTL = 30 # in seconds, upper bound of a lock holder's odoo call
+LOCK_POLL = 0.05 # in seconds
+AUTH_TTL = 900 # in seconds, verified credentials lifetime outside of a shift
+AUTH_MAX_TTL = 3 * 3600 # in seconds, upper bound of a shift
+PBKDF2_ITERATIONS = 20_000
+
+_MISS = object()
+_ABANDONED = object() # result of a flight whose leader was cancelled
+_RELEASED = "released" # lock value left by `ConsigneCache.release_lock` until it expires
+
+tasks_logger = logging.getLogger("tasks")
+
+stale_reads: ContextVar[list[str] | None] = ContextVar("stale_reads", default=None)
+_refreshing: set[str] = set()
+_inflight: dict[str, asyncio.Future] = {}
+
+
+def _mark_stale(key: str) -> None:
+    reads = stale_reads.get()
+    if reads is not None:
+        reads.append(key)
+
+def _schedule_refresh(engine, key: str, refresh: Callable[[], Awaitable[None]]) -> None:
+    """retry `refresh` in the background until odoo answers again. One refresh per key and worker."""
+    if key in _refreshing:
+        return
+    _refreshing.add(key)
+
+    async def runner() -> None:
+        # detached from the request that scheduled it
+        rpc_stats.set(None)
+        odoo_deadline.set(None)
+        try:
+            while True:
+                await asyncio.sleep(engine.odoo.breaker.configs.reset_timeout)
+                try:
+                    await refresh()
+                    return
+                except OdooUnavailable:
+                    continue
+        except Exception as e:
+            tasks_logger.error(f"CACHE | Background refresh of {key} failed: {e}")
+        finally:
+            _refreshing.discard(key)
+
+    asyncio.get_running_loop().create_task(runner())
+
+async def single_flight(
+    cache: ConsigneCache, 
+    key: str, 
+    load: Callable[[], Awaitable[Any]], 
+    peek: Callable[[], Any]
+) -> Any:
+    """
+    run `load` (fetch & store `key`) once for all the concurrent misses on `key`.
+    `peek` returns the value stored by another worker, or _MISS.
+    A cancelled leader (client disconnect) abandons the flight: its waiters are woken up
+    and one of them leads a new one instead of being cancelled along.
+    """
+    while True:
+        inflight = _inflight.get(key, None)
+        if inflight is None:
+            break
+        value = await asyncio.shield(inflight)
+        if value is not _ABANDONED:
+            return value
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        value = await _load_across_workers(cache, key, load, peek)
+    except asyncio.CancelledError:
+        future.set_result(_ABANDONED)
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception() # retrieved, waiters (if any) get it re-raised
+        raise
+    else:
+        future.set_result(value)
+        return value
+    finally:
+        _inflight.pop(key, None)
+
+async def _load_across_workers(
+    cache: ConsigneCache, 
+    key: str, 
+    load: Callable[[], Awaitable[Any]], 
+    peek: Callable[[], Any]
+) -> Any:
+    lock = f"lock_{key}"
+    token = cache.acquire_lock(lock, LOCK_TTL)
+    if token is not None:
+        try:
+            return await load()
+        finally:
+            cache.release_lock(lock, token)
+
+    # another worker is loading the key, wait for its result.
+    deadline = time.monotonic() + LOCK_TTL
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL)
+        value = peek()
+        if value is not _MISS:
+            return value
+        if not cache.is_locked(lock):
+            break # released without a usable result (failure, nothing to cache)
+    return await load()
+
+def _fresh_entry(cache: ConsigneCache, key: str) -> Any:
+    entry = cache.get_entry(key)
+    if entry is not None and entry["t"] > time.time():
+        return entry["v"]
+    return _MISS
+
+async def stale_while_revalidate(engine, key: str, fetch: Callable[[], Awaitable[Any]], ttl: int = TTL) -> Any:
+    cache: ConsigneCache = engine.cache
+    entry = cache.get_entry(key)
+    if entry is not None and entry["t"] > time.time():
+        return entry["v"]
+
+    async def load() -> Any:
+        value = await fetch()
+        cache.set_entry(key, value, ttl)
+        return value
+
+    try:
+        value = await single_flight(cache, key, load, lambda: _fresh_entry(cache, key))
+    except OdooUnavailable:
+        if entry is None:
+            raise
+        async def refresh() -> None:
+            cache.set_entry(key, await fetch(), ttl)
+        _mark_stale(key)
+        _schedule_refresh(engine, key, refresh)
+        return entry["v"]
+    return value
 
 
 def cached_products(f):
     @wraps(f)
-    def wrapper(engine, deposit_id: int, deposit_barcode: str) -> dict[str, Any]:
+    async def wrapper(engine, deposit_id: int, deposit_barcode: str) -> dict[str, Any]:
         cache: ConsigneCache = engine.cache
         if cache is None:
-            return f(engine, deposit_id, deposit_barcode)
-
-        res = cache.get(deposit_barcode)
-        if res is None:
-            res = f(engine, deposit_id, deposit_barcode)
-            cache.cache_product(deposit_barcode, res)
-        return res
+            return await f(engine, deposit_id, deposit_barcode)
+        return await stale_while_revalidate(engine, deposit_barcode, lambda: f(engine, deposit_id, deposit_barcode))
     return wrapper
 
 def cached_shifts(f):
     @wraps(f)
-    def wrapper(engine) -> dict[str, Any]:
+    async def wrapper(engine) -> dict[str, Any]:
         cache: ConsigneCache = engine.cache
         if cache is None:
-            current_zone, members = f(engine)
+            current_zone, members = await f(engine)
             return members
 
         zone = cache.get_shift_zone()
         members = cache.get("shift_users")
 
-        now = datetime.now()
-        if members is None or zone is None or now < zone.debut or now >= zone.end:
-            current_zone, members = f(engine)
+        async def refresh() -> Any:
+            current_zone, members = await f(engine)
             cache.set_shift_zone(*current_zone)
-            cache.set("shift_users", members, expire=86400)
+            cache.set("shift_users", members, expire=TTL)
+            return members
+
+        def valid(zone: Type|None, members: Any) -> bool:
+            now = datetime.now()
+            return members is not None and zone is not None and zone.debut <= now < zone.end
+
+        def peek() -> Any:
+            members = cache.get("shift_users")
+            return members if valid(cache.get_shift_zone(), members) else _MISS
+
+        if not valid(zone, members):
+            try:
+                members = await single_flight(cache, "shift_users", refresh, peek)
+            except OdooUnavailable:
+                if members is None:
+                    raise
+                _mark_stale("shift_users")
+                _schedule_refresh(engine, "shift_users", refresh)
         return members
     return wrapper
 
 def cached_users(f):
     @wraps(f)
-    def wrapper(engine, value: str) -> list[tuple[int, str]]:
+    async def wrapper(engine, value: str) -> list[tuple[int, str]]:
         cache: ConsigneCache = engine.cache
         if cache is None:
-            return f(engine, value)
+            return await f(engine, value)
 
         digest = sha1(value.encode("utf-8")).hexdigest()
-        res = cache.get(f"users_{digest}")
-        if res is None:
-            res = f(engine, value)
-            cache.set(f"users_{digest}", res, expire=86400)
-        return res
+        return await stale_while_revalidate(engine, f"users_{digest}", lambda: f(engine, value))
+    return wrapper
+
+def _hash_password(password: str, salt: bytes) -> str:
+    return pbkdf2_hmac("sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS).hex()
+
+async def _hash_password_off_loop(engine, password: str, salt: bytes) -> str:
+    """pbkdf2 is cpu bound (tens of ms), it runs in the worker's auth pool to keep the event loop responsive."""
+    return await engine.executor.run("auth", _hash_password, password, salt)
+
+def cached_credentials(f):
+    """
+    verified credentials, kept until the end of the provider's current shift (AUTH_TTL outside of a shift).
+    Only a salted hash of the password is stored, next to the resolved user record.
+    Failed authentications are never cached, a mismatching password always goes to odoo.
+    """
+    @wraps(f)
+    async def wrapper(engine, username: str, password: str) -> tuple[tuple, int | None] | None:
+        cache: ConsigneCache = engine.cache
+        if cache is None:
+            return await f(engine, username, password)
+
+        key = f"auth_{sha1(username.encode('utf-8')).hexdigest()}"
+        entry = cache.get(key)
+        now = time.time()
+        if isinstance(entry, dict) and entry.get("until", 0) > now:
+            digest = await _hash_password_off_loop(engine, password, bytes.fromhex(entry["salt"]))
+            if hmac.compare_digest(digest, entry["hash"]):
+                end = entry["end"]
+                return (tuple(entry["user"]), int(end - now) if end is not None and end > now else None)
+
+        authenticated = await f(engine, username, password)
+        if authenticated is None:
+            return None
+
+        user, end_dist = authenticated
+        ttl = min(end_dist, AUTH_MAX_TTL) if end_dist else AUTH_TTL
+        salt = os.urandom(16)
+        cache.set(key, {
+            "salt": salt.hex(),
+            "hash": await _hash_password_off_loop(engine, password, salt),
+            "user": list(user),
+            "end": now + end_dist if end_dist else None,
+            "until": now + ttl
+        }, expire=int(ttl) + 1)
+        return authenticated
     return wrapper
 
 
@@ -84,8 +298,37 @@ class ConsigneCache(HashClient):
         self.set("shift_zone_debut", debut)
         self.set("shift_zone_end", end)
 
-    def cache_product(self, barcode: str, payload: dict[str, Any], ttl: int = 86400) -> None:
-        self.set(barcode, payload, expire=ttl)
+    def cache_product(self, barcode: str, payload: dict[str, Any], ttl: int = TTL) -> None:
+        self.set_entry(barcode, payload, ttl)
+
+    def get_entry(self, key: str) -> dict[str, Any] | None:
+        entry = self.get(key)
+        if not isinstance(entry, dict) or not {"v", "t"} <= entry.keys():
+            return None # missing or written by a previous version
+        return entry
+
+    def set_entry(self, key: str, value: Any, ttl: int = TTL) -> None:
+        self.set(key, {"v": value, "t": time.time() + ttl}, expire=ttl + STALE_TTL)
+
+    def acquire_lock(self, lock: str, ttl: int = LOCK_TTL) -> str | None:
+        """
+        memcached `add` is atomic: only one client stores the lock key until it expires or is released.
+        return the holder's token, None when the lock is already held.
+        """
+        token = os.urandom(8).hex()
+        return token if self.add(lock, token, expire=ttl, noreply=False) else None
+
+    def release_lock(self, lock: str, token: str) -> None:
+        """
+        compare & release: a holder outliving LOCK_TTL must not release the lock taken by another worker since.
+        memcached has no conditional delete, the lock is `cas` swapped for a released marker expiring right away.
+        """
+        value, cas = self.gets(lock)
+        if value == token and cas is not None:
+            self.cas(lock, _RELEASED, cas, expire=1, noreply=False)
+
+    def is_locked(self, lock: str) -> bool:
+        return self.get(lock) not in (None, _RELEASED)
 
     def serialize(self, key: str, value: Any) -> tuple[str, int]:
         if isinstance(value, str):
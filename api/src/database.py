@@ -1,23 +1,33 @@
-import re
-import sys
-from datetime import datetime
-from sqlalchemy import Row, create_engine, select, insert, update, Result, text
+import json
+from itertools import count
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from sqlalchemy import Row, create_engine, event, make_url, Result, func, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, decl_api
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy import MetaData, Engine, Table
-from sqlalchemy.sql.selectable import Select
 
-from typing import Any, Optional, Literal, Callable, Type
+from typing import Any, AsyncIterator, Optional, Literal, Callable, Type
 
 """
-Schema is loaded dynamically using `ConsigneDatabase.load_metadata` method
-As schemas are dynamic objects, for clarity we set: pyright: reportUndefinedVariable=false
+Tables are statically imported from `src.tables`, statements are prebuilt in `src.statements`.
+Operations are coroutines running on an asyncio engine (asyncpg for postgresql, aiosqlite for sqlite).
 
 """
 
-# pyright: reportUndefinedVariable=false
+from src.schema import Base
+from src.tables import Consigne, Directory, Catalog, Product_returns
+from src.migrations import ARCHIVE_SCHEMAS, migrate
+from src import statements as sql
 
+UPSERT_CHUNK_SIZE = 500
+ARCHIVE_BATCH_SIZE = 1000
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
 
-from src.schema import Base
+# session of the unit of work opened by `ConsigneDatabase.transaction` in the current task, if any.
+_unit_of_work: ContextVar[AsyncSession | None] = ContextVar("unit_of_work", default=None)
 
 class ConsigneDatabase:
     dialect: str
@@ -29,6 +39,7 @@ class ConsigneDatabase:
     password: Optional[str] | None
     
     _engine: Engine
+    _async_engine: AsyncEngine | None
     _metadata: MetaData
 
     def __init__(
@@ -39,7 +50,9 @@ class ConsigneDatabase:
         host: Optional[str] | None = None,
         port: Optional[int] | None = None,
         username: Optional[str] | None = None,
-        password: Optional[str] | None = None
+        password: Optional[str] | None = None,
+        archive: Optional[str] | None = None,
+        replicas: Optional[list[str]] | None = None
     ) -> None:
         self.dialect = dialect
         self.database = database
@@ -48,34 +61,144 @@ class ConsigneDatabase:
         self.port = port
         self.username = username
         self.password = password
+        self.archive = archive or self._default_archive()
+        self.replicas = replicas or []
 
         # self._prepare()
         self._engine = create_engine(self.uri)
+        self._attach_archive(self._engine)
         Base.metadata.create_all(self._engine, checkfirst=True)
+        migrate(self._engine, self.dialect) # pyright: ignore
         self._metadata = Base.metadata
         self.session_maker = sessionmaker(bind=self._engine)
+        self._async_engine = None
+        self._async_session_maker: async_sessionmaker[AsyncSession] | None = None
+        self._replica_engines: list[AsyncEngine] = []
+        self._replica_session_makers: list[async_sessionmaker[AsyncSession]] = []
+        self._replica_turn = count()
+        self._bases_ring: list[tuple[int, str]] = [] # active (consigne_id, consigne_barcode_base), see `next_barcode_base`
+        self._bases_version: int | None = None
+
+    def _default_archive(self) -> str | None:
+        """sqlite archive database file, next to the main one: database.db -> database_archive.db"""
+        if self.dialect != "sqlite":
+            return None
+        stem, dot, suffix = self.database.rpartition(".")
+        return f"{stem}_archive.{suffix}" if dot else f"{self.database}_archive"
+
+    def _attach_archive(self, engine: Engine) -> None:
+        """attach the archive database to every new sqlite connection of `engine`"""
+        if self.dialect != "sqlite":
+            return
+
+        @event.listens_for(engine, "connect")
+        def attach(dbapi_connection, _) -> None:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("ATTACH DATABASE ? AS archive", (self.archive,))
+            cursor.close()
 
-        self.load_metadata(__name__)
+    @property
+    def archive_schema(self) -> str:
+        return ARCHIVE_SCHEMAS[self.dialect]
 
     @property
     def uri(self) -> str:
+        return self._make_uri(self.driver)
+
+    @property
+    def async_uri(self) -> str:
+        driver = ASYNC_DRIVERS.get(self.dialect, None)
+        if driver is None:
+            raise ValueError(f"No asyncio driver for dialect: {self.dialect}")
+        return self._make_uri(driver)
+
+    def _make_uri(self, driver: str | None) -> str:
         engine = f"{self.dialect}"
-        if self.driver:
-            engine += f"+{self.driver}"
+        if driver:
+            engine += f"+{driver}"
 
         access = ""
         if all([self.username, self.password, self.host, self.port]):
             access = f"{self.username}:{self.password}@{self.host}:{str(self.port)}"
         return f"{engine}://{access}/{self.database}"
 
+    @property
+    def async_session_maker(self) -> async_sessionmaker[AsyncSession]:
+        """
+        sessions of the asyncio engine, serving the operations below.
+        The engine is created lazily, asyncio connections are bound to the event loop of the worker that opened them.
+        The sync engine is kept for the schema creation & scripts.
+        """
+        if self._async_session_maker is None:
+            self._async_engine = create_async_engine(self.async_uri)
+            self._attach_archive(self._async_engine.sync_engine)
+            self._async_session_maker = async_sessionmaker(bind=self._async_engine, expire_on_commit=False)
+        return self._async_session_maker
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[AsyncSession]:
+        """
+        unit of work: the operations awaited within share one connection & one transaction,
+        committed on exit and rolled back on error. Nested transactions join the outer one.
+        Operations of a unit of work must be awaited sequentially, sessions are not concurrency safe.
+        """
+        session = _unit_of_work.get()
+        if session is not None:
+            yield session
+            return
+
+        async with self.async_session_maker() as session:
+            async with session.begin():
+                token = _unit_of_work.set(session)
+                try:
+                    yield session
+                finally:
+                    _unit_of_work.reset(token)
 
-
-    def load_metadata(self, module_name: str) -> None:
-        
-        for k,v in self._metadata.tables.items():
-            name = re.sub(r"[Mm]ain\.","", k)
-            capitalized_name = name[0].upper() + name[1:]
-            sys.modules[module_name].__dict__.update({capitalized_name:v})            
+    @property
+    def replica_session_makers(self) -> list[async_sessionmaker[AsyncSession]]:
+        """
+        sessions of the read only replicas engines, created lazily like the primary one.
+        replicas are set as DSNs, their driver is replaced by the dialect asyncio one.
+        """
+        if self.replicas and not self._replica_session_makers:
+            for dsn in self.replicas:
+                url = make_url(dsn)
+                url = url.set(drivername=f"{url.get_backend_name()}+{ASYNC_DRIVERS[url.get_backend_name()]}")
+                engine = create_async_engine(url)
+                self._attach_archive(engine.sync_engine)
+                self._replica_engines.append(engine)
+                self._replica_session_makers.append(async_sessionmaker(bind=engine, expire_on_commit=False))
+        return self._replica_session_makers
+
+    @asynccontextmanager
+    async def _session(self, replica: bool = False) -> AsyncIterator[AsyncSession]:
+        """
+        session of the current unit of work, otherwise a dedicated one committed on exit.
+        Routing: writes & read-your-writes paths go to the primary. `replica` reads (bulk & analytic ones,
+        tolerating the replication lag) go to the replicas in turn, or to the primary when none are set.
+        A unit of work always keeps its reads on the primary.
+        """
+        session = _unit_of_work.get()
+        if session is not None:
+            yield session
+            return
+
+        session_maker = self.async_session_maker
+        if replica and self.replica_session_makers:
+            session_maker = self.replica_session_makers[next(self._replica_turn) % len(self.replica_session_makers)]
+
+        async with session_maker() as session:
+            async with session.begin():
+                yield session
+
+    async def dispose(self) -> None:
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+            self._async_engine, self._async_session_maker = None, None
+        for engine in self._replica_engines:
+            await engine.dispose()
+        self._replica_engines, self._replica_session_makers = [], []
 
 
     def _collect_all_records(self, result: Result) -> list[dict[str, Any]]: 
@@ -88,360 +211,372 @@ class ConsigneDatabase:
             res = res._asdict()
         return res
 
+    async def _upsert(
+        self,
+        session,
+        table: Table,
+        rows: list[dict[str, Any]],
+        index_elements: list[str],
+        keep: list[str] | None = None
+    ) -> None:
+        """
+        bulk `INSERT ... ON CONFLICT DO UPDATE` of `rows`, conflicts are resolved on `index_elements`.
+        `keep` columns are only overwritten by non NULL values.
+        """
+        match self.dialect:
+            case "postgresql":
+                dialect_insert = postgresql.insert
+            case "sqlite":
+                dialect_insert = sqlite.insert
+            case _:
+                raise ValueError(f"Upsert not supported for dialect: {self.dialect}")
+
+        for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[i:i + UPSERT_CHUNK_SIZE]
+            stmt = dialect_insert(table).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={
+                    k: func.coalesce(stmt.excluded[k], table.c[k]) if keep and k in keep else stmt.excluded[k]
+                    for k in chunk[0].keys() if k not in index_elements
+                }
+            )
+            await session.execute(stmt)
+
 
 
 
     # USERS
-    def add_user(self, partner_id: int, code: int, name: str) -> dict[str,Any]:
-        with self.session_maker() as session:
-            stmt = (
-                insert(Users)
-                .values(
-                    user_partner_id=partner_id,
-                    user_code=code,
-                    user_name=name,
-                    last_provider_activity=None,
-                    last_receiver_activity=None
-                )
-                .returning(Users.c.user_id)
-            )
-            res = session.execute(stmt).fetchone()
+    async def add_user(self, partner_id: int, code: int, name: str) -> dict[str,Any]:
+        async with self._session() as session:
+            params = {
+                "user_partner_id": partner_id,
+                "user_code": code,
+                "user_name": name,
+                "last_provider_activity": None,
+                "last_receiver_activity": None
+            }
+            res = (await session.execute(sql.INSERT_USER, params)).fetchone()
             assert res is not None
             res = res._asdict()
-            session.commit()
         return res
 
-    def update_activity(self, user_id: int, activity_as: Literal["provider", "receiver"]) -> None:
-        activity_field = f"last_{activity_as}_activity"
-        field = getattr(Users.c, activity_field, None)
-        if field is None:
+    async def update_activity(self, user_id: int, activity_as: Literal["provider", "receiver"]) -> None:
+        stmt = sql.UPDATE_ACTIVITY.get(activity_as, None)
+        if stmt is None:
             raise ValueError("Posible activity_as argument values are: [`provider`, `receiver`]")
 
-        with self.session_maker() as session:
-            stmt = (
-                update(Users)
-                .where(Users.c.user_id == user_id)
-                .values({field:datetime.now().isoformat("-")})
-            )
-            session.execute(stmt)
-            session.commit()
-
-    def get_user_from_code(self, code: int) -> dict[str, Any] | None: 
-        with self.session_maker() as session:
-            stmt = (
-                select(Users)
-                .select_from(Users)
-                .where(Users.c.user_code == code)
-            )
-            res = session.execute(stmt)
+        async with self._session() as session:
+            await session.execute(stmt, {"b_user_id": user_id, "b_now": datetime.now(timezone.utc)})
+
+    async def get_user_from_code(self, code: int) -> dict[str, Any] | None: 
+        async with self._session() as session:
+            res = await session.execute(sql.SELECT_USER_FROM_CODE, {"code": code})
         return self._collect_one_record(res)
 
-    def get_user_from_partner_id(self, partner_id: int) -> dict[str, Any] | None: 
-        with self.session_maker() as session:
-            stmt = (
-                select(Users)
-                .select_from(Users)
-                .where(Users.c.user_partner_id == partner_id)
-            )
-            res = session.execute(stmt)
+    async def get_user_from_partner_id(self, partner_id: int) -> dict[str, Any] | None: 
+        async with self._session() as session:
+            res = await session.execute(sql.SELECT_USER_FROM_PARTNER_ID, {"partner_id": partner_id})
         return self._collect_one_record(res)
 
-    def get_user_from_id(self, user_id: int) -> dict[str, Any]|None: 
-        with self.session_maker() as session:
-            stmt = (
-                select(Users)
-                .select_from(Users)
-                .where(Users.c.user_id == user_id)
-            )
-            res = session.execute(stmt)
+    async def get_user_from_id(self, user_id: int) -> dict[str, Any]|None: 
+        async with self._session() as session:
+            res = await session.execute(sql.SELECT_USER_FROM_ID, {"user_id": user_id})
         return self._collect_one_record(res)
 
+    # DIRECTORY
+    async def get_directory_cursor(self) -> str | None:
+        """last odoo write_date mirrored in the directory"""
+        async with self._session() as session:
+            res = (await session.execute(sql.SELECT_DIRECTORY_CURSOR)).scalar()
+        return res
+
+    async def upsert_directory_partners(self, records: list[tuple]) -> None:
+        keys = ["partner_id", "barcode_base", "display_name", "cooperative_state", "write_date"]
+        async with self._session() as session:
+            await self._upsert(session, Directory, [dict(zip(keys, r)) for r in records], ["partner_id"])
+
+    async def get_directory_partners(self) -> list[tuple[int, int | None, str]]:
+        """searchable partners: (partner_id, barcode_base, display_name)"""
+        async with self._session(replica=True) as session:
+            res = (await session.execute(sql.SELECT_DIRECTORY_PARTNERS)).fetchall()
+        return [tuple(r) for r in res]
+
     # PRODUCTS
-    def add_product(self, opid: int, name: str, barcode: str, return_product_id: int) -> dict[str, Any]:
-        with self.session_maker() as session:
-            stmt = (
-                insert(Products)
-                .values(
-                    odoo_product_id=opid,
-                    product_name=name,
-                    barcode=barcode, 
-                    product_return_id=return_product_id
-                )
-                .returning(Products.c.product_id))
-            res = session.execute(stmt).fetchone()
+    async def add_product(self, opid: int, name: str, barcode: str, return_product_id: int) -> dict[str, Any]:
+        async with self._session() as session:
+            params = {
+                "odoo_product_id": opid,
+                "product_name": name,
+                "barcode": barcode,
+                "product_return_id": return_product_id
+            }
+            res = (await session.execute(sql.INSERT_PRODUCT, params)).fetchone()
             assert res is not None
             res = res._asdict()
-
-            session.commit()
         return res
 
-    def add_product_return(self, opid: int, name: str, returnable: bool, return_value: float) -> dict[str, Any]:
-        with self.session_maker() as session:
-            stmt = (
-                insert(Product_returns)
-                .values(
-                    odoo_product_return_id=opid,
-                    product_return_name=name,
-                    returnable=returnable,
-                    return_value=return_value
-                )
-                .returning(Product_returns.c.product_return_id)
-            )
-            res = session.execute(stmt).fetchone()
-            assert res is not None
-            res = res._asdict()
+    async def update_deposit_barcode(self, deposit_id: int, ean: str, barcode_base_id: int) -> None:
+        async with self._session() as session:
+            params = {"b_deposit_id": deposit_id, "b_ean": ean, "b_barcode_base_id": barcode_base_id}
+            await session.execute(sql.UPDATE_DEPOSIT_BARCODE, params)
 
-            session.commit()
-        return res
+    async def update_deposit_redeem(self, deposit_id: int, redeem_id: int) -> None:
+        await self.update_deposits_redeem([(deposit_id, redeem_id)])
 
-    def update_deposit_barcode(self, deposit_id: int, ean: str, barcode_base_id: int) -> None:
-        with self.session_maker() as session:
-            stmt = (
-                update(Deposits)
-                .values(deposit_barcode=ean, 
-                        deposit_barcode_base_id=barcode_base_id
-                )
-                .where(Deposits.c.deposit_id == deposit_id)
-            )
-            session.execute(stmt)
-            session.commit()
-
-    def update_deposit_redeem(self, deposit_id: int, redeem_id: int) -> None:
-        with self.session_maker() as session:
-            stmt = (
-                update(Deposits)
-                .values(Deposits.c.redeemed==redeem_id)
-                .where(Deposits.c.deposit_id == deposit_id)
-            )
-            session.execute(stmt)
-            session.commit()
-
-    def get_product_from_opid(self, opid: int) -> dict[str, Any] | None: 
-        with self.session_maker() as session:
-            stmt = (
-                select(Products)
-                .where(Products.c.odoo_product_id == opid)
-            )
-            res = session.execute(stmt)
+    async def get_product_from_opid(self, opid: int) -> dict[str, Any] | None: 
+        async with self._session() as session:
+            res = await session.execute(sql.SELECT_PRODUCT_FROM_OPID, {"opid": opid})
         return self._collect_one_record(res)
 
-    def get_return_product_from_opid(self, opid: int) -> dict[str, Any] | None: 
-        with self.session_maker() as session:
-            stmt = (
-                select(Product_returns)
-                .where(Product_returns.c.odoo_product_return_id == opid)
-            )
-            res = session.execute(stmt)
+    async def get_return_product_from_opid(self, opid: int) -> dict[str, Any] | None: 
+        async with self._session() as session:
+            res = await session.execute(sql.SELECT_RETURN_PRODUCT_FROM_OPID, {"opid": opid})
+        return self._collect_one_record(res)
+
+    async def upsert_product_returns(self, records: list[tuple]) -> dict[int, int]:
+        """
+        insert or refresh return products from their odoo records (opid, name, returnable, return_value).
+        return the map of odoo return product ids to their local product_return_id
+        """
+        if not records:
+            return {}
+        keys = ["odoo_product_return_id", "product_return_name", "returnable", "return_value"]
+        async with self._session() as session:
+            await self._upsert(session, Product_returns, [dict(zip(keys, r)) for r in records], ["odoo_product_return_id"])
+            res = (await session.execute(sql.SELECT_RETURN_PRODUCTS_FROM_OPIDS, {"opids": [r[0] for r in records]})).fetchall()
+        return {opid: product_return_id for opid, product_return_id in res}
+
+    # CATALOG
+    async def get_catalog_product(self, barcode: str) -> dict[str, Any] | None:
+        async with self._session() as session:
+            res = await session.execute(sql.SELECT_CATALOG_PRODUCT, {"barcode": barcode})
         return self._collect_one_record(res)
 
+    async def get_catalog_return_opids(self) -> list[int]:
+        """odoo ids of the return products referenced by the local catalog"""
+        async with self._session() as session:
+            res = (await session.execute(sql.SELECT_CATALOG_RETURN_OPIDS)).scalars().all()
+        return list(res)
+
+    async def get_catalog_cursor(self) -> str | None:
+        """last odoo write_date mirrored in the catalog"""
+        async with self._session() as session:
+            res = (await session.execute(sql.SELECT_CATALOG_CURSOR)).scalar()
+        return res
+
+    async def upsert_catalog_products(self, records: list[tuple]) -> None:
+        keys = ["odoo_product_id", "barcode", "product_name", "returnable", "product_return_id", "write_date"]
+        async with self._session() as session:
+            # products mirrored by a scan come without write_date, the one set by the sync is kept.
+            await self._upsert(session, Catalog, [dict(zip(keys, r)) for r in records], ["odoo_product_id"], keep=["write_date"])
+
     # DEPOSITS
-    def add_deposit(self, receiver_id: int, provider_id: int) -> dict[str,Any]:
-        with self.session_maker() as session:
-            stmt = (
-                insert(Deposits)
-                .values(
-                    receiver_id=receiver_id,
-                    provider_id=provider_id,
-                    deposit_datetime=datetime.now().isoformat("-"),
-                    closed=False,
-                    deposit_barcode=None,
-                    redeemed=None
-                )
-                .returning(Deposits.c.deposit_id)
-            )
-            res = session.execute(stmt).fetchone()
+    async def add_deposit(self, receiver_id: int, provider_id: int) -> dict[str,Any]:
+        async with self._session() as session:
+            params = {
+                "receiver_id": receiver_id,
+                "provider_id": provider_id,
+                "deposit_datetime": datetime.now(timezone.utc),
+                "closed": False,
+                "deposit_barcode": None,
+                "redeemed": None
+            }
+            res = (await session.execute(sql.INSERT_DEPOSIT, params)).fetchone()
             assert res is not None
             res = res._asdict()
-
-            session.commit()
         return res
 
 
-    def close_deposit(self, deposit_id: int) -> None:
-        with self.session_maker() as session:
-            stmt = (
-                update(Deposits)
-                .values(closed=True)
-                .where(Deposits.c.deposit_id == deposit_id)
-            )
-            session.execute(stmt)
-            session.commit()
-
-    def add_deposit_line(self, deposit_id: int, product_id: int, canceled: bool=False) -> dict[str,Any]:
-        with self.session_maker() as session:
-            stmt = (
-                insert(Deposit_lines)
-                .values(
-                    deposit_id=deposit_id,
-                    product_id=product_id,
-                    deposit_line_datetime=datetime.now().isoformat("-"),
-                    canceled=canceled,
-                )
-                .returning(Deposit_lines.c.deposit_line_id)
-            )
-            res = session.execute(stmt).fetchone()
+    async def close_deposit(self, deposit_id: int) -> None:
+        async with self._session() as session:
+            await session.execute(sql.UPDATE_DEPOSIT_CLOSED, {"b_deposit_id": deposit_id})
+
+    async def add_deposit_line(self, deposit_id: int, product_id: int, line_value: float = 0.0, canceled: bool=False) -> dict[str,Any]:
+        """`line_value` is the return value of the product when scanned, the line keeps it through price changes."""
+        async with self._session() as session:
+            params = {
+                "deposit_id": deposit_id,
+                "product_id": product_id,
+                "deposit_line_datetime": datetime.now(timezone.utc),
+                "canceled": canceled,
+                "line_value": line_value,
+            }
+            res = (await session.execute(sql.INSERT_DEPOSIT_LINE, params)).fetchone()
             assert res is not None
             res = res._asdict()
-
-            session.commit()
+            if not canceled:
+                await self._update_deposit_totals(session, deposit_id, product_id, line_value, 1)
         return res
 
-    def cancel_returned_product(self, deposit_id: int, deposit_line_id:int) -> None:
-        with self.session_maker() as session:
-            stmt = (
-                update(Deposit_lines)
-                .values(canceled=True)
-                .where(Deposit_lines.c.deposit_id == deposit_id)
-                .where(Deposit_lines.c.deposit_line_id == deposit_line_id)
-            )
-            session.execute(stmt)
-            session.commit()
-
+    async def cancel_returned_product(self, deposit_id: int, deposit_line_id:int) -> None:
+        async with self._session() as session:
+            params = {"b_deposit_id": deposit_id, "b_deposit_line_id": deposit_line_id}
+            canceled = (await session.execute(sql.UPDATE_DEPOSIT_LINE_CANCELED, params)).fetchone()
+            if canceled is not None:
+                product_id, line_value = canceled
+                await self._update_deposit_totals(session, deposit_id, product_id, line_value, -1)
+
+    async def _update_deposit_totals(self, session, deposit_id: int, product_id: int, line_value: float, sign: int) -> None:
+        """add (sign=1) or remove (sign=-1) a line of `product_id` worth `line_value` from the deposit running totals."""
+        params = {"did": deposit_id, "pid": product_id, "value": line_value, "sign": sign}
+        await session.execute(sql.DEPOSIT_TOTALS, params)
+        await session.execute(sql.DEPOSIT_RETURN_TOTALS, params)
+
+    async def get_deposit_totals(self, deposit_id: int) -> dict[str, Any] | None:
+        """running totals of the non canceled lines: count & value, overall and per return type."""
+        async with self._session() as session:
+            totals = self._collect_one_record(await session.execute(sql.SELECT_DEPOSIT_TOTALS, {"deposit_id": deposit_id}))
+            if totals is None:
+                return None
+
+            res = await session.execute(sql.SELECT_DEPOSIT_RETURN_TOTALS, {"deposit_id": deposit_id})
+            totals["returns"] = self._collect_all_records(res)
+        return totals
+
+
+    # ARCHIVE
+    async def archive_deposits(self, settled_before: datetime, expired_before: datetime, batch: int = ARCHIVE_BATCH_SIZE) -> int:
+        """
+        move a batch of closed deposits, redeemed (at the pos) before `settled_before` or issued before `expired_before`,
+        with their lines to the archive tables. Their running totals per return type are dropped,
+        the deposit ones are archived with it. Return the number of archived deposits.
+        """
+        async with self._session() as session:
+            params = {"settled": settled_before, "expired": expired_before, "batch": batch}
+            settled = (await session.execute(sql.SETTLED_DEPOSITS, params)).fetchall()
+            if not settled:
+                return 0
+
+            ids = [r[0] for r in settled]
+            if self.dialect == "postgresql":
+                for m in sorted({r[1].astimezone(timezone.utc).strftime("%Y-%m") for r in settled}):
+                    await self._create_archive_partitions(session, m)
+
+            for stmt in sql.ARCHIVE_DEPOSITS[self.dialect]:
+                await session.execute(stmt, {"ids": ids})
+            for stmt in sql.DELETE_ARCHIVED:
+                await session.execute(stmt, {"ids": ids})
+        return len(ids)
+
+    async def _create_archive_partitions(self, session, month: str) -> None:
+        """monthly partitions of the postgresql archive tables, `month` as YYYY-MM"""
+        year, m = int(month[:4]), int(month[5:7])
+        begin = f"{year:04d}-{m:02d}-01"
+        end = f"{year + m // 12:04d}-{m % 12 + 1:02d}-01"
+        for table in ("deposits_archive", "deposit_lines_archive"):
+            await session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS main.{table}_{year:04d}_{m:02d} "
+                f"PARTITION OF main.{table} FOR VALUES FROM ('{begin}') TO ('{end}')"
+            ))
 
     # GLOBAL
-    def get_first_deposit_datetime(self) -> str | None:
-        with self.session_maker() as session:
-            stmt = (
-                select(Deposits)
-                .where(Deposits.c.deposit_id == 1)
-            )
-
-            res = session.execute(stmt)
-            deposit = self._collect_one_record(res)
-            if deposit is None:
-                return
-            return deposit.get("deposit_datetime")
-
-    def get_last_redeem_datetime(self) -> str | None:
-        with self.session_maker() as session:
-            stmt = (
-                select(Redeem)
-                .order_by(Redeem.c.redeem_id.desc())
-                .limit(1)
-            )
-
-            res = session.execute(stmt)
-            redeem = self._collect_one_record(res)
-            if redeem is None:
-                return
-            return redeem.get("redeem_datetime")
-
-    def get_tracked_consigne_barcodes_bases(self) -> list[str]:
-        with self.session_maker() as session:
-            stmt = (
-                select(Consigne.c.consigne_barcode_base)
-                .select_from(Consigne)
-            )
-
-            res = session.execute(stmt)
+    async def get_first_deposit_datetime(self) -> datetime | None:
+        """datetime of the first deposit, hot or archived. Each MIN is a single deposit_datetime index lookup."""
+        async with self._session() as session:
+            return (await session.execute(sql.FIRST_DEPOSIT_DATETIME[self.dialect])).scalar()
+
+    async def get_last_redeem_datetime(self) -> datetime | None:
+        """redeem analyzer window lower bound, a single redeem_datetime index lookup."""
+        async with self._session() as session:
+            return (await session.execute(sql.SELECT_LAST_REDEEM_DATETIME)).scalar()
+
+    async def get_tracked_consigne_barcodes_bases(self) -> list[str]:
+        async with self._session(replica=True) as session:
+            res = await session.execute(sql.SELECT_CONSIGNE_BARCODES_BASES)
             records = self._collect_all_records(res)
         bases = list(filter(None, [r.get("consigne_barcode_base") for r in records]))
         return bases
 
-    def get_deposit_data(self, deposit_id: int) -> dict[str,Any] | None:
-        with self.session_maker() as session:
-            stmt = (
-                select(Deposits)
-                .where(Deposits.c.deposit_id == deposit_id)
-            )
-
-
-            res = session.execute(stmt)
-            deposit = self._collect_one_record(res)
-            if deposit is None:
-                return deposit
-            
-            receiver_id = deposit.get("receiver_id")
-            provider_id = deposit.get("provider_id")
-
-            reciever_stmt = (
-                Select(Users)
-                .where(Users.c.user_id == receiver_id)
-            )
-            provider_stmt = (
-                Select(Users)
-                .where(Users.c.user_id == provider_id)
-            )
-
-            receiver = self._collect_one_record(session.execute(reciever_stmt))
-            provider = self._collect_one_record(session.execute(provider_stmt))
-
-            stmt = (    
-                select(Deposit_lines, Products, Product_returns)
-                .select_from(Deposit_lines)
-                .join(Products)
-                .join(Product_returns)
-                .where(Deposit_lines.c.deposit_id == deposit_id)
-            )
-
-            res = session.execute(stmt)
-            deposit_lines = self._collect_all_records(res)
-        return {
-            "deposit": deposit,
-            "provider": provider,
-            "receiver": receiver,
-            "deposit_lines": deposit_lines
-        }
-
-
-    def get_deposit_line_data(self, deposit_id: int, deposit_line_id: int) -> dict[str, Any] | None:
-        with self.session_maker() as session:
-            stmt = (
-                select(Deposit_lines)
-                .join(Products)
-                .join(Product_returns)
-                .where(Deposit_lines.c.deposit_id == deposit_id)
-                .where(Deposit_lines.c.deposit_line_id == deposit_line_id)
-            )
-            res = session.execute(stmt)
+    async def get_deposit_document(self, deposit_id: int) -> str | None:
+        """`get_deposit_data` payload as a json string, shaped by the database in a single statement."""
+        async with self._session() as session:
+            res = await session.execute(sql.DEPOSIT_DOCUMENT[self.dialect], {"deposit_id": deposit_id})
+        return res.scalar()
+
+    async def get_deposit_data(self, deposit_id: int) -> dict[str,Any] | None:
+        document = await self.get_deposit_document(deposit_id)
+        if document is None:
+            return None
+        return json.loads(document)
+
+    async def get_deposit_line_data(self, deposit_id: int, deposit_line_id: int) -> dict[str, Any] | None:
+        async with self._session() as session:
+            params = {"deposit_id": deposit_id, "deposit_line_id": deposit_line_id}
+            res = await session.execute(sql.SELECT_DEPOSIT_LINE, params)
         return self._collect_one_record(res)
 
-    def get_returns_per_types(self, deposit_id) -> list[tuple[str, int, float]]:
-        RETURNS_PER_PRODUCT_TYPE = """\
-            SELECT 
-                product_returns.product_return_name, 
-                COUNT(deposit_line_id), 
-                ROUND(CAST(SUM(product_returns.return_value) AS NUMERIC), 2)
-            FROM main.deposit_lines 
-            JOIN main.products ON main.deposit_lines.product_id=main.products.product_id 
-            JOIN main.product_returns ON main.products.product_return_id=main.product_returns.product_return_id 
-            WHERE 
-                deposit_id = :did
-                AND canceled = False 
-                AND main.product_returns.product_return_id != 1
-            GROUP BY products.product_return_id, product_returns.product_return_name;
-            """
-
-        with self.session_maker() as session:
-            res = session.execute(text(RETURNS_PER_PRODUCT_TYPE), {'did':deposit_id}).fetchall()
+    async def get_returns_per_types(self, deposit_id) -> list[tuple[str, int, float]]:
+        async with self._session() as session:
+            res = (await session.execute(sql.RETURNS_PER_PRODUCT_TYPE, {'did':deposit_id})).fetchall()
         types = [(pr, c, s) for pr,c,s in list(res)]
         return types
 
     # REDEEM
-    def match_redeem_deposits(self, barcode: str, partner_id: int, value: float) -> list[dict[str, Any]]: 
-        POS_REDEEM_MATCHING = """\
-            SELECT 
-                deposits.deposit_id
-            FROM main.deposits
-            JOIN main.deposit_lines ON main.deposit_lines.deposit_id=main.deposits.deposit_id
-            JOIN main.users ON main.users.user_id=deposits.receiver_id
-            JOIN main.products ON main.deposit_lines.product_id=main.products.product_id 
-            JOIN main.product_returns ON main.products.product_return_id=main.product_returns.product_return_id 
-            WHERE
-                deposits.deposit_barcode = :barcode
-                AND user_partner_id = :pid
-                AND deposits.redeemed IS NULL
-                AND deposits.closed = True
-            GROUP BY deposits.deposit_id
-            HAVING ROUND(CAST(SUM(product_returns.return_value) AS NUMERIC), 2) = :value
-            ORDER BY deposit_id;
-            """
-        with self.session_maker() as session:
-            res = session.execute(text(POS_REDEEM_MATCHING), {'pid':partner_id, "barcode": barcode, "value": value})
+    async def match_redeem_deposits(self, barcode: str, partner_id: int, value: float) -> list[dict[str, Any]]: 
+        async with self._session() as session:
+            res = await session.execute(sql.POS_REDEEM_MATCHING[self.dialect], {'pid':partner_id, "barcode": barcode, "value": value})
             res = self._collect_all_records(res)
         return res
 
-    def add_redeem(
+    async def match_redeem_lines(self, lines: list[tuple[str, int, float]]) -> list[list[int]]:
+        """
+        batch `match_redeem_deposits`: candidate deposit ids of every (barcode, partner_id, value) pos line, in order.
+        lines are passed as a VALUES list & matched against the running totals of the open deposits they refer to.
+        Served by a replica outside of a unit of work, candidates are then to be checked with `get_open_deposits`.
+        """
+        matches: list[list[int]] = [[] for _ in lines]
+        async with self._session(replica=True) as session:
+            for i in range(0, len(lines), UPSERT_CHUNK_SIZE):
+                chunk = lines[i:i + UPSERT_CHUNK_SIZE]
+                values, params = [], {}
+                for j, (barcode, partner_id, value) in enumerate(chunk):
+                    values.append(f"(CAST(:l{j} AS INTEGER), CAST(:b{j} AS TEXT), CAST(:p{j} AS INTEGER), CAST(:v{j} AS NUMERIC))")
+                    params.update({f"l{j}": i + j, f"b{j}": barcode, f"p{j}": partner_id, f"v{j}": value})
+
+                stmt = text(sql.POS_REDEEM_BATCH_MATCHING[self.dialect].format(values=", ".join(values)))
+                for line, deposit_id in (await session.execute(stmt, params)).fetchall():
+                    matches[line].append(deposit_id)
+        return matches
+
+    async def get_open_deposits(self, deposit_ids: list[int]) -> set[int]:
+        """`deposit_ids` not redeemed yet, hot or archived."""
+        if not deposit_ids:
+            return set()
+        async with self._session() as session:
+            res = (await session.execute(sql.OPEN_DEPOSITS[self.dialect], {"ids": deposit_ids})).fetchall()
+        return {r[0] for r in res}
+
+    async def add_redeems(self, redeems: list[dict[str, Any]]) -> list[int]:
+        """bulk `add_redeem`, return the redeem ids in `redeems` order."""
+        if not redeems:
+            return []
+        rows = [
+            {
+                "odoo_pos_id": r["order_id"],
+                "redeem_datetime": r["dt"],
+                "redeem_user": r["user_id"],
+                "redeem_value": r["value"],
+                "redeem_barcode": r["barcode"],
+                "anomaly": r["anomaly"],
+            }
+            for r in redeems
+        ]
+        async with self._session() as session:
+            res = await session.execute(sql.INSERT_REDEEMS, rows)
+            ids = [r[0] for r in res.fetchall()]
+        return ids
+
+    async def update_deposits_redeem(self, redeemed: list[tuple[int, int]]) -> None:
+        """bulk `update_deposit_redeem` of (deposit_id, redeem_id) pairs. Expired deposits are redeemed in the archive."""
+        if not redeemed:
+            return
+        params = [{"b_deposit_id": d, "b_redeem_id": r} for d, r in redeemed]
+        async with self._session() as session:
+            await session.execute(sql.UPDATE_DEPOSITS_REDEEM, params)
+            await session.execute(sql.ARCHIVED_DEPOSIT_REDEEM[self.dialect], params)
+
+    async def add_redeem(
         self, 
         order_id: int, 
         dt: datetime, 
@@ -450,85 +585,76 @@ class ConsigneDatabase:
         barcode: str, 
         anomaly: bool
     ) -> dict[str, Any]:
-        with self.session_maker() as session:
-            stmt = (
-                insert(Redeem)
-                .values(
-                    odoo_pos_id=order_id,
-                    redeem_datetime=dt,
-                    redeem_user=user_id,
-                    redeem_value=value,
-                    redeem_barcode=barcode,
-                    anomaly=anomaly,
-                )
-                .returning(Redeem.c.redeem_id)                
-            )
-            
-            res = session.execute(stmt).fetchone()
+        async with self._session() as session:
+            params = {
+                "odoo_pos_id": order_id,
+                "redeem_datetime": dt,
+                "redeem_user": user_id,
+                "redeem_value": value,
+                "redeem_barcode": barcode,
+                "anomaly": anomaly,
+            }
+            res = (await session.execute(sql.INSERT_REDEEM, params)).fetchone()
             assert res is not None
             res = res._asdict()
-            session.commit()
         return res
     
-    def _update_consigne_barcodes(self, records: list[tuple]) -> None:
-        with self.session_maker() as session:
-            stmt = (
-                select(Consigne.c.consigne_barcode_base)
-            )
-
-            bases = [r[0] for r in session.execute(stmt).fetchall()]
-            for base, barcode, name, sale_ok in records:
-                if base not in bases and sale_ok:
-                    stmt = (
-                        insert(Consigne)
-                        .values(
-                            consigne_name=name,
-                            consigne_barcode=barcode,
-                            consigne_barcode_base=base,
-                            consigne_active=True
-                        )
-                    )
-                    session.execute(stmt)
-                elif base in bases and sale_ok is False:
-                    stmt = (
-                        update(Consigne)
-                        .values(consigne_active=False)
-                        .where(Consigne.c.consigne_barcode_base == base)
-                    )
-                    session.execute(stmt)
-            session.commit()
-
-    def next_barcode_base(self) -> tuple[int, str | None]:
-        with self.session_maker() as session:
-            stmt = (
-                select(Deposits.c.deposit_barcode_base_id)
-                .where(Deposits.c.deposit_barcode_base_id != None)
-                .order_by(Deposits.c.deposit_id.desc())
-                .limit(1)
-            )
-            res = session.execute(stmt).fetchone() or (0,)
-            consigne_id = res[0]
-
-            base = None
-            base_id = consigne_id + 1
-            while base is None:
-                base = self._get_base(base_id)
-                if base is None and base_id == 1:
+    async def _update_consigne_barcodes(self, records: list[tuple]) -> None:
+        """
+        apply odoo consigne barcodes as a diff: new bases are inserted, known ones are
+        reactivated or deactivated following `sale_ok`, each set in a single statement.
+        """
+        async with self._session() as session:
+            known = {r[0]: bool(r[1]) for r in (await session.execute(sql.SELECT_CONSIGNE_STATES)).fetchall()}
+
+            on_sale = {base: (barcode, name) for base, barcode, name, sale_ok in records if sale_ok}
+            off_sale = {base for base, _, _, sale_ok in records if sale_ok is False}
+
+            new = [
+                {"consigne_name": name, "consigne_barcode": barcode, "consigne_barcode_base": base, "consigne_active": True}
+                for base, (barcode, name) in on_sale.items() if base not in known
+            ]
+            reactivated = [base for base in on_sale if base in known and not known[base]]
+            deactivated = [base for base in off_sale if known.get(base, False)]
+
+            if new:
+                await self._upsert(session, Consigne, new, ["consigne_barcode"])
+            for bases, active in ((reactivated, True), (deactivated, False)):
+                if not bases:
+                    continue
+                await session.execute(sql.UPDATE_CONSIGNE_ACTIVE, {"b_active": active, "b_bases": bases})
+
+            if new or reactivated or deactivated:
+                await self._bump_ring_version(session)
+
+    async def _bump_ring_version(self, session) -> None:
+        await session.execute(sql.UPDATE_RING_VERSION)
+
+    async def _load_bases_ring(self, session, version: int) -> None:
+        self._bases_ring = [(r[0], r[1]) for r in (await session.execute(sql.SELECT_BASES_RING)).fetchall()]
+        self._bases_version = version
+
+    async def next_barcode_base(self) -> tuple[int, str | None]:
+        """
+        next active consigne barcode base, in rotation.
+        The sequence row is incremented & wrapped over the ring of active bases in one statement,
+        so concurrent tickets from any worker get distinct positions. The ring is cached in memory
+        and reloaded whenever the ring version stored with the sequence changed.
+        """
+        async with self._session() as session:
+            if not self._bases_ring:
+                version = (await session.execute(sql.SELECT_RING_VERSION)).scalar()
+                await self._load_bases_ring(session, version or 0)
+            if not self._bases_ring:
+                raise ValueError("No consigne barcode found")
+
+            res = (await session.execute(sql.UPDATE_SEQUENCE_POSITION, {"b_ring_size": len(self._bases_ring)})).fetchone()
+            if res is None:
+                raise ValueError("Consigne sequence not found, schema migrations are not applied")
+
+            position, version = res
+            if version != self._bases_version:
+                await self._load_bases_ring(session, version)
+                if not self._bases_ring:
                     raise ValueError("No consigne barcode found")
-                elif base is None:
-                    base_id = 1
-        return (base_id, base)
-        
-
-    def _get_base(self, consigne_id: int) -> str | None:
-        with self.session_maker() as session:
-            stmt = (
-                select(Consigne.c.consigne_barcode_base)
-                .select_from(Consigne)
-                .where(Consigne.c.consigne_id == consigne_id)
-            )
-
-        res = session.execute(stmt).fetchone()
-        if res is not None:
-            return res[0]
-        return
\ No newline at end of file
+        return self._bases_ring[position % len(self._bases_ring)]
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+"""
+In memory partner directory, loaded from the local replica of odoo res.partner.
+Numeric searches are served from a sorted array of stringified barcode_base (prefix ranges).
+Text searches seed candidates from the most selective query token range of a sorted array of normalized name tokens,
+then filter candidates against the remaining query tokens.
+"""
+
+Partner = tuple[int, int | None, str] # (partner_id, barcode_base, display_name)
+
+FZ_LIMIT = 10
+TOKEN_SPLIT = re.compile(r"[^0-9a-z]+")
+PREFIX_END = "\uffff"
+
+
+def normalize(value: str) -> list[str]:
+    """lowercase, accents free, alphanumeric tokens of `value`"""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join([c for c in value if not unicodedata.combining(c)]).lower()
+    return [token for token in TOKEN_SPLIT.split(value) if token]
+
+
+class PartnerDirectory(object):
+    """
+    Immutable indexes are rebuilt on `load` and swapped in a single assignment,
+    so searches running in other threads always see a consistent snapshot.
+    """
+
+    def __init__(self) -> None:
+        self._index: tuple[list[Partner], list[tuple[str, int]], list[tuple[str, int]], list[list[str]]] = ([], [], [], [])
+
+    @property
+    def loaded(self) -> bool:
+        return len(self._index[0]) > 0
+
+    def __len__(self) -> int:
+        return len(self._index[0])
+
+    def load(self, partners: list[Partner]) -> None:
+        partners = sorted(partners, key=lambda p: p[2])
+        codes, tokens, partner_tokens = [], [], []
+        for i, (_, code, name) in enumerate(partners):
+            if code:
+                codes.append((str(code), i))
+            names = list(set(normalize(name)))
+            tokens.extend([(token, i) for token in names])
+            partner_tokens.append(names)
+        self._index = (partners, sorted(codes), sorted(tokens), partner_tokens)
+
+    def search(self, value: str, limit: int = FZ_LIMIT) -> list[Partner]:
+        if value.isnumeric():
+            return self.search_code(value, limit)
+        return self.search_name(value, limit)
+
+    def search_code(self, prefix: str, limit: int = FZ_LIMIT) -> list[Partner]:
+        """partners which barcode_base starts with `prefix`, exact matches first."""
+        partners, codes, _, _ = self._index
+        start, end = self._prefix_bounds(codes, prefix)
+        return [partners[i] for _, i in codes[start:min(end, start + limit)]]
+
+    def search_name(self, value: str, limit: int = FZ_LIMIT) -> list[Partner]:
+        """partners which name holds a token starting with each of the `value` tokens."""
+        partners, _, tokens, partner_tokens = self._index
+        query = normalize(value)
+        if not query:
+            return []
+
+        # seed from the narrowest token range, bounds are found in O(log n)
+        bounds = {token: self._prefix_bounds(tokens, token) for token in set(query)}
+        seed = min(bounds, key=lambda token: bounds[token][1] - bounds[token][0])
+        rest = [token for token in bounds if token != seed]
+        start, end = bounds[seed]
+
+        matches = []
+        for i in sorted({i for _, i in tokens[start:end]}):
+            if all(any(t.startswith(token) for t in partner_tokens[i]) for token in rest):
+                matches.append(partners[i])
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    @staticmethod
+    def _prefix_bounds(index: list[tuple[str, int]], prefix: str) -> tuple[int, int]:
+        """slice bounds of the keys starting with `prefix` in the sorted `index`"""
+        return (bisect_left(index, (prefix, -1)), bisect_right(index, (prefix + PREFIX_END, -1)))
@@ -1,27 +1,36 @@
 from __future__ import annotations
 
+import time
 import logging
 import asyncio
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 from dataclasses import dataclass, field
 from pymemcache.client.retrying import RetryingClient
 
-from typing import Any
+from typing import Any, Callable, TypeVar
 
 from src.exceptions import (
     SameUserError,
     AlreadyCLosedDepositPrintError,
     OdooError,
     ProductNotFound,
-    CoopNotFound
+    CoopNotFound,
+    OdooUnavailable
 )
 
-from src.odoo import OdooConnector, Zone
+from src.odoo import OdooConnector, OdooSession, Zone, RetryName, TRANSPORT_ERRORS, odoo_deadline
 from src.database import ConsigneDatabase
 from src.ticket import ConsignePrinter
-from src.cache import ConsigneCache, cached_products, cached_shifts, cached_users
+from src.executor import ConsigneExecutor
+from src.directory import PartnerDirectory
+from src.shifts import ShiftCalendar
+from src.cache import ConsigneCache, cached_products, cached_shifts, cached_users, cached_credentials
 from src.utils import generate_ean
 
+T = TypeVar("T")
+
+DIRECTORY_CURSOR_POLL = 5 # in seconds, how often non syncing workers check for a new directory sync
+
 tasks_logger = logging.getLogger("tasks")
 
 @dataclass(frozen=True)
@@ -29,6 +38,11 @@ class TaskConfigs:
     pooling: bool = field(default=False)
     frequency: int =  field(default=600)
 
+@dataclass(frozen=True)
+class ArchiveConfigs(TaskConfigs):
+    retention: int = field(default=30) # days a deposit stays in the hot tables once redeemed
+    expiry: int = field(default=365) # days after which a non redeemed deposit is archived anyway
+
 
 class ConsigneEngine(object):
     odoo: OdooConnector
@@ -36,6 +50,8 @@ class ConsigneEngine(object):
     printer: ConsignePrinter
     cache: ConsigneCache | RetryingClient | None
     tasks: dict[str,TaskConfigs]
+    executor: ConsigneExecutor
+    directory: PartnerDirectory
 
     def __init__(
         self, 
@@ -43,7 +59,8 @@ class ConsigneEngine(object):
         database: ConsigneDatabase, 
         printer: ConsignePrinter,
         cache: ConsigneCache | RetryingClient | None,
-        tasks: dict[str, TaskConfigs] | None = None
+        tasks: dict[str, TaskConfigs] | None = None,
+        executor: ConsigneExecutor | None = None
     ) -> None:
         self.odoo = odoo
         self.database = database
@@ -53,9 +70,69 @@ class ConsigneEngine(object):
         if tasks is None:
             tasks = {}
         self.tasks = tasks
-        # self.database.load_metadata(__name__)
 
-    def initialize_return(self, receiver_partner_id: int, provider_partner_id: int) -> int:
+        if executor is None:
+            executor = ConsigneExecutor()
+        self.executor = executor
+        self.directory = PartnerDirectory()
+        self.calendar = ShiftCalendar()
+
+    async def _odoo(self, f: Callable[..., T], *args: Any, retry: RetryName = "scan") -> T:
+        """
+        run `f(session, *args)` with a pooled odoo session, off the event loop.
+        Unavailability is retried with the `retry` policy backoff, sleeping on the event loop.
+        `scan` retries share the deadline of the current request, `tracker` ones get their own.
+        """
+        policy = getattr(self.odoo.retry, retry)
+        loop = asyncio.get_running_loop()
+        deadline = odoo_deadline.get() if retry == "scan" else None
+        if deadline is None:
+            deadline = loop.time() + policy.deadline
+            if retry == "scan":
+                odoo_deadline.set(deadline)
+
+        attempt = 1
+        while True:
+            try:
+                return await self._odoo_call(f, *args)
+            except OdooUnavailable:
+                # no point in retrying before the circuit lets a trial call through
+                delay = max(policy.backoff(attempt), self.odoo.breaker.retry_after())
+                if attempt >= policy.attempts or loop.time() + delay > deadline:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _odoo_call(self, f: Callable[..., T], *args: Any) -> T:
+        """
+        single attempt of `_odoo`.
+        Calls are rejected right away with OdooUnavailable while the circuit breaker is open.
+        A cancelled call (client disconnect, cancelled leader) says nothing about odoo health: it is not counted,
+        it only releases the half open trial, otherwise the circuit would never close again.
+        """
+        breaker = self.odoo.breaker
+        if not breaker.allow():
+            raise OdooUnavailable()
+
+        def call() -> T:
+            with self.odoo.make_session() as session:
+                return f(session, *args)
+
+        try:
+            res = await self.executor.run("odoo", call)
+        except TRANSPORT_ERRORS as e:
+            breaker.failure()
+            raise OdooUnavailable() from e
+        except Exception:
+            breaker.success() # odoo answered, even if with a fault
+            raise
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        breaker.success()
+        return res
+
+    async def initialize_return(self, receiver_partner_id: int, provider_partner_id: int) -> int:
         """
         for receiver & provider:
             1. fetch users in db
@@ -63,54 +140,72 @@ class ConsigneEngine(object):
             3. provide user_id (db users table pk)
         4. build db reference for the deposit
         Return deposit_id that is need by the front to further operate.
+        Unknown users are fetched from odoo beforehand, the database writes are then a single unit of work.
         """
         if receiver_partner_id == provider_partner_id:
             # FORBID OWN RETURNS
             raise SameUserError()
 
-        # search receiver user
-        receiver_user_id = self._get_or_set_user(receiver_partner_id)
-        self.database.update_activity(receiver_user_id, "receiver")
+        receiver_record = await self._fetch_missing_partner(receiver_partner_id)
+        provider_record = await self._fetch_missing_partner(provider_partner_id)
+        async with self.database.transaction():
+            # search receiver user
+            receiver_user_id = await self._get_or_set_user(receiver_partner_id, receiver_record)
+            await self.database.update_activity(receiver_user_id, "receiver")
 
-        # search provider user
-        provider_user_id = self._get_or_set_user(provider_partner_id)
-        self.database.update_activity(provider_user_id, "provider")
+            # search provider user
+            provider_user_id = await self._get_or_set_user(provider_partner_id, provider_record)
+            await self.database.update_activity(provider_user_id, "provider")
 
-        deposit = self.database.add_deposit(receiver_user_id, provider_user_id)
+            deposit = await self.database.add_deposit(receiver_user_id, provider_user_id)
         deposit_id = deposit.get("deposit_id", None)
         assert deposit is not None and isinstance(deposit_id, int)
         return deposit_id
     
     @cached_products
-    def fetch_product(self, deposit_id: int, barcode: str) -> tuple[bool, float, tuple, int]:
-        """search propduct in odoo database"""
-        with self.odoo.make_session() as session:
-            product = session.get_product_from_barcode(barcode)
-            if product is None:
-                raise ProductNotFound(barcode)
-            
-            product_data = session.product_to_record(product)
-            returnable, return_product = session.get_product_return(product)
-
-            return_product_id, return_value = 1, 0.0 # default value = non returnable, 0 return value
-            # -- GET RETURN PRODUCT
-            if returnable and return_product is not None:
-                opid, name, _, return_value = session.product_return_to_record(return_product)
-                db_product_return = self.database.get_return_product_from_opid(opid)
-
-                # -- ADD RETURN PRODUCT IF NOT REFERENCED IN THE DATABASE
-                if db_product_return is None:
-                    db_product_return = self.database.add_product_return(opid, name, returnable, return_value)
-
+    async def fetch_product(self, deposit_id: int, barcode: str) -> tuple[bool, float, tuple, int]:
+        """search product in the local catalog, fallback on odoo database for unknown barcodes"""
+        local = await self.database.get_catalog_product(barcode)
+        if local is not None and (local["returnable"] is False or local["product_return_id"] is not None):
+            product_data = (local["odoo_product_id"], local["product_name"], local["barcode"])
+            if local["returnable"] is False:
+                return (False, 0.0, product_data, 1)
+            return (True, local["return_value"] or 0.0, product_data, local["product_return_id"])
+
+        resolved = await self._odoo(OdooSession.resolve_product, barcode)
+        if resolved is None:
+            raise ProductNotFound(barcode)
+        product_data, returnable, return_opid = resolved
+
+        return_product_id, return_value = 1, 0.0 # default value = non returnable, 0 return value
+        # -- GET RETURN PRODUCT, kept up to date by the catalog sync once referenced
+        if returnable and return_opid is not None:
+            db_product_return = await self.database.get_return_product_from_opid(return_opid)
+
+            # -- ADD RETURN PRODUCT IF NOT REFERENCED IN THE DATABASE
+            if db_product_return is None:
+                return_product = await self._odoo(OdooSession.get_product_return_record, return_opid)
+                if return_product is None:
+                    raise OdooError(f"Return product not found: {return_opid}")
+                return_value = return_product[3]
+                return_product_id = (await self.database.upsert_product_returns([return_product]))[return_opid]
+            else:
+                return_value = db_product_return.get("return_value", None)
                 return_product_id = db_product_return.get("product_return_id", None)
-                assert return_product_id is not None
-            elif returnable and return_product is None:
-                raise OdooError(f"Returnable product without return_product: {barcode}")
-            
+            return_value = return_value or 0.0
+            assert return_product_id is not None
+        elif returnable and return_opid is None:
+            raise OdooError(f"Returnable product without return_product: {barcode}")
+
+        # -- MIRROR THE PRODUCT, write_date is left unset so the sync cursor is not moved.
+        opid, name, _ = product_data
+        await self.database.upsert_catalog_products(
+            [(opid, barcode, name, returnable, return_product_id if returnable else None, None)]
+        )
         return (returnable, return_value,  product_data, return_product_id)
                 
     
-    def return_product(self, deposit_id: int, barcode: str) -> dict[str, Any]:
+    async def return_product(self, deposit_id: int, barcode: str) -> dict[str, Any]:
         """
         1. search for product
         2. define returnability & product_return
@@ -118,19 +213,21 @@ class ConsigneEngine(object):
         4. return operation result:
             * success -> returned product data
             * failed -> Non returnable product message.
+        the product is resolved (& mirrored) beforehand, the deposit writes are then a single unit of work.
         """
-        returnable, return_value,  product_data, return_product_id = self.fetch_product(deposit_id, barcode)
-        # -- SEARCH PRODUCT REFERENCE 
+        returnable, return_value,  product_data, return_product_id = await self.fetch_product(deposit_id, barcode)
         opid, name, _ = product_data
-        db_product = self.database.get_product_from_opid(opid)
-        if db_product is None:
-            # CREATE PRODUCT REFERENCE
-            db_product = self.database.add_product(opid, name, barcode, return_product_id)
-        product_id = db_product.get("product_id", None)
-        assert product_id is not None
-
-        # -- CREATE DEPOSIT_LINE REFERENCE
-        deposit_line = self.database.add_deposit_line(deposit_id, product_id)
+        async with self.database.transaction():
+            # -- SEARCH PRODUCT REFERENCE 
+            db_product = await self.database.get_product_from_opid(opid)
+            if db_product is None:
+                # CREATE PRODUCT REFERENCE
+                db_product = await self.database.add_product(opid, name, barcode, return_product_id)
+            product_id = db_product.get("product_id", None)
+            assert product_id is not None
+
+            # -- CREATE DEPOSIT_LINE REFERENCE
+            deposit_line = await self.database.add_deposit_line(deposit_id, product_id, return_value)
         deposit_line_id = deposit_line.get("deposit_line_id")
         return {
             "deposit_line_id": deposit_line_id,
@@ -141,143 +238,197 @@ class ConsigneEngine(object):
             "return_value": return_value
         }
         
-    def cancel_deposit_line(self, deposit_id: int,  deposit_line_id: int) -> None:
-        self.database.cancel_returned_product(deposit_id, deposit_line_id)
+    async def cancel_deposit_line(self, deposit_id: int,  deposit_line_id: int) -> None:
+        await self.database.cancel_returned_product(deposit_id, deposit_line_id)
 
-    def get_deposit_data(self, deposit_id: int) -> dict[str, Any] | None:
-        return self.database.get_deposit_data(deposit_id)
+    async def get_deposit_data(self, deposit_id: int) -> dict[str, Any] | None:
+        return await self.database.get_deposit_data(deposit_id)
 
-    def get_deposit_line_data(self, deposit_id: int, deposit_line_id: int) -> dict[str, Any] | None:
-        return self.database.get_deposit_line_data(deposit_id, deposit_line_id)
+    async def get_deposit_document(self, deposit_id: int) -> str | None:
+        return await self.database.get_deposit_document(deposit_id)
 
-    def authenticate_provider(self, username: str, password: str) -> dict[str, Any]:
-        """"""
-        with self.odoo.make_session() as session:
-            auth, user = session.auth_provider(username, password)
-            if auth is False:
-                return {"auth": auth, "user": None}
-            assert user is not None
+    async def get_deposit_line_data(self, deposit_id: int, deposit_line_id: int) -> dict[str, Any] | None:
+        return await self.database.get_deposit_line_data(deposit_id, deposit_line_id)
 
-            oid, code, name = session.user_to_record(user)
-            end_shift_dist = session.get_current_shift_end_time_dist()
+    async def get_deposit_totals(self, deposit_id: int) -> dict[str, Any] | None:
+        return await self.database.get_deposit_totals(deposit_id)
 
-        db_user = self.database.get_user_from_code(code)
-        if db_user is None:
-            db_user = self.database.add_user(oid, code, name)
+    async def authenticate_provider(self, username: str, password: str) -> dict[str, Any]:
+        """"""
+        authenticated = await self._authenticate_odoo(username, password)
+        if authenticated is None:
+            return {"auth": False, "user": None}
+        (oid, code, name), end_shift_dist = authenticated
 
-        user_id = db_user.get('user_id', None)
-        assert user_id is not None
+        async with self.database.transaction():
+            db_user = await self.database.get_user_from_code(code)
+            if db_user is None:
+                db_user = await self.database.add_user(oid, code, name)
 
-        self.database.update_activity(user_id, "provider")
-        return {"auth": auth, "user": {"user_name": name, "user_code": code, "max_age":end_shift_dist}}
+            user_id = db_user.get('user_id', None)
+            assert user_id is not None
+
+            await self.database.update_activity(user_id, "provider")
+        return {"auth": True, "user": {"user_name": name, "user_code": code, "max_age":end_shift_dist}}
         
-    def generate_ticket(self, deposit_id: int) -> None:
+    @cached_credentials
+    async def _authenticate_odoo(self, username: str, password: str) -> tuple[tuple, int | None] | None:
+        if not self.calendar.loaded:
+            return await self._odoo(OdooSession.authenticate, username, password)
+
+        user = await self._odoo(OdooSession.authenticate_user, username, password)
+        if user is None:
+            return None
+        return (user, self.calendar.shift_end_dist(datetime.now()))
+
+    async def generate_ticket(self, deposit_id: int) -> None:
         """
         1. collect doposit & deposit_lines data
         2. build aggregated data for quantities and return values
         3. generate ticket
         4. return ticket in the printer accepted format
+        the ticket is printed once its barcode is committed.
         """
-        
-        deposit = self.database.get_deposit_data(deposit_id)
-        if deposit is None:
-            raise ValueError(f"unknown deposit_id: {deposit_id}")
+        async with self.database.transaction():
+            deposit = await self.database.get_deposit_data(deposit_id)
+            if deposit is None:
+                raise ValueError(f"unknown deposit_id: {deposit_id}")
 
-        if deposit.get("closed", False):
-            raise AlreadyCLosedDepositPrintError()
-
-        receiver_id = deposit["deposit"]["receiver_id"]
-        ean = deposit["deposit"].get("deposit_barcode", None)
-        
-        user = self.database.get_user_from_id(receiver_id)
-        if user is None:
-            raise ValueError(f"Unknown user id: {receiver_id}")
-        
-        user_code = user["user_code"]
-        user_name = user["user_name"]
-        receiver = {"user_code": user_code, "user_name": user_name}
-
-        returns_per_types = self.database.get_returns_per_types(deposit_id)
-        total_value = sum([r[2] for r in returns_per_types])
-
-        base_id, base = self.database.next_barcode_base()
-        if base is None:
-            raise ValueError("Next barcode base not found.")
-
-        ean = generate_ean(total_value, base)
-        self.database.update_deposit_barcode(deposit_id, ean, base_id)
+            if deposit["deposit"]["closed"]:
+                raise AlreadyCLosedDepositPrintError()
 
+            receiver_id = deposit["deposit"]["receiver_id"]
+            ean = deposit["deposit"].get("deposit_barcode", None)
+            
+            user = await self.database.get_user_from_id(receiver_id)
+            if user is None:
+                raise ValueError(f"Unknown user id: {receiver_id}")
+            
+            user_code = user["user_code"]
+            user_name = user["user_name"]
+            receiver = {"user_code": user_code, "user_name": user_name}
+
+            returns_per_types = await self.database.get_returns_per_types(deposit_id)
+            total_value = sum([r[2] for r in returns_per_types])
+
+            base_id, base = await self.database.next_barcode_base()
+            if base is None:
+                raise ValueError("Next barcode base not found.")
+
+            ean = generate_ean(total_value, base)
+            await self.database.update_deposit_barcode(deposit_id, ean, base_id)
+
+        await self.executor.run(
+            "printer",
+            self._print_ticket,
+            deposit_id=deposit_id,
+            **receiver,
+            returns_lines=returns_per_types,
+            total_value=total_value,
+            ean=ean
+        )
+
+    def _print_ticket(self, **ticket: Any) -> None:
         with self.printer.make_printer_session() as p:
-            p.print_ticket(
-                deposit_id=deposit_id,
-                **receiver,
-                returns_lines=returns_per_types,
-                total_value=total_value,
-                ean=ean
-            )
+            p.print_ticket(**ticket)
+
+    async def get_shifts_users(self) -> list[tuple[int, int, str]]:
+        """get current shift users. return list of barcodebase, display_name. Served from the shift calendar once loaded."""
+        if self.calendar.loaded:
+            _, members = self.calendar.current_members(datetime.now())
+            return members
+        return await self._get_odoo_shifts_users()
 
     @cached_shifts
-    def get_shifts_users(self) -> tuple[Zone, list[tuple[int, int, str]]]:
-        """get current shift users. return list of barcodebase, display_name"""
-        with self.odoo.make_session() as session:
-            res = session.get_current_shifts_members()
-        return res
+    async def _get_odoo_shifts_users(self) -> tuple[Zone, list[tuple[int, int, str]]]:
+        return await self._odoo(OdooSession.get_current_shifts_members)
+
+    async def search_user(self, value: str) -> list[tuple[int, int, str]]:
+        """fuzzy search for the user. Served from the in memory directory once loaded."""
+        if self.directory.loaded:
+            return self.directory.search(value) # pyright: ignore
+        return await self._search_odoo_user(value)
 
     @cached_users
-    def search_user(self, value: str) -> list[tuple[int, int, str]]:
-        """fuzzy search for the user."""
-        with self.odoo.make_session() as session:
-            res = session.fuzzy_user_search(value) # list user(id, code, name)
-        return res
+    async def _search_odoo_user(self, value: str) -> list[tuple[int, int, str]]:
+        return await self._odoo(OdooSession.fuzzy_user_search, value) # list user(id, code, name)
 
-    def close_deposit(self, deposit_id: int) -> None:
-        self.database.close_deposit(deposit_id)
+    async def close_deposit(self, deposit_id: int) -> None:
+        await self.database.close_deposit(deposit_id)
 
-    def redeem_analyzer(self) -> None:
+    async def redeem_analyzer(self) -> None:
         """
         TODO: analyzer configuration.
         TODO: define search frequency and span.
         """
 
-        before = datetime.now()
-        after = self.database.get_last_redeem_datetime() or self.database.get_first_deposit_datetime()
+        before = datetime.now(timezone.utc)
+        after = (
+            await self.database.get_last_redeem_datetime() 
+            or await self.database.get_first_deposit_datetime()
+        )
         if after is None:
             return
 
-        bases = self.database.get_tracked_consigne_barcodes_bases()
-        with self.odoo.make_session() as session:
-            records = session.get_redeemed_tickets(bases, before, datetime.fromisoformat(after))
-            for record in records:
-                
-                # GET USER & CREATE REFERENCE IF UNKNOWN
-                partner = record.order_id.partner_id # pyright: ignore
-                partner_db = self.database.get_user_from_code(partner.barcode_base)
+        bases = await self.database.get_tracked_consigne_barcodes_bases()
+        records = await self._odoo(
+            OdooSession.get_redeemed_tickets, bases, before, after, retry="tracker"
+        )
+        await self._apply_redeems(records)
+
+    async def _apply_redeems(self, records: list[tuple]) -> None:
+        """
+        match hydrated pos lines against deposits. Only hits the local database: the grouped matching
+        is a replica read, the redeems are then recorded on the primary in a single unit of work.
+        """
+        lines = []
+        for record in records:
+            if record[4] is None:
+                tasks_logger.warning(f"ANALYZER | pos order {record[0]} without partner, skipped.")
+                continue
+            lines.append(record)
+
+        # FIND ALL NON REDEEMED DEPOSITS WITH MATCHING RECEIVER__CODE & DEPOSIT_TOTAL_VALUE
+        matches = await self.database.match_redeem_lines([(barcode, partner[0], value) for _, _, value, barcode, partner in lines])
+        async with self.database.transaction():
+            await self._match_redeems(lines, matches)
+
+    async def _match_redeems(self, records: list[tuple], matches: list[list[int]]) -> None:
+        """
+        A line redeems a deposit when it is its only candidate still open on the primary,
+        deposits redeemed by a previous line of the run are not candidates anymore.
+        Other lines are recorded as anomalies (multiple matches or no match).
+        """
+        users: dict[int, int] = {}
+        lines = []
+        for pos_id, dt, value, barcode, partner in records:
+            # GET USER & CREATE REFERENCE IF UNKNOWN
+            partner_id, code, _ = partner
+            user_id = users.get(code, None)
+            if user_id is None:
+                partner_db = await self.database.get_user_from_code(code)
                 if partner_db is None:
-                    partner_payload = session.get_partner_record_from_id(partner.id)
-                    partner_db = self.database.add_user(*partner_payload) # use user_id for the redeem record
-
-                user_id = partner_db["user_id"]
-                pos_id, dt, value, barcode =  session.pos_order_line_to_record(record)
-                # FIND ALL NON REDEEMED DEPOSITS WITH MATCHING RECEIVER__CODE & DEPOSIT_TOTAL_VALUE
-                deposits = self.database.match_redeem_deposits(barcode, user_id, value)
-
-                if len(deposits) > 1:
-                    # multiple matches
-                    pos_dt = datetime.fromisoformat(dt)
-                    self.database.add_redeem(pos_id, pos_dt, user_id, value, barcode, True)
-
-                elif len(deposits) == 1:
-                    # match one 
-                    deposit = deposits[0]
-                    pos_dt = datetime.fromisoformat(dt)
-                    deposit_id = deposit["deposit_id"]
-                    redeem = self.database.add_redeem(pos_id, pos_dt, user_id, value, barcode, False)
-                    redeem_id = redeem["redeem_id"]
-                    self.database.update_deposit_redeem(deposit_id, redeem_id)
-                else:
-                    # No matchs
-                    pos_dt = datetime.fromisoformat(dt)
-                    self.database.add_redeem(pos_id, pos_dt, user_id, value, barcode, True)
+                    partner_db = await self.database.add_user(*partner) # use user_id for the redeem record
+                user_id = users[code] = partner_db["user_id"]
+            lines.append((pos_id, dt, value, barcode, user_id))
+
+        # candidates may come from a lagging replica
+        open_deposits = await self.database.get_open_deposits(list({d for deposit_ids in matches for d in deposit_ids}))
+
+        redeems, matched, redeemed = [], [], set()
+        for (pos_id, dt, value, barcode, user_id), deposit_ids in zip(lines, matches):
+            candidates = [d for d in deposit_ids if d in open_deposits and d not in redeemed]
+            anomaly = len(candidates) != 1
+            if not anomaly:
+                redeemed.add(candidates[0])
+                matched.append((len(redeems), candidates[0]))
+            redeems.append({
+                "order_id": pos_id, "dt": datetime.fromisoformat(dt).replace(tzinfo=timezone.utc), "user_id": user_id,
+                "value": value, "barcode": barcode, "anomaly": anomaly
+            })
+
+        redeem_ids = await self.database.add_redeems(redeems)
+        await self.database.update_deposits_redeem([(deposit_id, redeem_ids[i]) for i, deposit_id in matched])
 
     async def ticket_emissions_analyzer(self) -> None:
         settings = self.tasks.get("analyzer", None)
@@ -288,7 +439,7 @@ class ConsigneEngine(object):
         while True:
             tasks_logger.info(f"ANALYZER | Next process in {settings.frequency} secs")
             await asyncio.sleep(settings.frequency)
-            self.redeem_analyzer()
+            await self.redeem_analyzer()
 
     async def bases_tracker_runner(self) -> None:
         settings = self.tasks.get("tracking", None)
@@ -302,19 +453,169 @@ class ConsigneEngine(object):
             await self.bases_tracker()
 
     async def bases_tracker(self) -> None:
-        with self.odoo.make_session() as session:
-            existing = session.get_existing_consigne_barcodes()
-        self.database._update_consigne_barcodes(existing)
+        existing = await self._odoo(OdooSession.get_existing_consigne_barcodes, retry="tracker")
+        await self.database._update_consigne_barcodes(existing)
+
+    async def catalog_sync_runner(self) -> None:
+        settings = self.tasks.get("catalog", None)
+        if settings is None:
+            raise ValueError("catalog settings must be set to run the catalog synchronization")
+
+        tasks_logger.info("CATALOG | Thread starting...")
+        while True:
+            try:
+                await self.catalog_sync()
+            except Exception as e:
+                tasks_logger.error(f"CATALOG | Synchronization failed: {e}")
+            tasks_logger.info(f"CATALOG | Next process in {settings.frequency} secs")
+            await asyncio.sleep(settings.frequency)
+
+    async def catalog_sync(self) -> None:
+        """
+        pull product changes since the last mirrored write_date into the local catalog.
+        Return products are refreshed on every sync, the ones referenced by the local catalog included:
+        their name & value are served from the local rows and their changes don't move the products write_date.
+        """
+        since = await self.database.get_catalog_cursor()
+        products = await self._odoo(OdooSession.get_catalog_products, since, retry="tracker")
+
+        return_opids = list({p[4] for p in products if p[4] is not None} | set(await self.database.get_catalog_return_opids()))
+        known = {}
+        if return_opids:
+            return_records = await self._odoo(OdooSession.get_product_return_records, return_opids, retry="tracker")
+            known = await self.database.upsert_product_returns(return_records)
+        if not products:
+            return
+
+        records = [
+            (opid, barcode, name, returnable, known.get(return_opid) if returnable else None, write_date)
+            for opid, barcode, name, returnable, return_opid, write_date in products
+        ]
+        await self.database.upsert_catalog_products(records)
+        tasks_logger.info(f"CATALOG | {len(records)} products synchronized")
+
+    async def directory_sync_runner(self) -> None:
+        settings = self.tasks.get("directory", None)
+        if settings is None:
+            raise ValueError("directory settings must be set to run the directory synchronization")
+
+        tasks_logger.info("DIRECTORY | Thread starting...")
+        while True:
+            try:
+                await self.directory_sync()
+                await self.directory_refresh()
+            except Exception as e:
+                tasks_logger.error(f"DIRECTORY | Synchronization failed: {e}")
+            tasks_logger.info(f"DIRECTORY | Next process in {settings.frequency} secs")
+            await asyncio.sleep(settings.frequency)
+
+    async def directory_refresh_runner(self) -> None:
+        """
+        reload this worker in memory directory from the local replica.
+        The sync cursor is followed so that the directory is reloaded as soon as the syncing worker
+        has committed a sync (the boot one included), the periodic reload is kept as a fallback.
+        """
+        settings = self.tasks.get("directory", None)
+        if settings is None:
+            raise ValueError("directory settings must be set to run the directory refresh")
+
+        loaded_cursor, loaded_at = None, None
+        while True:
+            try:
+                cursor = await self.database.get_directory_cursor()
+                if loaded_at is None or cursor != loaded_cursor or time.monotonic() - loaded_at >= settings.frequency:
+                    await self.directory_refresh()
+                    loaded_cursor, loaded_at = cursor, time.monotonic()
+            except Exception as e:
+                tasks_logger.error(f"DIRECTORY | Refresh failed: {e}")
+            await asyncio.sleep(min(DIRECTORY_CURSOR_POLL, settings.frequency))
+
+    async def directory_sync(self) -> None:
+        """pull partner changes since the last mirrored write_date into the local directory."""
+        since = await self.database.get_directory_cursor()
+        partners = await self._odoo(OdooSession.get_directory_partners, since, retry="tracker")
+        if not partners:
+            return
+        await self.database.upsert_directory_partners(partners)
+        tasks_logger.info(f"DIRECTORY | {len(partners)} partners synchronized")
+
+    async def directory_refresh(self) -> None:
+        partners = await self.database.get_directory_partners()
+        await self.executor.run("database", self.directory.load, partners)
+
+    async def calendar_sync_runner(self) -> None:
+        """keep this worker shift calendar up to date. Whole days are loaded ahead, registration changes in between."""
+        settings = self.tasks.get("calendar", None)
+        if settings is None:
+            raise ValueError("calendar settings must be set to run the shift calendar synchronization")
 
-    def _get_or_set_user(self, partner_id: int) -> int:
-        user = self.database.get_user_from_partner_id(partner_id)
+        tasks_logger.info("CALENDAR | Thread starting...")
+        while True:
+            try:
+                await self.calendar_sync()
+            except Exception as e:
+                tasks_logger.error(f"CALENDAR | Synchronization failed: {e}")
+            await asyncio.sleep(settings.frequency)
+
+    async def calendar_sync(self, full: bool = False) -> None:
+        """load today's & tomorrow's shifts when the calendar is from a previous day (or `full`), otherwise pull registration changes."""
+        today = date.today()
+        if full or self.calendar.day != today:
+            shifts, registrations, members = await self._odoo(OdooSession.get_shift_calendar, today, retry="tracker")
+            self.calendar.load(today, shifts, registrations, members)
+            tasks_logger.info(f"CALENDAR | {len(shifts)} shifts & {len(registrations)} registrations loaded")
+            return
+
+        changed, current, members = await self._odoo(
+            OdooSession.get_registration_changes, 
+            self.calendar.shift_ids, 
+            self.calendar.cursor, 
+            set(self.calendar.members),
+            retry="tracker"
+        )
+        self.calendar.apply(changed, current, members)
+
+    async def archive_runner(self) -> None:
+        settings = self.tasks.get("archive", None)
+        if not isinstance(settings, ArchiveConfigs):
+            raise ValueError("archive settings must be set to run the deposits archival")
+
+        tasks_logger.info("ARCHIVE | Thread starting...")
+        while True:
+            try:
+                await self.archive_deposits(settings)
+            except Exception as e:
+                tasks_logger.error(f"ARCHIVE | Archival failed: {e}")
+            tasks_logger.info(f"ARCHIVE | Next process in {settings.frequency} secs")
+            await asyncio.sleep(settings.frequency)
+
+    async def archive_deposits(self, settings: ArchiveConfigs) -> None:
+        """move settled & expired deposits to the archive, batch by batch so that hot tables are only locked briefly."""
+        now = datetime.now(timezone.utc)
+        settled_before = now - timedelta(days=settings.retention)
+        expired_before = now - timedelta(days=settings.expiry)
+        archived = 0
+        while (moved := await self.database.archive_deposits(settled_before, expired_before)) > 0:
+            archived += moved
+        tasks_logger.info(f"ARCHIVE | {archived} deposits archived")
+
+    async def _fetch_missing_partner(self, partner_id: int) -> tuple | None:
+        """odoo record of a partner without local user, None when already known. Kept out of units of work."""
+        if await self.database.get_user_from_partner_id(partner_id) is not None:
+            return None
+        record = await self._odoo(OdooSession.get_partner_record_from_id, partner_id)
+        if record is None:
+            raise CoopNotFound()
+        return record
+
+    async def _get_or_set_user(self, partner_id: int, record: tuple | None) -> int:
+        """local user_id of `partner_id`, created from its prefetched odoo `record` when unknown."""
+        user = await self.database.get_user_from_partner_id(partner_id)
         if user is None:
             # create user when None
-            with self.odoo.make_session() as session:
-                user = session.get_partner_record_from_id(partner_id)
-            if user is None:
+            if record is None:
                 raise CoopNotFound()
-            res = self.database.add_user(*user)
+            res = await self.database.add_user(*record)
             user_id = res.get("user_id", None)  
         else:
             user_id = user.get("user_id", None)
@@ -35,6 +35,14 @@ class ProductNotFound(ConsigneException):
     def __init__(self, barcode: str) -> None:
         super().__init__(self.message.format(barcode=barcode))
 
+class OdooUnavailable(ConsigneException):
+    status_code: int = 503
+    internal_error_id: int = 5
+    message: str = "Odoo est momentanément indisponible, réessayez dans quelques instants."
+
+    def __init__(self) -> None:
+        super().__init__(self.message)
+
 class CoopNotFound(ConsigneException):
     status_code: int = 500
     internal_error_id: int = 4
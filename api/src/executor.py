@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+from functools import partial
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Any, Callable, Literal, TypeVar
+
+T = TypeVar("T")
+PoolName = Literal["odoo", "database", "printer", "auth"]
+
+
+@dataclass(frozen=True)
+class ExecutorConfigs:
+    odoo: int = field(default=4) # keep aligned with odoo.pool.size
+    database: int = field(default=2) # in memory indexes builds, database io itself is async
+    printer: int = field(default=1) # printers handle one job at a time
+    auth: int = field(default=2) # password hashing, pbkdf2 releases the GIL
+
+
+class ConsigneExecutor(object):
+    """
+    Per worker thread pools for the blocking layers: erppeek XML-RPC, escpos sockets, password hashing & in memory indexes builds.
+    Pools are created lazily so that no thread is started before the worker event loop runs.
+    """
+    configs: ExecutorConfigs
+
+    def __init__(self, configs: ExecutorConfigs | None = None) -> None:
+        if configs is None:
+            configs = ExecutorConfigs()
+        self.configs = configs
+        self._pools: dict[str, ThreadPoolExecutor] = {}
+
+    def pool(self, name: PoolName) -> ThreadPoolExecutor:
+        pool = self._pools.get(name, None)
+        if pool is None:
+            size = getattr(self.configs, name, None)
+            if size is None:
+                raise ValueError(f"Unknown executor pool: `{name}`")
+            pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"consigne-{name}")
+            self._pools[name] = pool
+        return pool
+
+    async def run(self, name: PoolName, f: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        run the blocking callable `f` in the `name` pool and await its result.
+        the caller context is propagated, so request scoped context variables are visible from the thread.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.pool(name), partial(context.run, f, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True) -> None:
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+        self._pools.clear()
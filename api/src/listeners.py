@@ -31,6 +31,52 @@ async def start_barcode_tracking(app: Sanic):
         app.shared_ctx.tracker.put(1)
         app.add_task(engine.bases_tracker_runner) # pyright: ignore
 
+async def start_catalog_sync(app: Sanic):
+    engine: ConsigneEngine = app.ctx.engine
+    
+    settings = engine.tasks.get("catalog", None)
+    if settings is None or settings.pooling is False:
+        return
+
+    if app.shared_ctx.catalog.qsize() == 0:
+        app.shared_ctx.catalog.put(1)
+        app.add_task(engine.catalog_sync_runner) # pyright: ignore
+
+async def start_directory_sync(app: Sanic):
+    engine: ConsigneEngine = app.ctx.engine
+    
+    settings = engine.tasks.get("directory", None)
+    if settings is None or settings.pooling is False:
+        return
+
+    if app.shared_ctx.directory.qsize() == 0:
+        app.shared_ctx.directory.put(1)
+        app.add_task(engine.directory_sync_runner) # pyright: ignore
+    else:
+        # every other worker keeps its own in memory directory up to date, following the sync cursor
+        app.add_task(engine.directory_refresh_runner) # pyright: ignore
+
+async def start_calendar_sync(app: Sanic):
+    engine: ConsigneEngine = app.ctx.engine
+    
+    settings = engine.tasks.get("calendar", None)
+    if settings is None or settings.pooling is False:
+        return
+
+    # every worker computes shifts members & zones from its own in memory calendar
+    app.add_task(engine.calendar_sync_runner) # pyright: ignore
+
+async def start_archiving(app: Sanic):
+    engine: ConsigneEngine = app.ctx.engine
+    
+    settings = engine.tasks.get("archive", None)
+    if settings is None or settings.pooling is False:
+        return
+
+    if app.shared_ctx.archive.qsize() == 0:
+        app.shared_ctx.archive.put(1)
+        app.add_task(engine.archive_runner) # pyright: ignore
+
 async def initialize_barcode_bases(app:Sanic):
     engine: ConsigneEngine = app.ctx.engine
     
@@ -39,7 +85,19 @@ async def initialize_barcode_bases(app:Sanic):
         app.add_task(engine.bases_tracker())
 
 
+async def shutdown_executor(app: Sanic):
+    engine: ConsigneEngine = app.ctx.engine
+    engine.executor.shutdown(wait=False)
+
+async def close_database(app: Sanic):
+    engine: ConsigneEngine = app.ctx.engine
+    await engine.database.dispose()
+
+
 async def thread_state_manager(app: Sanic):
     app.shared_ctx.analyzer = multiprocessing.Queue()
     app.shared_ctx.base_init = multiprocessing.Queue()
     app.shared_ctx.tracker = multiprocessing.Queue()
+    app.shared_ctx.catalog = multiprocessing.Queue()
+    app.shared_ctx.directory = multiprocessing.Queue()
+    app.shared_ctx.archive = multiprocessing.Queue()
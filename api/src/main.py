@@ -9,15 +9,28 @@ from pymemcache.exceptions import MemcacheUnexpectedCloseError
 
 from typing import Any
 
-from src.odoo import OdooConnector
+from src.odoo import OdooConnector, PoolConfigs, BreakerConfigs, RetryConfigs, RetryPolicy
 from src.database import ConsigneDatabase
 from src.cache import ConsigneCache
-from src.engine import ConsigneEngine, TaskConfigs
+from src.engine import ConsigneEngine, TaskConfigs, ArchiveConfigs
 from src.ticket import ConsignePrinter
+from src.executor import ConsigneExecutor, ExecutorConfigs
 from src.loaders import ConfigLoader
+from src.utils import json_dumps
 from src.routes import consigneBp
 from src.middlewares import error_handler, go_fast, log_exit
-from src.listeners import start_redeem_analizer, start_barcode_tracking, initialize_barcode_bases, thread_state_manager
+from src.listeners import (
+    start_redeem_analizer, 
+    start_barcode_tracking, 
+    start_catalog_sync,
+    start_directory_sync,
+    start_calendar_sync,
+    start_archiving,
+    initialize_barcode_bases, 
+    thread_state_manager, 
+    shutdown_executor,
+    close_database
+)
 
 StrOrPath = str | Path
 
@@ -42,12 +55,13 @@ class Consigne:
         printer: dict[str, Any],
         tasks: dict[str, Any] | None = None, 
         caching: dict[str, Any] | None = None,
+        executor: dict[str, Any] | None = None,
         logging: dict[str, Any] | None = None,
         options: dict[str, Any] | None = None,
         env: str= "development",
     ) -> Sanic:
         
-        app = Sanic("consigne", log_config=cls.setup_logging_configs(logging))
+        app = Sanic("consigne", log_config=cls.setup_logging_configs(logging), dumps=json_dumps)
         static = sanic.get("static", None)
         if static is None:
             raise KeyError("Missing `static` field in sanic configs.")
@@ -80,10 +94,16 @@ class Consigne:
             )
         else:
             cache = None
-        connector = OdooConnector(**erp)
+        connector = OdooConnector(
+            **erp, 
+            pool=cls.parse_pool_settings(odoo.get("pool", None)),
+            breaker=cls.parse_breaker_settings(odoo.get("breaker", None)),
+            retry=cls.parse_retry_settings(odoo.get("retry", None))
+        )
         consigne_database = ConsigneDatabase(**database)
         consigne_printer = ConsignePrinter.from_configs(**printer)
-        engine = ConsigneEngine(connector, consigne_database, consigne_printer, cache, tasks_settings)
+        consigne_executor = ConsigneExecutor(cls.parse_executor_settings(executor))
+        engine = ConsigneEngine(connector, consigne_database, consigne_printer, cache, tasks_settings, consigne_executor)
 
         app.ctx.engine = engine
         consigne = cls(app, engine, env)
@@ -91,7 +111,13 @@ class Consigne:
         app.register_listener(thread_state_manager, "main_process_start")
         app.register_listener(initialize_barcode_bases, "before_server_start")
         app.register_listener(start_barcode_tracking, "before_server_start")
+        app.register_listener(start_catalog_sync, "before_server_start")
+        app.register_listener(start_directory_sync, "before_server_start")
+        app.register_listener(start_calendar_sync, "before_server_start")
+        app.register_listener(start_archiving, "before_server_start")
         # app.register_listener(start_redeem_analizer, "before_server_start")
+        app.register_listener(shutdown_executor, "after_server_stop")
+        app.register_listener(close_database, "after_server_stop")
         return consigne.app
 
     @classmethod
@@ -127,8 +153,33 @@ class Consigne:
     def parse_tasks_settings(tasks: dict[str, Any] | None = None) -> dict[str, TaskConfigs]:
         if tasks is None:
             return {}
-        return {k:TaskConfigs(**v) for k,v in tasks.items()}
+        configs = {"archive": ArchiveConfigs}
+        return {k:configs.get(k, TaskConfigs)(**v) for k,v in tasks.items()}
     
+    @staticmethod
+    def parse_pool_settings(pool: dict[str, Any] | None = None) -> PoolConfigs:
+        if pool is None:
+            return PoolConfigs()
+        return PoolConfigs(**pool)
+
+    @staticmethod
+    def parse_breaker_settings(breaker: dict[str, Any] | None = None) -> BreakerConfigs:
+        if breaker is None:
+            return BreakerConfigs()
+        return BreakerConfigs(**breaker)
+
+    @staticmethod
+    def parse_retry_settings(retry: dict[str, Any] | None = None) -> RetryConfigs:
+        if retry is None:
+            return RetryConfigs()
+        return RetryConfigs(**{site: RetryPolicy(**policy) for site, policy in retry.items()})
+
+    @staticmethod
+    def parse_executor_settings(executor: dict[str, Any] | None = None) -> ExecutorConfigs:
+        if executor is None:
+            return ExecutorConfigs()
+        return ExecutorConfigs(**executor)
+
     @staticmethod
     def reformat_caching_configs(caching: dict[str, Any]) -> dict[str, Any]:
         caching.update({"servers": [(s["host"], s["port"]) for s in caching["servers"]]})
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from typing import Any
+
+"""
+Odoo RPC accounting.
+Each RPC is recorded twice:
+    * in the `RpcStats` of the current request (if any), bound through the `rpc_stats` context variable.
+    * in the worker wide `RPC_METRICS` latency histograms, aggregated per model & method.
+"""
+
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0] # in seconds, upper bounds
+
+
+@dataclass
+class RpcStats:
+    """RPC made on behalf of a single request"""
+    calls: dict[tuple[str, str], list[float]] = field(default_factory=lambda: defaultdict(list))
+
+    def record(self, model: str, method: str, duration: float) -> None:
+        self.calls[(model, method)].append(duration)
+
+    @property
+    def count(self) -> int:
+        return sum([len(durations) for durations in self.calls.values()])
+
+    @property
+    def duration(self) -> float:
+        return sum([sum(durations) for durations in self.calls.values()])
+
+    def render(self) -> str:
+        details = ", ".join([
+            f"{model}.{method} x{len(durations)} {round(sum(durations), 5)}s"
+            for (model, method), durations in self.calls.items()
+        ])
+        return f"rpc: {self.count} calls {round(self.duration, 5)}s" + (f" ({details})" if details else "")
+
+
+class LatencyHistogram(object):
+    def __init__(self, buckets: list[float] = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, duration: float) -> None:
+        self.counts[bisect_left(self.buckets, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def as_dict(self) -> dict[str, Any]:
+        bounds = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.total, 5),
+            "mean": round(self.total / self.count, 5) if self.count else None,
+            "max": round(self.max, 5),
+            "buckets": dict(zip(bounds, self.counts)),
+        }
+
+
+class RpcMetrics(object):
+    """worker wide RPC latency histograms per model & method"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms: dict[str, dict[str, LatencyHistogram]] = defaultdict(dict)
+
+    def observe(self, model: str, method: str, duration: float) -> None:
+        with self._lock:
+            histogram = self._histograms[model].get(method, None)
+            if histogram is None:
+                histogram = self._histograms[model][method] = LatencyHistogram()
+            histogram.observe(duration)
+
+    def snapshot(self, model: str | None = None) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {
+                m: {method: h.as_dict() for method, h in methods.items()}
+                for m, methods in self._histograms.items()
+                if model is None or m == model
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+RPC_METRICS = RpcMetrics()
+rpc_stats: ContextVar[RpcStats | None] = ContextVar("rpc_stats", default=None)
+
+
+def record_rpc(model: str, method: str, duration: float) -> None:
+    RPC_METRICS.observe(model, method, duration)
+    stats = rpc_stats.get()
+    if stats is not None:
+        stats.record(model, method, duration)
@@ -8,6 +8,10 @@ from sanic.response import HTTPResponse, json
 
 from typing import Any
 
+from src.metrics import RpcStats, rpc_stats
+from src.cache import stale_reads
+from src.odoo import odoo_deadline
+
 logger = logging.getLogger("endpointAccess")
 
 async def error_handler(request: Request, exception: Exception):
@@ -25,6 +29,11 @@ async def error_handler(request: Request, exception: Exception):
 
 async def go_fast(request: Request) -> None:
     request.ctx.t = perf_counter()
+    request.ctx.rpc = RpcStats()
+    rpc_stats.set(request.ctx.rpc)
+    request.ctx.stale = []
+    stale_reads.set(request.ctx.stale)
+    odoo_deadline.set(None) # odoo retry budget starts with the request first call
 
 async def log_exit(request: Request, response: HTTPResponse) -> None:
     perf = None # for some unknown reasons perf middleware get skipped for some requests. thus need to check if t is stored.
@@ -35,9 +44,17 @@ async def log_exit(request: Request, response: HTTPResponse) -> None:
     if response.body is not None:
         size = len(response.body)
 
+    rpc = getattr(request.ctx, "rpc", None)
+    stale = getattr(request.ctx, "stale", None)
+    if stale:
+        # served from cache while odoo is unavailable
+        response.headers["X-Consigne-Stale"] = ",".join(stale)
+
     if response.status == 200:
         logger.info(
             f"{request.host} > {request.method} {request.url} [{request.load_json()}][{str(response.status)}][{str(size)}b][{perf}s]"
+            + (f"[{rpc.render()}]" if rpc is not None else "")
+            + (f"[stale: {','.join(stale)}]" if stale else "")
         )
 
 
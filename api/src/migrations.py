@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from dataclasses import dataclass, field
+from sqlalchemy import Connection, Engine, String, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from typing import Any, Literal
+
+"""
+Versioned schema migrations, applied on top of `Base.metadata.create_all`.
+create_all only creates missing tables, migrations evolve the existing ones (indexes, columns, data).
+Applied versions are recorded in main.schema_migrations.
+
+Each migration runs in its own transaction, starting with the insertion of its version row:
+when several workers boot at once, the first one applies the migration while the others
+wait on the row lock, then skip it on the primary key conflict.
+"""
+
+Dialect = Literal["postgresql", "sqlite"]
+
+# settled deposits are moved to main.*_archive monthly partitions on postgresql, to an attached database on sqlite
+ARCHIVE_SCHEMAS: dict[Dialect, str] = {"postgresql": "main", "sqlite": "archive"}
+
+tasks_logger = logging.getLogger("tasks")
+
+SCHEMA_MIGRATIONS = """\
+CREATE TABLE IF NOT EXISTS main.schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+)"""
+
+SEED_CONSIGNE_SEQUENCE = """\
+INSERT INTO main.consigne_sequence (sequence_id, sequence_position, ring_version)
+SELECT 1, COUNT(*) - 1, 0
+FROM main.consigne
+WHERE consigne_active AND consigne_id <= COALESCE((
+    SELECT deposit_barcode_base_id
+    FROM main.deposits
+    WHERE deposit_barcode_base_id IS NOT NULL
+    ORDER BY deposit_id DESC
+    LIMIT 1
+), 0)"""
+
+# running totals of the non canceled lines, maintained by `ConsigneDatabase.add_deposit_line` & `cancel_returned_product`
+DEPOSIT_TOTALS_BACKFILL = [
+    """\
+UPDATE main.deposits SET
+    deposit_lines_count = (
+        SELECT COUNT(*)
+        FROM main.deposit_lines
+        WHERE deposit_lines.deposit_id = deposits.deposit_id AND canceled = False
+    ),
+    deposit_value = (
+        SELECT COALESCE(SUM(product_returns.return_value), 0)
+        FROM main.deposit_lines
+        JOIN main.products ON products.product_id = deposit_lines.product_id
+        JOIN main.product_returns ON product_returns.product_return_id = products.product_return_id
+        WHERE deposit_lines.deposit_id = deposits.deposit_id AND canceled = False
+    )""",
+    """\
+INSERT INTO main.deposit_return_totals (deposit_id, product_return_id, returns_count, returns_value)
+SELECT deposit_lines.deposit_id, products.product_return_id, COUNT(*), COALESCE(SUM(product_returns.return_value), 0)
+FROM main.deposit_lines
+JOIN main.products ON products.product_id = deposit_lines.product_id
+JOIN main.product_returns ON product_returns.product_return_id = products.product_return_id
+WHERE canceled = False
+GROUP BY deposit_lines.deposit_id, products.product_return_id""",
+]
+
+# lines scanned before `deposit_lines.line_value` existed take the current value of their return type
+DEPOSIT_LINE_VALUES_BACKFILL = """\
+UPDATE {schema}.{table} SET line_value = COALESCE((
+    SELECT product_returns.return_value
+    FROM main.products
+    JOIN main.product_returns ON product_returns.product_return_id = products.product_return_id
+    WHERE products.product_id = {table}.product_id
+), 0)"""
+
+# settled deposits & their lines, moved out of the hot tables by `ConsigneDatabase.archive_deposits`.
+# postgresql partitions them by deposit month, sqlite keeps them in the attached archive database.
+DEPOSITS_ARCHIVE = """\
+CREATE TABLE IF NOT EXISTS {schema}.deposits_archive (
+    deposit_id INTEGER NOT NULL,
+    receiver_id INTEGER NOT NULL,
+    provider_id INTEGER NOT NULL,
+    deposit_datetime TEXT NOT NULL,
+    closed BOOL NOT NULL,
+    deposit_barcode TEXT,
+    deposit_barcode_base_id INTEGER,
+    redeemed INTEGER,
+    deposit_lines_count INTEGER NOT NULL,
+    deposit_value REAL NOT NULL{month},
+    PRIMARY KEY ({key})
+)"""
+
+DEPOSIT_LINES_ARCHIVE = """\
+CREATE TABLE IF NOT EXISTS {schema}.deposit_lines_archive (
+    deposit_line_id INTEGER NOT NULL,
+    deposit_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    deposit_line_datetime TEXT NOT NULL,
+    canceled BOOL NOT NULL{month},
+    PRIMARY KEY ({key})
+)"""
+
+
+def create_index(dialect: Dialect, name: str, table: str, columns: str, where: str | None = None) -> str:
+    """sqlite prefixes the index name with the schema, postgresql the table."""
+    if dialect == "sqlite":
+        stmt = f"CREATE INDEX IF NOT EXISTS main.{name} ON {table}({columns})"
+    else:
+        stmt = f"CREATE INDEX IF NOT EXISTS {name} ON main.{table}({columns})"
+    if where is not None:
+        stmt += f" WHERE {where}"
+    return stmt
+
+def drop_index(name: str) -> str:
+    return f"DROP INDEX IF EXISTS main.{name}"
+
+def table_columns(connection: Connection, table: str, schema: str = "main") -> dict[str, Any]:
+    """column name -> reflected type"""
+    return {c["name"]: c["type"] for c in inspect(connection).get_columns(table, schema=schema)}
+
+def to_timestamp(dialect: Dialect, schema: str, table: str, column: str, utc: bool) -> str:
+    """
+    ISO text values (`YYYY-MM-DD-HH:MM:SS.ffffff` or `YYYY-MM-DD HH:MM:SS`) to timestamps.
+    Naive local times unless `utc`: postgresql reads them in the session time zone, sqlite in the process one.
+    sqlite keeps its text storage, values are rewritten in the `src.schema.Timestamp` UTC format.
+    """
+    value = f"SUBSTR({column}, 1, 10) || ' ' || SUBSTR({column}, 12)"
+    if dialect == "postgresql":
+        using = f"CAST({value} AS TIMESTAMP) AT TIME ZONE 'UTC'" if utc else f"CAST(CAST({value} AS TIMESTAMP) AS TIMESTAMPTZ)"
+        return f"ALTER TABLE {schema}.{table} ALTER COLUMN {column} TYPE TIMESTAMPTZ USING {using}"
+    modifier = "" if utc else ", 'utc'"
+    seconds = f"STRFTIME('%Y-%m-%d %H:%M:%S', SUBSTR({column}, 1, 10) || ' ' || SUBSTR({column}, 12, 8){modifier})"
+    return f"UPDATE {schema}.{table} SET {column} = {seconds} || '.' || SUBSTR(SUBSTR({column}, 21) || '000000', 1, 6) WHERE {column} IS NOT NULL"
+
+def to_text(dialect: Dialect, schema: str, table: str, column: str, utc: bool) -> str:
+    """revert `to_timestamp`, local values back to `YYYY-MM-DD-HH:MM:SS.ffffff`, utc ones to `YYYY-MM-DD HH:MM:SS`."""
+    if dialect == "postgresql":
+        using = (
+            f"TO_CHAR({column} AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')" if utc
+            else f"TO_CHAR({column}, 'YYYY-MM-DD-HH24:MI:SS.US')"
+        )
+        return f"ALTER TABLE {schema}.{table} ALTER COLUMN {column} TYPE TEXT USING {using}"
+    value = f"SUBSTR({column}, 1, 19)" if utc else f"STRFTIME('%Y-%m-%d-%H:%M:%S', SUBSTR({column}, 1, 19), 'localtime') || SUBSTR({column}, 20)"
+    return f"UPDATE {schema}.{table} SET {column} = {value} WHERE {column} IS NOT NULL"
+
+
+@dataclass(frozen=True)
+class Index:
+    name: str
+    table: str
+    columns: str
+    where: str | None = field(default=None)
+
+
+@dataclass(frozen=True)
+class AddColumn:
+    """column added to an existing table. Skipped when already there, tables created after the model carry it."""
+    table: str
+    name: str
+    definition: str
+
+
+@dataclass(frozen=True)
+class TimestampColumn:
+    """
+    ISO text column converted to a timezone aware timestamp, see `to_timestamp`.
+    postgresql columns already typed by the model are skipped, sqlite ones are always rewritten.
+    """
+    table: str
+    name: str
+    utc: bool = False # odoo datetimes are naive UTC, the api ones naive local time
+    archive: bool = False
+
+    def schema(self, dialect: Dialect) -> str:
+        return ARCHIVE_SCHEMAS[dialect] if self.archive else "main"
+
+    def is_text(self, connection: Connection, dialect: Dialect) -> bool:
+        return isinstance(table_columns(connection, self.table, self.schema(dialect))[self.name], String)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    columns: list[AddColumn] = field(default_factory=list)
+    timestamps: list[TimestampColumn] = field(default_factory=list)
+    indexes: list[Index] = field(default_factory=list)
+    up: dict[Dialect, list[str]] = field(default_factory=dict) # statements run after the columns & indexes creation
+    down: dict[Dialect, list[str]] = field(default_factory=dict) # statements run before the columns & indexes removal
+
+    def upgrade(self, connection: Connection, dialect: Dialect) -> None:
+        for c in self.columns:
+            if c.name not in table_columns(connection, c.table):
+                connection.execute(text(f"ALTER TABLE main.{c.table} ADD COLUMN {c.name} {c.definition}"))
+        for t in self.timestamps:
+            if dialect == "sqlite" or t.is_text(connection, dialect):
+                connection.execute(text(to_timestamp(dialect, t.schema(dialect), t.table, t.name, t.utc)))
+        for i in self.indexes:
+            connection.execute(text(create_index(dialect, i.name, i.table, i.columns, i.where)))
+        for stmt in self.up.get(dialect, []):
+            connection.execute(text(stmt))
+
+    def downgrade(self, connection: Connection, dialect: Dialect) -> None:
+        for stmt in self.down.get(dialect, []):
+            connection.execute(text(stmt))
+        for i in self.indexes:
+            connection.execute(text(drop_index(i.name)))
+        for t in self.timestamps:
+            if dialect == "sqlite" or not t.is_text(connection, dialect):
+                connection.execute(text(to_text(dialect, t.schema(dialect), t.table, t.name, t.utc)))
+        for c in self.columns:
+            if c.name in table_columns(connection, c.table):
+                connection.execute(text(f"ALTER TABLE main.{c.table} DROP COLUMN {c.name}"))
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(
+        version=1,
+        name="hot path indexes",
+        indexes=[
+            # get_returns_per_types, get_deposit_data & get_deposit_line_data
+            Index("idx_deposit_lines_deposit_id", "deposit_lines", "deposit_id"),
+            # match_redeem_deposits
+            Index("idx_deposits_barcode", "deposits", "deposit_barcode"),
+            Index("idx_deposits_redeem_state", "deposits", "redeemed, closed"),
+            # next_barcode_base: last deposit holding a barcode base
+            Index("idx_deposits_barcode_base", "deposits", "deposit_id, deposit_barcode_base_id", "deposit_barcode_base_id IS NOT NULL"),
+            # redeem analyzer window
+            Index("idx_redeem_datetime", "redeem", "redeem_datetime"),
+        ]
+    ),
+    Migration(
+        version=2,
+        name="consigne barcode base sequence",
+        # the rotation resumes after the base of the last printed deposit
+        up={dialect: [SEED_CONSIGNE_SEQUENCE] for dialect in ("postgresql", "sqlite")},
+        down={dialect: ["DELETE FROM main.consigne_sequence"] for dialect in ("postgresql", "sqlite")},
+    ),
+    Migration(
+        version=3,
+        name="deposit totals",
+        columns=[
+            AddColumn("deposits", "deposit_lines_count", "INTEGER NOT NULL DEFAULT 0"),
+            AddColumn("deposits", "deposit_value", "REAL NOT NULL DEFAULT 0"),
+        ],
+        up={dialect: DEPOSIT_TOTALS_BACKFILL for dialect in ("postgresql", "sqlite")},
+        down={dialect: ["DELETE FROM main.deposit_return_totals"] for dialect in ("postgresql", "sqlite")},
+    ),
+    Migration(
+        version=4,
+        name="deposits archive",
+        up={
+            "postgresql": [
+                DEPOSITS_ARCHIVE.format(schema="main", month=",\n    deposit_month DATE NOT NULL", key="deposit_month, deposit_id")
+                + " PARTITION BY RANGE (deposit_month)",
+                DEPOSIT_LINES_ARCHIVE.format(schema="main", month=",\n    deposit_month DATE NOT NULL", key="deposit_month, deposit_line_id")
+                + " PARTITION BY RANGE (deposit_month)",
+                "CREATE INDEX IF NOT EXISTS idx_deposits_archive_id ON main.deposits_archive(deposit_id)",
+                "CREATE INDEX IF NOT EXISTS idx_deposits_archive_open ON main.deposits_archive(deposit_barcode) WHERE redeemed IS NULL",
+                "CREATE INDEX IF NOT EXISTS idx_deposit_lines_archive_deposit_id ON main.deposit_lines_archive(deposit_id)",
+            ],
+            "sqlite": [
+                DEPOSITS_ARCHIVE.format(schema="archive", month="", key="deposit_id"),
+                DEPOSIT_LINES_ARCHIVE.format(schema="archive", month="", key="deposit_line_id"),
+                "CREATE INDEX IF NOT EXISTS archive.idx_deposits_archive_open ON deposits_archive(deposit_barcode) WHERE redeemed IS NULL",
+                "CREATE INDEX IF NOT EXISTS archive.idx_deposit_lines_archive_deposit_id ON deposit_lines_archive(deposit_id)",
+            ],
+        },
+        down={
+            "postgresql": ["DROP TABLE IF EXISTS main.deposit_lines_archive", "DROP TABLE IF EXISTS main.deposits_archive"],
+            "sqlite": ["DROP TABLE IF EXISTS archive.deposit_lines_archive", "DROP TABLE IF EXISTS archive.deposits_archive"],
+        },
+    ),
+    Migration(
+        version=5,
+        name="timestamp columns",
+        timestamps=[
+            TimestampColumn("users", "last_provider_activity"),
+            TimestampColumn("users", "last_receiver_activity"),
+            TimestampColumn("redeem", "redeem_datetime", utc=True),
+            TimestampColumn("deposits", "deposit_datetime"),
+            TimestampColumn("deposit_lines", "deposit_line_datetime"),
+            TimestampColumn("deposits_archive", "deposit_datetime", archive=True),
+            TimestampColumn("deposit_lines_archive", "deposit_line_datetime", archive=True),
+        ],
+        indexes=[
+            # archive_deposits windows & get_first_deposit_datetime
+            Index("idx_deposits_datetime", "deposits", "deposit_datetime"),
+        ],
+        up={
+            "postgresql": ["CREATE INDEX IF NOT EXISTS idx_deposits_archive_datetime ON main.deposits_archive(deposit_datetime)"],
+            "sqlite": ["CREATE INDEX IF NOT EXISTS archive.idx_deposits_archive_datetime ON deposits_archive(deposit_datetime)"],
+        },
+        down={
+            "postgresql": ["DROP INDEX IF EXISTS main.idx_deposits_archive_datetime"],
+            "sqlite": ["DROP INDEX IF EXISTS archive.idx_deposits_archive_datetime"],
+        },
+    ),
+    Migration(
+        version=6,
+        name="deposit line values",
+        columns=[
+            AddColumn("deposit_lines", "line_value", "REAL NOT NULL DEFAULT 0"),
+        ],
+        up={
+            dialect: [
+                f"ALTER TABLE {ARCHIVE_SCHEMAS[dialect]}.deposit_lines_archive ADD COLUMN line_value REAL NOT NULL DEFAULT 0",
+                DEPOSIT_LINE_VALUES_BACKFILL.format(schema="main", table="deposit_lines"),
+                DEPOSIT_LINE_VALUES_BACKFILL.format(schema=ARCHIVE_SCHEMAS[dialect], table="deposit_lines_archive"),
+            ]
+            for dialect in ("postgresql", "sqlite")
+        },
+        down={
+            dialect: [f"ALTER TABLE {ARCHIVE_SCHEMAS[dialect]}.deposit_lines_archive DROP COLUMN line_value"]
+            for dialect in ("postgresql", "sqlite")
+        },
+    ),
+]
+
+
+def applied_versions(connection: Connection) -> set[int]:
+    connection.execute(text(SCHEMA_MIGRATIONS))
+    return {r[0] for r in connection.execute(text("SELECT version FROM main.schema_migrations"))}
+
+def migrate(engine: Engine, dialect: Dialect, target: int | None = None) -> list[int]:
+    """apply pending migrations up to `target` (latest by default). return the applied versions."""
+    try:
+        with engine.begin() as connection:
+            done = applied_versions(connection)
+    except IntegrityError:
+        # versions table concurrently created by another worker
+        with engine.begin() as connection:
+            done = applied_versions(connection)
+
+    applied = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version in done or (target is not None and migration.version > target):
+            continue
+        try:
+            with engine.begin() as connection:
+                connection.execute(
+                    text("INSERT INTO main.schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": migration.version, "n": migration.name, "t": datetime.now().isoformat(" ")}
+                )
+                migration.upgrade(connection, dialect)
+        except IntegrityError:
+            continue # applied by another worker meanwhile
+        tasks_logger.info(f"MIGRATIONS | {migration.version} {migration.name} applied")
+        applied.append(migration.version)
+    return applied
+
+def rollback(engine: Engine, dialect: Dialect, target: int = 0) -> list[int]:
+    """revert applied migrations above `target`, latest first. return the reverted versions."""
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+
+    reverted = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version, reverse=True):
+        if migration.version not in done or migration.version <= target:
+            continue
+        with engine.begin() as connection:
+            migration.downgrade(connection, dialect)
+            connection.execute(text("DELETE FROM main.schema_migrations WHERE version = :v"), {"v": migration.version})
+        reverted.append(migration.version)
+    return reverted
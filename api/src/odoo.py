@@ -2,26 +2,78 @@ from __future__ import annotations
 
 import os
 import time
+import random
+import threading
+from collections import deque
 from contextlib import ContextDecorator
-from datetime import datetime, timedelta
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
 from functools import wraps, lru_cache
-from http.client import CannotSendRequest
+from http.client import CannotSendRequest, HTTPException
+from xmlrpc.client import Transport, SafeTransport, ProtocolError
+from time import perf_counter
 from erppeek import Client, Record, RecordList, Model
 
-from typing import Callable, Any
+from typing import Callable, Any, Literal
+
+from src.metrics import record_rpc
 
 # pyright: reportAttributeAccessIssue=false
 # pyright: reportFunctionMemberAccess=false
 
 Conditions = list[tuple[str, str, Any]]
 Zone = tuple[datetime | None, datetime | None]
+Shifts = list[dict[str, Any]]
+RetryName = Literal["scan", "tracker"]
 
 
 FZ_LIMIT = 10
+PRODUCT_FIELDS = ["id", "name", "barcode", "returnable", "return_product_id"]
+SHIFT_FIELDS = ["id", "date_begin_tz", "date_end_tz"]
+MEMBER_FIELDS = ["id", "barcode_base", "display_name"]
+POS_LINE_FIELDS = ["id", "order_id", "create_date", "price_unit", "product_id"]
+DIRECTORY_FIELDS = ["id", "barcode_base", "display_name", "cooperative_state", "write_date"]
+CATALOG_FIELDS = ["id", "name", "barcode", "returnable", "return_product_id", "product_tmpl_id", "write_date"]
+CALENDAR_SHIFT_FIELDS = ["id", "date_begin_tz", "date_end_tz", "shift_type_id"]
+REGISTRATION_FIELDS = ["id", "shift_id", "partner_id", "write_date"]
 SHIFT_DT_TOLERANCE = 5
 SHIFT_LEN = timedelta(hours=2, minutes=45)
 
-def resilient(degree: int = 3):
+def shift_zone(shifts: Shifts) -> Zone:
+    """validity window of the current shifts members list"""
+    SHIFT_WINDOW_FLOOR = int(os.environ.get("SHIFT_WINDOW_FLOOR", 15))
+    SHIFT_WINDOW_CEILING = int(os.environ.get("SHIFT_WINDOW_CEILING", 15) )
+    debut, end = None, None
+
+    if len(shifts) == 1:
+        shift = shifts[0]
+        dt_begin = shift["date_begin_tz"]
+        dt_end = shift["date_end_tz"]
+        assert isinstance(dt_begin, str) and isinstance(dt_end, str)
+        debut = datetime.fromisoformat(dt_begin) + timedelta(minutes=SHIFT_WINDOW_FLOOR)
+        end = datetime.fromisoformat(dt_end) - timedelta(minutes=SHIFT_WINDOW_CEILING) 
+
+    elif len(shifts) == 2:
+        first_shift, second_shift = shifts[0], shifts[1]
+        dt_begin = second_shift["date_begin_tz"]
+        dt_end = first_shift["date_end_tz"]
+        assert isinstance(dt_begin, str) and isinstance(dt_end, str)
+        debut = datetime.fromisoformat(dt_begin) - timedelta(minutes=SHIFT_WINDOW_FLOOR)
+        end = datetime.fromisoformat(dt_end) + timedelta(minutes=SHIFT_WINDOW_CEILING) 
+
+    return (debut, end)
+
+def odoo_datetime(dt: datetime) -> datetime:
+    """odoo stores naive UTC datetimes, aware ones are converted before being compared in a domain"""
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def resilient(degree: int = 1):
+    """
+    renew the session and replay `f` when its connection went stale, up to `degree` times.
+    Replays are immediate, backoff between attempts is left to the async callers.
+    """
     def decorator(f: Callable):
         @wraps(f)
         def wrapper(*args, **kwargs):
@@ -40,97 +92,397 @@ def resilient(degree: int = 3):
     return decorator
 
 
+# transport level failures, as opposed to odoo faults which prove the server is up.
+TRANSPORT_ERRORS = (ConnectionError, OSError, HTTPException, ProtocolError)
+
+
+class _TimeoutMixin:
+    timeout: float
+
+    def make_connection(self, host):
+        connection = super().make_connection(host) # pyright: ignore
+        connection.timeout = self.timeout
+        return connection
+
+class TimeoutTransport(_TimeoutMixin, Transport):
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+
+class SafeTimeoutTransport(_TimeoutMixin, SafeTransport):
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+
+
+@dataclass(frozen=True)
+class BreakerConfigs:
+    failures: int = field(default=5) # consecutive transport failures before opening the circuit
+    reset_timeout: int = field(default=30) # in seconds, open duration before a trial call is let through
+    timeout: int = field(default=10) # in seconds, socket timeout of every odoo call
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int = field(default=2) # total attempts, first call included
+    base_delay: float = field(default=0.1) # in seconds, doubled at every attempt
+    max_delay: float = field(default=0.5) # in seconds
+    deadline: float = field(default=3) # in seconds, total budget of the retried calls
+
+    def backoff(self, attempt: int) -> float:
+        """full jitter exponential backoff before the `attempt`th retry (1 based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+@dataclass(frozen=True)
+class RetryConfigs:
+    scan: RetryPolicy = field(default_factory=RetryPolicy) # request path, a cashier is waiting
+    tracker: RetryPolicy = field(
+        default_factory=lambda: RetryPolicy(attempts=6, base_delay=1, max_delay=30, deadline=120)
+    ) # background tasks
+
+
+# absolute (monotonic) deadline of the odoo calls made on behalf of the current request.
+odoo_deadline: ContextVar[float | None] = ContextVar("odoo_deadline", default=None)
+
+
+class CircuitBreaker(object):
+    """
+    closed: calls go through, consecutive failures are counted.
+    open: calls are rejected right away, until `reset_timeout` elapsed.
+    half_open: a single trial call goes through, its outcome closes or re-opens the circuit.
+    Only used from the event loop.
+    """
+    configs: BreakerConfigs
+
+    def __init__(self, configs: BreakerConfigs):
+        self.configs = configs
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.configs.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and self._trial is False:
+            self._trial = True
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        """seconds before the circuit lets a trial call through, 0 when not open"""
+        if self.state != "open":
+            return 0
+        return self.configs.reset_timeout - (time.monotonic() - self.opened_at)
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def release(self) -> None:
+        """give the half open trial back without outcome, the next call becomes the trial"""
+        self._trial = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._trial = False
+        if self.opened_at is not None or self.failures >= self.configs.failures:
+            self.opened_at = time.monotonic()
+
+
+class InstrumentedClient(Client):
+    """erppeek client recording every authenticated RPC (model, method, duration), lazy record reads included."""
+
+    def login(self, user, password=None, database=None):
+        uid = super().login(user, password=password, database=database)
+        execute = self._execute
+
+        def instrumented(obj, method, *params):
+            t = perf_counter()
+            try:
+                return execute(obj, method, *params)
+            finally:
+                record_rpc(obj, method, perf_counter() - t)
+
+        self._execute = instrumented
+        return uid
+
+    def authenticate(self, database: str, user: str, password: str) -> int | bool:
+        """check credentials without logging this client in. return the uid, False when refused."""
+        t = perf_counter()
+        try:
+            uid, _ = self._auth(database, user, password)
+        finally:
+            record_rpc("common", "login", perf_counter() - t)
+        return uid
+
+
+@dataclass(frozen=True)
+class PoolConfigs:
+    size: int = field(default=4)
+    idle_timeout: int = field(default=900) # in seconds, idle sessions older than this are dropped
+    health_check: int = field(default=60) # in seconds, idle sessions older than this are pinged on checkout
+
+
+class SessionPool(object):
+    """Bounded pool of authenticated odoo sessions.
+    Sessions are reused LIFO so the most recently used (warmest) connection is handed first.
+    """
+    connector: OdooConnector
+    configs: PoolConfigs
+
+    def __init__(self, connector: OdooConnector, configs: PoolConfigs):
+        self.connector = connector
+        self.configs = configs
+        self._idle: deque[tuple[OdooSession, float]] = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(configs.size)
+
+    def acquire(self) -> OdooSession:
+        self._slots.acquire()
+        try:
+            session = self._checkout()
+            if session is None:
+                client = self.connector.login()
+                session = OdooSession(client, pool=self)
+        except BaseException:
+            self._slots.release()
+            raise
+        return session
+
+    def release(self, session: OdooSession) -> None:
+        with self._lock:
+            self._idle.append((session, time.monotonic()))
+        self._slots.release()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._idle.clear()
+
+    def _checkout(self) -> OdooSession | None:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                session, last_used = self._idle.pop()
+            idle = time.monotonic() - last_used
+            if idle > self.configs.idle_timeout:
+                continue
+            if idle > self.configs.health_check and not session.ping():
+                continue
+            return session
+
+
 class OdooConnector(object):
     """Odoo connection handler & session factory"""
     host: str
     database: str
     verbose: bool
-
-    def __init__(self, host: str, database: str, verbose: bool = False, **kwargs):
+    pool: SessionPool
+    breaker: CircuitBreaker
+    retry: RetryConfigs
+
+    def __init__(
+        self, 
+        host: str, 
+        database: str, 
+        verbose: bool = False, 
+        pool: PoolConfigs | None = None, 
+        breaker: BreakerConfigs | None = None,
+        retry: RetryConfigs | None = None,
+        **kwargs
+    ):
         self.host = host
         self.database = database
         self.verbose = verbose
+        self.pool = SessionPool(self, pool or PoolConfigs())
+        self.breaker = CircuitBreaker(breaker or BreakerConfigs())
+        self.retry = retry or RetryConfigs()
 
-    def make_session(self, max_retries: int = 5, retries_interval: int = 5) -> OdooSession:
+    def transport(self) -> Transport:
+        """a new transport per client, persistent connections can't be shared across threads"""
+        if self.host.startswith("https"):
+            return SafeTimeoutTransport(self.breaker.configs.timeout)
+        return TimeoutTransport(self.breaker.configs.timeout)
+
+    def make_session(self) -> OdooSession:
+        """checkout an authenticated session from the pool. The session is handed back on context exit."""
+        return self.pool.acquire()
+
+    def client(self) -> InstrumentedClient:
+        """unauthenticated client, bound to the calls timeout"""
+        return InstrumentedClient(self.host, transport=self.transport(), verbose=self.verbose)
+
+    def login(self) -> Client:
+        """
+        single login attempt. Retries are left to the async callers (see `RetryPolicy`),
+        so that waiting never holds a thread nor the event loop.
+        """
         username = os.environ.get("ERP_USERNAME", None)
         password = os.environ.get("ERP_PASSWORD", None)
         if not all([username, password]):
             raise ValueError("ERP_USERNAME and/or ERP_PASSWORD ENV variables not found")
         
-        success, tries = False, 0
-        while (success is False and tries <= max_retries):
-            try:
-                client = Client(self.host, verbose=self.verbose)
-                client.login(username, password=password, database=self.database)
-                success = True
-                return OdooSession(client)
-            except Exception:
-                time.sleep(retries_interval)
-                tries += 1
-        raise ConnectionError("Unable to generate an Odoo Session")
+        try:
+            client = self.client()
+            client.login(username, password=password, database=self.database)
+        except TRANSPORT_ERRORS as e:
+            raise ConnectionError("Unable to generate an Odoo Session") from e
+        return client
         
 
 class OdooSession(ContextDecorator):
     client: Client
+    pool: SessionPool | None
 
-    def __init__(self, client: Client):
+    def __init__(self, client: Client, pool: SessionPool | None = None):
         self.client = client
+        self.pool = pool
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc, exc_tb):
-        del self
-
-    @resilient(degree=3)
+        if self.pool is not None:
+            self.pool.release(self)
+
+    def ping(self) -> bool:
+        """cheap unauthenticated call, checks the underlying transport is still usable."""
+        try:
+            self.client.common.version()
+            return True
+        except Exception:
+            return False
+
+    @resilient(degree=1)
     def get(self, model: str, conditions: Conditions) -> Record | None:
         return self.client.model(model).get(conditions)
 
-    @resilient(degree=3)
+    @resilient(degree=1)
     def browse(self, model: str, conditions: Conditions) -> Record | RecordList:
         return self.client.model(model).browse(conditions)
 
+    @resilient(degree=1)
+    def search_read(self, model: str, conditions: Conditions, fields: list[str], limit: int = 0) -> list[dict[str, Any]]:
+        """projected search in a single round trip. `limit` 0 means no limit."""
+        return self.client.execute(model, "search_read", conditions, fields, 0, limit)
+
+    @resilient(degree=1)
+    def read(self, model: str, ids: list[int], fields: list[str]) -> list[dict[str, Any]]:
+        """projected read of known ids in a single round trip."""
+        if not ids:
+            return []
+        return self.client.execute(model, "read", ids, fields)
+
     def renew_session(self) -> None:
+        if self.pool is not None:
+            self.client = self.pool.connector.login()
+            return
+
         username = os.environ.get("ERP_USERNAME", None)
         password = os.environ.get("ERP_PASSWORD", None)
         if not all([username, password]):
             raise ValueError("ERP_USERNAME or ERP_PASSWORD env variables not found")
-        client = Client(self.client._server, verbose=False)
+        client = InstrumentedClient(self.client._server, verbose=False)
         client.login(username, password=password, database=self.client._db)
         self.client = client
 
     def get_product_from_barcode(self, barcode: str) -> Record | None:
         return self.get("product.product", [("barcode", "=", barcode)])
 
-    def get_product_return(self, product: Record) -> tuple[bool, Record | None]:
+    def resolve_product(self, barcode: str) -> tuple[tuple, bool, int | None] | None:
+        """
+        single round trip resolution of a scanned barcode.
+        template fields are delegated to product.product, thus readable from the variant.
+        return a tuple describing
+            the product record (id, name, barcode),
+            the returnability of the product (bool)
+            and the odoo id of its associated return product.
+        None when no product matches the barcode.
+        """
+        products = self.search_read("product.product", [("barcode", "=", barcode)], PRODUCT_FIELDS, limit=1)
+        if not products:
+            return None
+        product = products[0]
+        return_product = product["return_product_id"] # many2one are read as [id, display_name] or False
+        return_product_id = return_product[0] if return_product else None
+        return ((product["id"], product["name"], product["barcode"]), bool(product["returnable"]), return_product_id)
+
+    def get_product_return_record(self, product_return_id: int) -> tuple | None:
+        records = self.get_product_return_records([product_return_id])
+        if not records:
+            return None
+        return records[0]
+
+    def get_product_return_records(self, product_return_ids: list[int]) -> list[tuple]:
+        products = self.read("product.product", product_return_ids, ["id", "name", "returnable", "list_price"])
+        return [(p["id"], p["name"], bool(p["returnable"]), p["list_price"]) for p in products]
+
+    def get_catalog_products(self, since: str | None = None) -> list[tuple]:
         """
-        takes a product.product record as argument.
-        return a tuple describing both 
-        returnability of the product (bool) 
-        and the it's associated return_product (Record of product.product)
+        returnable products to mirror locally.
+        Without `since`, every returnable product is pulled.
+        With `since`, every product with a barcode whose variant or template changed after `since` is pulled,
+        so that products leaving the returnables are updated as well.
+        return list of (id, barcode, name, returnable, return_product_id, write_date)
         """
-        tmpl = product.product_tmpl_id
-        return (tmpl.returnable, tmpl.return_product_id or None)
+        if since is None:
+            domain = [("returnable", "=", True), ("barcode", "!=", False)]
+        else:
+            domain = ["|", ("write_date", ">", since), ("product_tmpl_id.write_date", ">", since), ("barcode", "!=", False)]
+        products = self.search_read("product.product", domain, CATALOG_FIELDS)
 
-    def product_to_record(self, product: Record) -> tuple:
-        tmpl = product.product_tmpl_id
-        return (product.id, tmpl.name, product.barcode)
+        tmpl_ids = list({p["product_tmpl_id"][0] for p in products if p["product_tmpl_id"]})
+        templates = {t["id"]: t["write_date"] for t in self.read("product.template", tmpl_ids, ["write_date"])}
 
-    def product_return_to_record(self, product_return: Record) -> tuple:
-        tmpl = product_return.product_tmpl_id
-        return (product_return.id, tmpl.name, True, tmpl.list_price)
+        records = []
+        for p in products:
+            # template changes (returnable, return_product_id) don't touch the variant write_date.
+            tmpl_write_date = templates.get(p["product_tmpl_id"][0], None) if p["product_tmpl_id"] else None
+            write_date = max(filter(None, [p["write_date"], tmpl_write_date]), default=None)
+            return_product_id = p["return_product_id"][0] if p["return_product_id"] else None
+            records.append((p["id"], p["barcode"], p["name"], bool(p["returnable"]), return_product_id, write_date))
+        return records
 
     def auth_provider(self, username: str, password: str) -> tuple[bool, Record|None]:
-        c = Client(self.client._server, verbose=False)
-        auth = c._auth(self.client._db, username, password)
-        if auth[0] is False:
+        if self.pool is not None:
+            c = self.pool.connector.client()
+        else:
+            c = InstrumentedClient(self.client._server, verbose=False)
+        uid = c.authenticate(self.client._db, username, password)
+        if not uid:
             return (False, None)
-        user = self.get("res.users", [("id", "=", auth[0])])
+        user = self.get("res.users", [("id", "=", uid)])
         return (True, user)
 
     def user_to_record(self, user: Record) -> tuple:
         partner = user.partner_id
         return (partner.id, partner.barcode_base, partner.name)
+
+    def authenticate(self, username: str, password: str) -> tuple[tuple, int | None] | None:
+        """return authenticated user record & current shift end distance. None when auth failed."""
+        user = self.authenticate_user(username, password)
+        if user is None:
+            return None
+        return (user, self.get_current_shift_end_time_dist())
+
+    def authenticate_user(self, username: str, password: str) -> tuple | None:
+        """return authenticated user record. None when auth failed."""
+        auth, user = self.auth_provider(username, password)
+        if auth is False:
+            return None
+        assert user is not None
+        return self.user_to_record(user)
     
     def get_partner_record_from_code(self, code: int) -> list[tuple]:
         partners = self.browse("res.partner", [("barcode_base", "=", code), ("cooperative_state", "!=", "unsubscribed")])
@@ -167,6 +519,23 @@ class OdooSession(ContextDecorator):
         res = self.browse("res.partner", [("name", "ilike", name), ("cooperative_state", "!=", "unsubscribed")])
         return [(r.id, r.barcode_base, r.display_name) for r in res[:FZ_LIMIT]]
 
+    def get_directory_partners(self, since: str | None = None) -> list[tuple]:
+        """
+        partners to replicate locally.
+        Without `since`, every non unsubscribed partner is pulled.
+        With `since`, every partner changed after `since` is pulled, so that unsubscriptions are replicated.
+        return list of (id, barcode_base, display_name, cooperative_state, write_date)
+        """
+        if since is None:
+            domain = [("cooperative_state", "!=", "unsubscribed")]
+        else:
+            domain = [("write_date", ">", since)]
+        partners = self.search_read("res.partner", domain, DIRECTORY_FIELDS)
+        return [
+            (p["id"], p["barcode_base"] or None, p["display_name"], p["cooperative_state"] or None, p["write_date"]) 
+            for p in partners
+        ]
+
     def get_current_shift_end_time_dist(self) -> int|None:
         """return dist from current shift end time in seconds"""
         dt_day = datetime.now().replace(hour=0)
@@ -179,12 +548,43 @@ class OdooSession(ContextDecorator):
             dist = None
         return dist
 
-    def get_redeemed_tickets(self, bases: list[str], before: datetime, after: datetime) -> list[Record]:
-        """research specific barcodes in pos.order_lines before and after certain dates. return matched records"""
-        return self.browse("pos.order.line", [("product_id.barcode_base", "in", bases), ("create_date", ">=", after), ("create_date", "<", before)])
-        
-    def pos_order_line_to_record(self, record: Record) -> tuple:
-        return (record.order_id.id, record.create_date, record.price_unit, record.product_id.barcode)
+    def get_redeemed_tickets(self, bases: list[str], before: datetime, after: datetime) -> list[tuple]:
+        """
+        research specific barcodes in pos.order_lines before and after certain dates.
+        lines are hydrated with their order partner & product barcode through bulk reads (4 round trips overall).
+        return list of (pos_id, create_date, price_unit, barcode, partner) where partner is (id, barcode_base, name) or None.
+        """
+        before, after = odoo_datetime(before), odoo_datetime(after)
+        lines = self.search_read(
+            "pos.order.line", 
+            [("product_id.barcode_base", "in", bases), ("create_date", ">=", after), ("create_date", "<", before)],
+            POS_LINE_FIELDS
+        )
+        order_ids = list({line["order_id"][0] for line in lines if line["order_id"]})
+        product_ids = list({line["product_id"][0] for line in lines if line["product_id"]})
+
+        orders = {o["id"]: o for o in self.read("pos.order", order_ids, ["partner_id"])}
+        partner_ids = list({o["partner_id"][0] for o in orders.values() if o["partner_id"]})
+        # unsubscribed partners are left out, like `get_partner_record_from_id` does: their redeems stay unattributed.
+        partners = {
+            p["id"]: p for p in self.search_read(
+                "res.partner", 
+                [("id", "in", partner_ids), ("cooperative_state", "!=", "unsubscribed")],
+                ["id", "barcode_base", "name"]
+            )
+        } if partner_ids else {}
+        products = {p["id"]: p for p in self.read("product.product", product_ids, ["barcode"])}
+
+        records = []
+        for line in lines:
+            order_id = line["order_id"][0] if line["order_id"] else None
+            product_id = line["product_id"][0] if line["product_id"] else None
+            order = orders.get(order_id, {})
+            partner = partners.get(order["partner_id"][0]) if order.get("partner_id") else None
+            barcode = products.get(product_id, {}).get("barcode", None)
+            partner_record = (partner["id"], partner["barcode_base"], partner["name"]) if partner else None
+            records.append((order_id, line["create_date"], line["price_unit"], barcode, partner_record))
+        return records
     
     def get_existing_consigne_barcodes(self) -> list[tuple]:
         product_cat = self.get("product.category", [("name", "=", "Consigne_product")])
@@ -193,43 +593,38 @@ class OdooSession(ContextDecorator):
         product_cat_id = product_cat.id
         return [(str(r.barcode_base), r.barcode, r.name, r.sale_ok) for r in self.browse("product.product", [("product_tmpl_id.categ_id.id", "=", product_cat_id)])]
 
-    def get_current_shifts(self) -> RecordList:
+    def get_current_shifts(self) -> Shifts:
         SHIFT_WINDOW_FLOOR = int(os.environ.get("SHIFT_WINDOW_FLOOR", 15))
         SHIFT_WINDOW_CEILING = int(os.environ.get("SHIFT_WINDOW_CEILING", 15))
 
         begin = (datetime.now() - SHIFT_LEN - timedelta(minutes=SHIFT_WINDOW_FLOOR)).isoformat()
         end = (datetime.now() + timedelta(minutes=SHIFT_WINDOW_CEILING)).isoformat()
-        shifts = self.browse("shift.shift", [("date_begin_tz", ">=", begin), ("date_begin_tz", "<=", end), ("shift_type_id.id", "=", 1)])
+        shifts = self.search_read(
+            "shift.shift", 
+            [("date_begin_tz", ">=", begin), ("date_begin_tz", "<=", end), ("shift_type_id.id", "=", 1)],
+            SHIFT_FIELDS
+        )
         return shifts
 
-    def get_shift_zone(self, shifts: RecordList) -> tuple[datetime | None, datetime | None]:
-        SHIFT_WINDOW_FLOOR = int(os.environ.get("SHIFT_WINDOW_FLOOR", 15))
-        SHIFT_WINDOW_CEILING = int(os.environ.get("SHIFT_WINDOW_CEILING", 15) )
-        debut, end = None, None
-
-        if len(shifts) == 1:
-            shift = shifts[0]
-            dt_begin = shift.date_begin_tz
-            dt_end = shift.date_end_tz
-            assert isinstance(dt_begin, str) and isinstance(dt_end, str)
-            debut = datetime.fromisoformat(dt_begin) + timedelta(minutes=SHIFT_WINDOW_FLOOR)
-            end = datetime.fromisoformat(dt_end) - timedelta(minutes=SHIFT_WINDOW_CEILING) 
-
-        elif len(shifts) == 2:
-            first_shift, second_shift = shifts[0], shifts[1]
-            dt_begin = second_shift.date_begin_tz
-            dt_end = first_shift.date_end_tz
-            assert isinstance(dt_begin, str) and isinstance(dt_end, str)
-            debut = datetime.fromisoformat(dt_begin) - timedelta(minutes=SHIFT_WINDOW_FLOOR)
-            end = datetime.fromisoformat(dt_end) + timedelta(minutes=SHIFT_WINDOW_CEILING) 
-
-        return (debut, end)
-
-    def get_shifts_members(self, shifts: RecordList) -> list[tuple[int, int, str]]:
+    def get_shift_zone(self, shifts: Shifts) -> Zone:
+        return shift_zone(shifts)
+
+    def get_shifts_members(self, shifts: Shifts) -> list[tuple[int, int, str]]:
+        """registrations of all shifts in one query, then their partners read in bulk."""
+        registrations = self.search_read(
+            "shift.registration", 
+            [("shift_id", "in", [shift["id"] for shift in shifts])], 
+            ["partner_id"]
+        )
+        partner_ids = [r["partner_id"][0] for r in registrations if r["partner_id"]]
+        partners = {p["id"]: p for p in self.read("res.partner", list(set(partner_ids)), MEMBER_FIELDS)}
+
         current_members = []
-        for shift in shifts:
-            members = self.browse("shift.registration", [("shift_id", "=", shift.id)])
-            current_members.extend([(r.partner_id.id, r.partner_id.barcode_base, r.partner_id.display_name) for r in members])
+        for partner_id in partner_ids:
+            partner = partners.get(partner_id, None)
+            if partner is None:
+                continue
+            current_members.append((partner["id"], partner["barcode_base"], partner["display_name"]))
 
         current_members = sorted(current_members, key= lambda x: x[1])
         return current_members
@@ -241,4 +636,48 @@ class OdooSession(ContextDecorator):
             members = []
         else:
             members = self.get_shifts_members(shifts)
-        return (zone, members)
\ No newline at end of file
+        return (zone, members)
+
+    def get_members(self, partner_ids: list[int]) -> list[tuple[int, int, str]]:
+        partners = self.read("res.partner", partner_ids, MEMBER_FIELDS)
+        return [(p["id"], p["barcode_base"], p["display_name"]) for p in partners]
+
+    def get_shift_calendar(self, day: date) -> tuple[Shifts, list[dict[str, Any]], list[tuple[int, int, str]]]:
+        """
+        shifts beginning on `day` or the day after, their registrations & registered partners (3 round trips).
+        the previous evening shifts are included as well, they may still be current after midnight.
+        """
+        day_begin = datetime.combine(day, datetime.min.time())
+        begin, end = day_begin - SHIFT_LEN, day_begin + timedelta(days=2)
+        shifts = self.search_read(
+            "shift.shift", 
+            [("date_begin_tz", ">=", begin.isoformat()), ("date_begin_tz", "<", end.isoformat())],
+            CALENDAR_SHIFT_FIELDS
+        )
+        if not shifts:
+            return ([], [], [])
+        registrations = self.search_read(
+            "shift.registration", [("shift_id", "in", [shift["id"] for shift in shifts])], REGISTRATION_FIELDS
+        )
+        partner_ids = list({r["partner_id"][0] for r in registrations if r["partner_id"]})
+        return (shifts, registrations, self.get_members(partner_ids))
+
+    def get_registration_changes(
+        self, 
+        shift_ids: list[int], 
+        since: str | None, 
+        known_partners: set[int]
+    ) -> tuple[list[dict[str, Any]], list[int], list[tuple[int, int, str]]]:
+        """
+        registrations of `shift_ids` written after `since`, ids of all their current registrations (to drop removed ones)
+        and the partners not in `known_partners` yet.
+        """
+        if not shift_ids:
+            return ([], [], [])
+        conditions = [("shift_id", "in", shift_ids)]
+        current = [r["id"] for r in self.search_read("shift.registration", conditions, ["id"])]
+        if since is not None:
+            conditions = conditions + [("write_date", ">", since)]
+        changed = self.search_read("shift.registration", conditions, REGISTRATION_FIELDS)
+        partner_ids = list({r["partner_id"][0] for r in changed if r["partner_id"] and r["partner_id"][0] not in known_partners})
+        return (changed, current, self.get_members(partner_ids))
\ No newline at end of file
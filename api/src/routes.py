@@ -1,9 +1,9 @@
-
-
+import os
 from sanic import Request, Blueprint, HTTPResponse
 from sanic.response import json, empty
 
 from src.engine import ConsigneEngine
+from src.metrics import RPC_METRICS
 
 consigneBp = Blueprint("consigneBp", url_prefix="/")
 
@@ -30,12 +30,11 @@ async def provider_login(request: Request) -> HTTPResponse:
     payload = request.load_json()
     username = payload.get("username", None)
     password = payload.get("password", None)
-    print(username, password)
     if not all([username, password]):
         raise KeyError("Missing `username` or `password`")
 
     engine: ConsigneEngine = request.app.ctx.engine
-    res = engine.authenticate_provider(username, password)
+    res = await engine.authenticate_provider(username, password)
     return json({"status": 200, "reasons": "OK", "data": res})
 
 @consigneBp.route("/deposit/create", methods=["POST"])
@@ -61,7 +60,7 @@ async def initialize_return(request: Request) -> HTTPResponse:
         raise KeyError("Missing `provider_partner_id` or `receiver_partner_id`")
 
     engine: ConsigneEngine = request.app.ctx.engine
-    res = engine.initialize_return(receiver_partner_id, provider_partner_id)
+    res = await engine.initialize_return(receiver_partner_id, provider_partner_id)
     return json({"status": 200, "reasons": "OK", "data": {"deposit_id": res}})
 
 @consigneBp.route("/deposit/<deposit_id:int>", methods=["GET"])
@@ -75,9 +74,10 @@ async def get_deposit(request: Request, deposit_id: int) -> HTTPResponse:
         deposit_lines(list[dict]): list of all deposit_lines
     """
     engine: ConsigneEngine = request.app.ctx.engine
-    res = engine.get_deposit_data(deposit_id)
-    print(res)
-    return json({"status": 200, "reasons": "OK", "data": res})
+    document = await engine.get_deposit_document(deposit_id)
+    # the document is shaped by the database, it is embedded as is rather than decoded & encoded again.
+    body = '{"status": 200, "reasons": "OK", "data": %s}' % (document or "null")
+    return HTTPResponse(body, content_type="application/json")
 
 @consigneBp.route("/deposit/<deposit_id:int>/<deposit_line_id:int>", methods=["GET"])
 async def get_deposit_line(request: Request, deposit_id: int, deposit_line_id: int) -> HTTPResponse:
@@ -88,7 +88,20 @@ async def get_deposit_line(request: Request, deposit_id: int, deposit_line_id: i
         deposit_lines(dict): a deposit_lines record
     """
     engine: ConsigneEngine = request.app.ctx.engine
-    res = engine.get_deposit_line_data(deposit_id, deposit_line_id)
+    res = await engine.get_deposit_line_data(deposit_id, deposit_line_id)
+    return json({"status": 200, "reasons": "OK", "data": res})
+
+@consigneBp.route("/deposit/<deposit_id:int>/totals", methods=["GET"])
+async def get_deposit_totals(request: Request, deposit_id: int) -> HTTPResponse:
+    """Get the running totals of a deposit non canceled lines.
+
+    :return: json payload:
+        deposit_lines_count(int): number of lines
+        deposit_value(float): total return value
+        returns(list[dict]): product_return_id, product_return_name, returns_count & returns_value per return type
+    """
+    engine: ConsigneEngine = request.app.ctx.engine
+    res = await engine.get_deposit_totals(deposit_id)
     return json({"status": 200, "reasons": "OK", "data": res})
 
 @consigneBp.route("/deposit/<deposit_id:int>/return/<product_barcode:str>", methods=["GET"])
@@ -107,7 +120,7 @@ async def get_product(request: Request, deposit_id: int, product_barcode: str) -
                 return_value(float|None): Backend set the return value to 0.0. Likely to be interpreted as None from the frontend. 
     """
     engine: ConsigneEngine = request.app.ctx.engine
-    res = engine.return_product(deposit_id, product_barcode)
+    res = await engine.return_product(deposit_id, product_barcode)
     return json({"status": 200, "reasons": "OK", "data": res})
 
 @consigneBp.route("/deposit/<deposit_id:int>/cancel/<deposit_line_id:int>", methods=["GET"])
@@ -117,21 +130,21 @@ async def cancel_returned_product(request: Request, deposit_id: int, deposit_lin
     """
 
     engine: ConsigneEngine = request.app.ctx.engine
-    res = engine.cancel_deposit_line(deposit_id, deposit_line_id)
+    res = await engine.cancel_deposit_line(deposit_id, deposit_line_id)
     return json({"status": 200, "reasons": "OK", "data": {}})
 
 @consigneBp.route("/deposit/<deposit_id:int>/ticket", methods=["GET"])
 async def get_ticket(request: Request, deposit_id: int) -> HTTPResponse:
     """Request to generate a ticket for a given deposit."""
     engine: ConsigneEngine = request.app.ctx.engine
-    res = engine.generate_ticket(deposit_id)
+    res = await engine.generate_ticket(deposit_id)
     return json({"status": 200, "reasons": "OK", "data": {}})
 
 
 @consigneBp.route("/deposit/<deposit_id:int>/close", methods=["GET"])
 async def close_deposit(request: Request, deposit_id: int) -> HTTPResponse:
     engine: ConsigneEngine = request.app.ctx.engine
-    res = engine.close_deposit(deposit_id)
+    res = await engine.close_deposit(deposit_id)
     return json({"status": 200, "reasons": "OK", "data": {}})
 
 @consigneBp.route("/search-user", methods=["POST"])
@@ -144,11 +157,20 @@ async def search_user(request: Request) -> HTTPResponse:
     inp = payload.get("input", None)
 
     engine: ConsigneEngine = request.app.ctx.engine
-    res = engine.search_user(inp)
+    res = await engine.search_user(inp)
     return json({"status": 200, "reasons": "OK", "data": {"matches": res}})
 
 @consigneBp.route("/get-shifts-users", methods=["GET"])
 async def get_shifts_users(request: Request) -> HTTPResponse:
     engine: ConsigneEngine = request.app.ctx.engine
-    users = engine.get_shifts_users()
+    users = await engine.get_shifts_users()
     return json({"status": 200, "reasons": "OK", "data": {"users": users}})
+
+@consigneBp.route("/metrics/odoo", methods=["GET"])
+async def odoo_metrics(request: Request) -> HTTPResponse:
+    """
+    Odoo RPC latency histograms of the worker serving the request, per model & method.
+    GET ?model=<odoo model> to restrict the payload to a single model.
+    """
+    model = request.args.get("model", None)
+    return json({"status": 200, "reasons": "OK", "data": {"pid": os.getpid(), "models": RPC_METRICS.snapshot(model)}})
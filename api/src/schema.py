@@ -1,4 +1,5 @@
-from sqlalchemy import JSON, Column, DateTime, Integer, UnicodeText, Numeric, Enum, Boolean, Sequence, ForeignKey, BOOLEAN, REAL
+from datetime import datetime, timezone
+from sqlalchemy import JSON, Column, DateTime, Integer, UnicodeText, Numeric, Enum, Boolean, Sequence, ForeignKey, BOOLEAN, REAL, TypeDecorator
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base
 
@@ -13,6 +14,29 @@ Base = declarative_base()
 Base._values = _values
 
 
+class Timestamp(TypeDecorator):
+    """
+    timezone aware timestamp. TIMESTAMPTZ on postgresql, UTC `YYYY-MM-DD HH:MM:SS.ffffff` text on sqlite
+    which has no native type: the fixed width keeps its comparisons & index range scans chronological.
+    naive datetimes are taken as local time.
+    """
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value: datetime | None, dialect) -> datetime | None:
+        if value is None:
+            return None
+        value = value.astimezone(timezone.utc)
+        if dialect.name == "sqlite":
+            return value.replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value: datetime | None, dialect) -> datetime | None:
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value
+
+
 class Users(Base):
     __tablename__ = "users"
     __table_args__ = {"schema": "main"}
@@ -21,8 +45,8 @@ class Users(Base):
     user_partner_id = Column(Integer, unique=True)
     user_code = Column(Integer, unique=True)
     user_name = Column(UnicodeText, nullable=False)
-    last_provider_activity = Column(UnicodeText)
-    last_receiver_activity = Column(UnicodeText)
+    last_provider_activity = Column(Timestamp)
+    last_receiver_activity = Column(Timestamp)
 
 class Redeem(Base):
     __tablename__ = "redeem"
@@ -30,12 +54,24 @@ class Redeem(Base):
 
     redeem_id = Column(Integer, primary_key=True, autoincrement=True)
     odoo_pos_id = Column(Integer, nullable=False)
-    redeem_datetime = Column(UnicodeText, nullable=False)
+    redeem_datetime = Column(Timestamp, nullable=False)
     redeem_user = Column(Integer, ForeignKey("main.users.user_id"), nullable=False)
     redeem_value = Column(REAL, nullable=False)
     redeem_barcode = Column(UnicodeText, nullable=False)
     anomaly = Column(BOOLEAN, nullable=False)
 
+class Directory(Base):
+    """local replica of odoo res.partner used for members search, delta synced on write_date"""
+    __tablename__ = "directory"
+    __table_args__ = {"schema": "main"}
+
+    directory_id = Column(Integer, primary_key=True, autoincrement=True)
+    partner_id = Column(Integer, unique=True, nullable=False)
+    barcode_base = Column(Integer)
+    display_name = Column(UnicodeText, nullable=False)
+    cooperative_state = Column(UnicodeText)
+    write_date = Column(UnicodeText)
+
 class Consigne(Base):
     __tablename__ = "consigne"
     __table_args__ = {"schema": "main"}
@@ -47,6 +83,15 @@ class Consigne(Base):
     consigne_barcode_base = Column(UnicodeText)
     consigne_active = Column(BOOLEAN)
 
+class Consigne_sequence(Base):
+    """single row allocator of consigne barcode bases, see `ConsigneDatabase.next_barcode_base`"""
+    __tablename__ = "consigne_sequence"
+    __table_args__ = {"schema": "main"}
+
+    sequence_id = Column(Integer, primary_key=True, autoincrement=False)
+    sequence_position = Column(Integer, nullable=False) # ring index of the last allocated base
+    ring_version = Column(Integer, nullable=False) # bumped whenever consigne rows change
+
 class Product_returns(Base):
     __tablename__ = "product_returns"
     __table_args__ = {"schema": "main"}
@@ -57,6 +102,19 @@ class Product_returns(Base):
     returnable = Column(BOOLEAN, nullable=False)
     return_value = Column(REAL)
 
+class Catalog(Base):
+    """local mirror of odoo product.product barcodes & returnability, delta synced on write_date"""
+    __tablename__ = "catalog"
+    __table_args__ = {"schema": "main"}
+
+    catalog_id = Column(Integer, primary_key=True, autoincrement=True)
+    odoo_product_id = Column(Integer, unique=True, nullable=False)
+    barcode = Column(UnicodeText, nullable=False, index=True)
+    product_name = Column(UnicodeText, nullable=False)
+    returnable = Column(BOOLEAN, nullable=False)
+    product_return_id = Column(Integer, ForeignKey("main.product_returns.product_return_id"))
+    write_date = Column(UnicodeText)
+
 class Products(Base):
     __tablename__ = "products"
     __table_args__ = {"schema": "main"}
@@ -74,11 +132,23 @@ class Deposits(Base):
     deposit_id = Column(Integer, primary_key=True, autoincrement=True)
     receiver_id = Column(Integer, ForeignKey("main.users.user_id"), nullable=False)
     provider_id = Column(Integer, ForeignKey("main.users.user_id"), nullable=False)
-    deposit_datetime = Column(UnicodeText, nullable=False)
+    deposit_datetime = Column(Timestamp, nullable=False)
     closed = Column(BOOLEAN, nullable=False)
     deposit_barcode = Column(UnicodeText)
     deposit_barcode_base_id = Column(Integer, ForeignKey("main.consigne.consigne_id"))
-    redeemed = Column(Integer, ForeignKey("main.redeemed.redeem_id"))
+    redeemed = Column(Integer, ForeignKey("main.redeem.redeem_id"))
+    deposit_lines_count = Column(Integer, nullable=False, server_default="0") # non canceled lines
+    deposit_value = Column(REAL, nullable=False, server_default="0") # return value of the non canceled lines
+
+class Deposit_return_totals(Base):
+    """running totals of a deposit's non canceled lines per return type"""
+    __tablename__ = "deposit_return_totals"
+    __table_args__ = {"schema": "main"}
+
+    deposit_id = Column(Integer, ForeignKey("main.deposits.deposit_id"), primary_key=True, autoincrement=False)
+    product_return_id = Column(Integer, ForeignKey("main.product_returns.product_return_id"), primary_key=True, autoincrement=False)
+    returns_count = Column(Integer, nullable=False)
+    returns_value = Column(REAL, nullable=False)
 
 
 
@@ -89,5 +159,6 @@ class Deposit_lines(Base):
     deposit_line_id = Column(Integer, primary_key=True, autoincrement=True)
     deposit_id = Column(Integer, ForeignKey("main.deposits.deposit_id"), nullable=False)
     product_id = Column(Integer, ForeignKey("main.products.product_id"), nullable=False)
-    deposit_line_datetime = Column(UnicodeText, nullable=False)
-    canceled = Column(Boolean, nullable=False)
\ No newline at end of file
+    deposit_line_datetime = Column(Timestamp, nullable=False)
+    canceled = Column(Boolean, nullable=False)
+    line_value = Column(REAL, nullable=False, server_default="0") # return value of the product when scanned
\ No newline at end of file
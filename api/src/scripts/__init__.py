@@ -1,5 +1,9 @@
 import click
 from src.scripts.set_consigne_products import *
+from src.scripts.bench import BenchDatabase, run_bench, run_statements_bench
+from src.loaders import ConfigLoader
+from src.database import ConsigneDatabase
+from src.migrations import rollback as rollback_migrations
 
 __all__ = ["set_products", "Builder"]
 
@@ -12,6 +16,44 @@ def cli():
 def setup(config: str) -> None:
     Builder.from_configs(config).run()
 
+@cli.command()
+@click.option("-c", "--config", default="configs.yaml", help="your config file path. Default: `configs.yaml`.")
+def migrate(config: str) -> None:
+    """apply the pending schema migrations. Also done by the api at boot."""
+    ConsigneDatabase(**ConfigLoader().load(config)["database"])
+
+@cli.command()
+@click.option("-c", "--config", default="configs.yaml", help="your config file path. Default: `configs.yaml`.")
+@click.option("-t", "--target", default=0, type=int, help="version to revert to. Default: 0, every migration.")
+def rollback(config: str, target: int) -> None:
+    """revert the schema migrations above `target`."""
+    database = ConsigneDatabase(**ConfigLoader().load(config)["database"])
+    reverted = rollback_migrations(database._engine, database.dialect, target) # pyright: ignore
+    click.echo(f"reverted: {reverted}")
+
+@cli.command()
+@click.option("-d", "--database", default="bench.db", help="sqlite database file, created if missing. Default: `bench.db`.")
+@click.option("-l", "--lines", default=1_000_000, type=int, help="number of deposit lines to generate. Default: 1000000.")
+@click.option("-r", "--repeat", default=50, type=int, help="runs per operation. Default: 50.")
+def bench(database: str, lines: int, repeat: int) -> None:
+    """hot path queries timings (median, ms) on a synthetic dataset, without & with the migrations indexes."""
+    results = run_bench(BenchDatabase("sqlite", database), lines, repeat)
+    phases = list(results.keys())
+    click.echo(f"{'operation':<28}" + "".join([f"{phase:>18}" for phase in phases]))
+    for operation in results[phases[0]]:
+        click.echo(f"{operation:<28}" + "".join([f"{results[phase][operation]:>18}" for phase in phases]))
+
+@cli.command()
+@click.option("-d", "--database", default="bench_statements.db", help="sqlite database file, created if missing. Default: `bench_statements.db`.")
+@click.option("-l", "--lines", default=10_000, type=int, help="number of deposit lines to generate. Default: 10000.")
+@click.option("-n", "--calls", default=2000, type=int, help="executions per statement. Default: 2000.")
+def bench_statements(database: str, lines: int, calls: int) -> None:
+    """scan path statements timings (median, µs), rebuilt on each call versus prebuilt."""
+    results = run_statements_bench(BenchDatabase("sqlite", database), lines, calls)
+    click.echo(f"{'statement':<28}{'rebuilt':>12}{'prebuilt':>12}{'saved':>12}")
+    for statement, (rebuilt, prebuilt) in results.items():
+        click.echo(f"{statement:<28}{rebuilt:>12}{prebuilt:>12}{round(rebuilt - prebuilt, 1):>12}")
+
 
 if __name__ == "__main__":
-    cli()
\ No newline at end of file
+    cli()
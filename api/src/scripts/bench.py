@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import click
+import random
+import asyncio
+from time import perf_counter
+from datetime import datetime, timedelta, timezone
+from statistics import median
+from sqlalchemy import Executable, insert, select, update, func, text
+
+from typing import Any, Awaitable, Callable
+
+from src.database import ConsigneDatabase
+from src.tables import Consigne, Catalog, Product_returns, Products, Users, Redeem, Deposits, Deposit_lines
+from src import statements as sql
+from src.migrations import MIGRATIONS, DEPOSIT_TOTALS_BACKFILL, DEPOSIT_LINE_VALUES_BACKFILL, create_index, drop_index
+
+"""
+Hot path queries timings on a synthetic dataset, without then with the migrations indexes.
+Statements timings of the scan path, rebuilt on each call versus prebuilt in `src.statements`.
+The dataset is generated in an empty database only, never run it against a production database.
+"""
+
+BENCH_USERS = 2000
+BENCH_PRODUCTS = 200
+BENCH_BASES = 100
+LINES_PER_DEPOSIT = 10
+BENCH_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+CHUNK_SIZE = 50_000
+
+
+# scan path (`ConsigneEngine.return_product`) statements as they were built on each call before `src.statements`.
+REBUILT_SCAN_PATH: dict[str, Callable[[dict[str, Any]], Executable]] = {
+    "get_catalog_product": lambda p: (
+        select(
+            Catalog.c.odoo_product_id,
+            Catalog.c.product_name,
+            Catalog.c.barcode,
+            Catalog.c.returnable,
+            Catalog.c.product_return_id,
+            Product_returns.c.return_value
+        )
+        .select_from(Catalog)
+        .outerjoin(Product_returns)
+        .where(Catalog.c.barcode == p["barcode"])
+        .limit(1)
+    ),
+    "get_product_from_opid": lambda p: select(Products).where(Products.c.odoo_product_id == p["opid"]),
+    "add_deposit_line": lambda p: (
+        insert(Deposit_lines)
+        .values(deposit_id=p["deposit_id"], product_id=p["product_id"], deposit_line_datetime=p["deposit_line_datetime"], canceled=False, line_value=p["line_value"])
+        .returning(Deposit_lines.c.deposit_line_id)
+    ),
+    "deposit totals": lambda p: text(sql.DEPOSIT_TOTALS.text),
+    "deposit return totals": lambda p: text(sql.DEPOSIT_RETURN_TOTALS.text),
+    "close_deposit": lambda p: update(Deposits).values(closed=True).where(Deposits.c.deposit_id == p["deposit_id"]),
+}
+
+PREBUILT_SCAN_PATH: dict[str, Callable[[dict[str, Any]], tuple[Executable, dict[str, Any]]]] = {
+    "get_catalog_product": lambda p: (sql.SELECT_CATALOG_PRODUCT, {"barcode": p["barcode"]}),
+    "get_product_from_opid": lambda p: (sql.SELECT_PRODUCT_FROM_OPID, {"opid": p["opid"]}),
+    "add_deposit_line": lambda p: (sql.INSERT_DEPOSIT_LINE, {
+        "deposit_id": p["deposit_id"], "product_id": p["product_id"], "deposit_line_datetime": p["deposit_line_datetime"], "canceled": False, "line_value": p["line_value"]
+    }),
+    "deposit totals": lambda p: (sql.DEPOSIT_TOTALS, {"did": p["deposit_id"], "pid": p["product_id"], "value": p["line_value"], "sign": 1}),
+    "deposit return totals": lambda p: (sql.DEPOSIT_RETURN_TOTALS, {"did": p["deposit_id"], "pid": p["product_id"], "value": p["line_value"], "sign": 1}),
+    "close_deposit": lambda p: (sql.UPDATE_DEPOSIT_CLOSED, {"b_deposit_id": p["deposit_id"]}),
+}
+
+# text statements of the rebuilt path take the same parameters as the prebuilt ones
+REBUILT_TEXT_PARAMS = {"deposit totals", "deposit return totals"}
+
+
+class BenchDatabase(ConsigneDatabase):
+    def populate(self, lines: int, seed: int = 0) -> None:
+        rng = random.Random(seed)
+        deposits = max(1, lines // LINES_PER_DEPOSIT)
+        with self._engine.begin() as connection:
+            if connection.execute(select(func.count()).select_from(Deposits)).scalar():
+                raise ValueError("bench dataset must be generated in an empty database")
+
+            connection.execute(insert(Consigne), [
+                {"consigne_id": i, "consigne_name": "Consigne", "consigne_barcode": f"999{i:04d}000000", "consigne_barcode_base": f"{i:04d}", "consigne_active": True}
+                for i in range(1, BENCH_BASES + 1)
+            ])
+            connection.execute(insert(Product_returns), [
+                {"product_return_id": i, "odoo_product_return_id": i, "product_return_name": f"Consigne {v}", "returnable": v > 0, "return_value": v}
+                for i, v in [(1, 0.0), (2, 0.1), (3, 0.25), (4, 0.5)]
+            ])
+            connection.execute(insert(Products), [
+                {"product_id": i, "odoo_product_id": i, "product_name": f"P{i}", "barcode": f"{i:013d}", "product_return_id": rng.randint(1, 4)}
+                for i in range(1, BENCH_PRODUCTS + 1)
+            ])
+            connection.execute(insert(Users), [
+                {"user_id": i, "user_partner_id": i, "user_code": i, "user_name": f"U{i}"}
+                for i in range(1, BENCH_USERS + 1)
+            ])
+            connection.execute(insert(Redeem), [
+                {"redeem_id": i, "odoo_pos_id": i, "redeem_datetime": BENCH_EPOCH + timedelta(minutes=i % 60), "redeem_user": 1, "redeem_value": 0.0, "redeem_barcode": "", "anomaly": False}
+                for i in range(1, deposits // 2 + 1)
+            ])
+
+        for start in range(1, deposits + 1, CHUNK_SIZE):
+            ids = range(start, min(deposits, start + CHUNK_SIZE - 1) + 1)
+            with self._engine.begin() as connection:
+                connection.execute(insert(Deposits), [
+                    {
+                        "deposit_id": i,
+                        "receiver_id": rng.randint(1, BENCH_USERS),
+                        "provider_id": rng.randint(1, BENCH_USERS),
+                        "deposit_datetime": BENCH_EPOCH + timedelta(seconds=i),
+                        "closed": True,
+                        "deposit_barcode": f"999{i % BENCH_BASES + 1:04d}{i % 100000:05d}0",
+                        "deposit_barcode_base_id": i % BENCH_BASES + 1,
+                        "redeemed": i // 2 if i % 2 == 0 else None
+                    }
+                    for i in ids
+                ])
+                connection.execute(insert(Deposit_lines), [
+                    {
+                        "deposit_id": i,
+                        "product_id": rng.randint(1, BENCH_PRODUCTS),
+                        "deposit_line_datetime": BENCH_EPOCH + timedelta(seconds=i),
+                        "canceled": rng.random() < 0.05
+                    }
+                    for i in ids for _ in range(LINES_PER_DEPOSIT)
+                ])
+
+        with self._engine.begin() as connection:
+            connection.execute(text(DEPOSIT_LINE_VALUES_BACKFILL.format(schema="main", table="deposit_lines")))
+            for stmt in DEPOSIT_TOTALS_BACKFILL:
+                connection.execute(text(stmt))
+
+    def set_indexes(self, enabled: bool) -> None:
+        """create or drop the migrations indexes, leaving the migrations state untouched"""
+        indexes = [i for migration in MIGRATIONS for i in migration.indexes]
+        with self._engine.begin() as connection:
+            for i in indexes:
+                stmt = create_index(self.dialect, i.name, i.table, i.columns, i.where) if enabled else drop_index(i.name) # pyright: ignore
+                connection.execute(text(stmt))
+
+    def analyze(self) -> None:
+        with self._engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+
+    async def measure(self, repeat: int, seed: int = 0) -> dict[str, float]:
+        """median duration (ms) of each hot path operation over `repeat` runs"""
+        rng = random.Random(seed)
+        with self._engine.begin() as connection:
+            deposits = connection.execute(select(func.max(Deposits.c.deposit_id))).scalar() or 1
+
+        operations: dict[str, Callable[[], Awaitable[Any]]] = {
+            "get_deposit_data": lambda: self.get_deposit_data(rng.randint(1, deposits)),
+            "get_returns_per_types": lambda: self.get_returns_per_types(rng.randint(1, deposits)),
+            "get_deposit_totals": lambda: self.get_deposit_totals(rng.randint(1, deposits)),
+            "match_redeem_deposits": lambda: self.match_redeem_deposits(
+                f"999{rng.randint(1, BENCH_BASES):04d}{rng.randint(0, 99999):05d}0", rng.randint(1, BENCH_USERS), 1.0
+            ),
+            "match_redeem_lines (x100)": lambda: self.match_redeem_lines([
+                (f"999{rng.randint(1, BENCH_BASES):04d}{rng.randint(0, 99999):05d}0", rng.randint(1, BENCH_USERS), 1.0)
+                for _ in range(100)
+            ]),
+            "next_barcode_base": lambda: self.next_barcode_base(),
+            "get_last_redeem_datetime": lambda: self.get_last_redeem_datetime(),
+            "get_first_deposit_datetime": lambda: self.get_first_deposit_datetime(),
+        }
+        timings = {}
+        for name, operation in operations.items():
+            durations = []
+            for _ in range(repeat):
+                t = perf_counter()
+                await operation()
+                durations.append(perf_counter() - t)
+            timings[name] = round(median(durations) * 1000, 3)
+        return timings
+
+
+    def measure_statements(self, calls: int, seed: int = 0) -> dict[str, tuple[float, float]]:
+        """
+        median duration (µs) of each scan path statement over `calls` executions, rebuilt on each call then prebuilt.
+        Executed on the sync engine to leave the event loop out, writes are rolled back.
+        """
+        rng = random.Random(seed)
+        with self._engine.begin() as connection:
+            deposits = connection.execute(select(func.max(Deposits.c.deposit_id))).scalar() or 1
+
+        def params() -> dict[str, Any]:
+            product_id = rng.randint(1, BENCH_PRODUCTS)
+            return {
+                "barcode": f"{product_id:013d}",
+                "opid": product_id,
+                "product_id": product_id,
+                "deposit_id": rng.randint(1, deposits),
+                "deposit_line_datetime": datetime.now(timezone.utc),
+                "line_value": rng.choice([0.0, 0.1, 0.25, 0.5]),
+            }
+
+        timings = {}
+        with self._engine.connect() as connection:
+            for name in REBUILT_SCAN_PATH:
+                rebuilt, prebuilt = [], []
+                for _ in range(calls):
+                    p = params()
+                    t = perf_counter()
+                    stmt = REBUILT_SCAN_PATH[name](p)
+                    connection.execute(stmt, PREBUILT_SCAN_PATH[name](p)[1] if name in REBUILT_TEXT_PARAMS else None)
+                    rebuilt.append(perf_counter() - t)
+
+                    p = params()
+                    t = perf_counter()
+                    stmt, bound = PREBUILT_SCAN_PATH[name](p)
+                    connection.execute(stmt, bound)
+                    prebuilt.append(perf_counter() - t)
+                timings[name] = (round(median(rebuilt) * 1e6, 1), round(median(prebuilt) * 1e6, 1))
+            connection.rollback()
+        return timings
+
+
+def run_bench(db: BenchDatabase, lines: int, repeat: int) -> dict[str, dict[str, float]]:
+    async def phases() -> dict[str, dict[str, float]]:
+        try:
+            db.set_indexes(False)
+            db.analyze()
+            without = await db.measure(repeat)
+            db.set_indexes(True)
+            db.analyze()
+            with_indexes = await db.measure(repeat)
+        finally:
+            await db.dispose()
+        return {"without indexes": without, "with indexes": with_indexes}
+
+    t = perf_counter()
+    db.populate(lines)
+    click.echo(f"{lines} deposit lines generated in {round(perf_counter() - t, 1)}s")
+    return asyncio.run(phases())
+
+def run_statements_bench(db: BenchDatabase, lines: int, calls: int) -> dict[str, tuple[float, float]]:
+    try:
+        db.populate(lines)
+        return db.measure_statements(calls)
+    finally:
+        asyncio.run(db.dispose())
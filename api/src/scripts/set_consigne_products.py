@@ -8,7 +8,7 @@ from dataclasses import dataclass, field, asdict
 from collections import deque
 from functools import reduce
 
-from sqlalchemy import insert
+from sqlalchemy import insert, update
 
 from typing import Any, Generator
 
@@ -16,13 +16,12 @@ from typing import Any, Generator
 from src.loaders import ConfigLoader
 from src.odoo import OdooSession
 from src.database import ConsigneDatabase
+from src.tables import Consigne, Consigne_sequence
 
 PARENT_CAT = "Consigne"
 RETURN_CAT = "Consigne_return"
 PRODUCT_CAT = "Consigne_product"
 
-# pyright: reportUndefinedVariable=false
-
 @dataclass(frozen=True)
 class Product:
     name: str = field()
@@ -57,10 +56,6 @@ class Product:
         return payload
 
 class BuildingDatabase(ConsigneDatabase):
-    def __init__(self, dialect, database, driver = None, host = None, port = None, username = None, password = None):
-        super().__init__(dialect, database, driver, host, port, username, password)
-        self.load_metadata(__name__)
-
     def add_consigne_product(self, product: Product):
         with self.session_maker() as session:
             stmt = (
@@ -74,6 +69,10 @@ class BuildingDatabase(ConsigneDatabase):
                 )
             )
             session.execute(stmt)
+            session.execute(
+                update(Consigne_sequence)
+                .values(ring_version=Consigne_sequence.c.ring_version + 1)
+            )
             session.commit()
 
 class BuildingOdoo(OdooSession):
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import os
+from datetime import date, datetime, timedelta
+
+from typing import Any
+
+from src.odoo import Shifts, Zone, SHIFT_LEN, shift_zone
+
+"""
+In memory calendar of today's & tomorrow's shifts, loaded once a day from odoo shift.shift & shift.registration.
+Shift zones, members lists & shift end distances are computed locally from it.
+Between full loads, only registration changes are pulled.
+"""
+
+Member = tuple[int, int, str] # (partner_id, barcode_base, display_name)
+
+CALENDAR_DAYS = 2
+SHIFT_TYPE_ID = 1 # standard shifts, the ones members lists are built from
+
+
+class ShiftCalendar(object):
+    """
+    Only used from the worker event loop: loads & registration changes are applied in place, without locking.
+    """
+
+    def __init__(self) -> None:
+        self.day: date | None = None
+        self.shifts: Shifts = [] # sorted by date_begin_tz
+        self.registrations: dict[int, tuple[int, int | None]] = {} # registration_id: (shift_id, partner_id)
+        self.members: dict[int, Member] = {}
+        self.cursor: str | None = None # last registration write_date
+
+    @property
+    def loaded(self) -> bool:
+        """the calendar covers the current day"""
+        if self.day is None:
+            return False
+        return self.day <= date.today() < self.day + timedelta(days=CALENDAR_DAYS)
+
+    @property
+    def shift_ids(self) -> list[int]:
+        return [shift["id"] for shift in self.shifts]
+
+    def load(self, day: date, shifts: Shifts, registrations: list[dict[str, Any]], members: list[Member]) -> None:
+        self.day = day
+        self.shifts = sorted(shifts, key=lambda shift: shift["date_begin_tz"])
+        self.registrations = {}
+        self.members = {member[0]: member for member in members}
+        self.cursor = None
+        self.apply(registrations, [r["id"] for r in registrations], [])
+
+    def apply(self, changed: list[dict[str, Any]], current: list[int], members: list[Member]) -> None:
+        """upsert `changed` registrations, drop those not in `current` anymore."""
+        self.members.update({member[0]: member for member in members})
+        for r in changed:
+            partner_id = r["partner_id"][0] if r["partner_id"] else None
+            self.registrations[r["id"]] = (r["shift_id"][0], partner_id)
+            if r["write_date"] and (self.cursor is None or r["write_date"] > self.cursor):
+                self.cursor = r["write_date"]
+
+        current_ids = set(current)
+        for registration_id in [rid for rid in self.registrations if rid not in current_ids]:
+            del self.registrations[registration_id]
+
+    def current_shifts(self, now: datetime) -> Shifts:
+        """standard shifts which began less than a shift ago, or are about to begin. mirrors `OdooSession.get_current_shifts`"""
+        SHIFT_WINDOW_FLOOR = int(os.environ.get("SHIFT_WINDOW_FLOOR", 15))
+        SHIFT_WINDOW_CEILING = int(os.environ.get("SHIFT_WINDOW_CEILING", 15))
+
+        begin = now - SHIFT_LEN - timedelta(minutes=SHIFT_WINDOW_FLOOR)
+        end = now + timedelta(minutes=SHIFT_WINDOW_CEILING)
+        return [
+            shift for shift in self.shifts
+            if begin <= datetime.fromisoformat(shift["date_begin_tz"]) <= end
+            and shift["shift_type_id"] and shift["shift_type_id"][0] == SHIFT_TYPE_ID
+        ]
+
+    def current_members(self, now: datetime) -> tuple[Zone, list[Member]]:
+        shifts = self.current_shifts(now)
+        shift_ids = {shift["id"] for shift in shifts}
+        members = [
+            self.members[partner_id]
+            for shift_id, partner_id in self.registrations.values()
+            if shift_id in shift_ids and partner_id in self.members
+        ]
+        return (shift_zone(shifts), sorted(members, key=lambda x: x[1]))
+
+    def shift_end_dist(self, now: datetime) -> int | None:
+        """seconds before the end of the last shift begun today. mirrors `OdooSession.get_current_shift_end_time_dist`"""
+        day = now.replace(hour=0)
+        begun = [
+            shift for shift in self.shifts
+            if day < datetime.fromisoformat(shift["date_begin_tz"]) < now
+        ]
+        if len(begun) == 0:
+            return None
+        dist = int((datetime.fromisoformat(begun[-1]["date_end_tz"]) - now).total_seconds())
+        if dist < 0:
+            dist = None
+        return dist
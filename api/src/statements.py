@@ -0,0 +1,417 @@
+from sqlalchemy import Boolean, Integer, TextClause, bindparam, select, insert, update, text, func, literal_column, case
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.sql.selectable import Select
+
+from typing import Any
+
+from src.schema import Timestamp
+from src.tables import (
+    Users, Redeem, Directory, Consigne, Consigne_sequence, Product_returns,
+    Catalog, Products, Deposits, Deposit_return_totals, Deposit_lines
+)
+from src.migrations import ARCHIVE_SCHEMAS
+
+"""
+Statements of `ConsigneDatabase`, built once at import & bound to parameters: executions hit
+SQLAlchemy's compiled cache instead of rebuilding & hashing a new construct on every call.
+Statements reading the archive depend on its schema, they are keyed by dialect.
+Update parameters are prefixed with `b_`, column names are reserved to the SET clause.
+"""
+
+DIALECTS = list(ARCHIVE_SCHEMAS.keys())
+
+
+# USERS
+INSERT_USER = insert(Users).returning(Users.c.user_id)
+
+UPDATE_ACTIVITY = {
+    activity_as: (
+        update(Users)
+        .values({f"last_{activity_as}_activity": bindparam("b_now")})
+        .where(Users.c.user_id == bindparam("b_user_id"))
+    )
+    for activity_as in ("provider", "receiver")
+}
+
+SELECT_USER_FROM_CODE = select(Users).where(Users.c.user_code == bindparam("code"))
+SELECT_USER_FROM_PARTNER_ID = select(Users).where(Users.c.user_partner_id == bindparam("partner_id"))
+SELECT_USER_FROM_ID = select(Users).where(Users.c.user_id == bindparam("user_id"))
+
+
+# DIRECTORY
+SELECT_DIRECTORY_CURSOR = select(func.max(Directory.c.write_date))
+
+SELECT_DIRECTORY_PARTNERS = (
+    select(Directory.c.partner_id, Directory.c.barcode_base, Directory.c.display_name)
+    .where(Directory.c.cooperative_state.is_distinct_from("unsubscribed"))
+)
+
+
+# PRODUCTS
+INSERT_PRODUCT = insert(Products).returning(Products.c.product_id)
+SELECT_PRODUCT_FROM_OPID = select(Products).where(Products.c.odoo_product_id == bindparam("opid"))
+SELECT_RETURN_PRODUCT_FROM_OPID = select(Product_returns).where(Product_returns.c.odoo_product_return_id == bindparam("opid"))
+
+SELECT_RETURN_PRODUCTS_FROM_OPIDS = (
+    select(Product_returns.c.odoo_product_return_id, Product_returns.c.product_return_id)
+    .where(Product_returns.c.odoo_product_return_id.in_(bindparam("opids", expanding=True)))
+)
+
+
+# CATALOG
+SELECT_CATALOG_PRODUCT = (
+    select(
+        Catalog.c.odoo_product_id,
+        Catalog.c.product_name,
+        Catalog.c.barcode,
+        Catalog.c.returnable,
+        Catalog.c.product_return_id,
+        Product_returns.c.return_value
+    )
+    .select_from(Catalog)
+    .outerjoin(Product_returns)
+    .where(Catalog.c.barcode == bindparam("barcode"))
+    .limit(1)
+)
+
+SELECT_CATALOG_CURSOR = select(func.max(Catalog.c.write_date))
+
+SELECT_CATALOG_RETURN_OPIDS = (
+    select(Product_returns.c.odoo_product_return_id)
+    .distinct()
+    .select_from(Catalog)
+    .join(Product_returns)
+    .where(Catalog.c.returnable == True)
+)
+
+
+# DEPOSITS
+INSERT_DEPOSIT = insert(Deposits).returning(Deposits.c.deposit_id)
+INSERT_DEPOSIT_LINE = insert(Deposit_lines).returning(Deposit_lines.c.deposit_line_id)
+
+UPDATE_DEPOSIT_CLOSED = (
+    update(Deposits)
+    .values(closed=True)
+    .where(Deposits.c.deposit_id == bindparam("b_deposit_id"))
+)
+
+UPDATE_DEPOSIT_BARCODE = (
+    update(Deposits)
+    .values(deposit_barcode=bindparam("b_ean"), deposit_barcode_base_id=bindparam("b_barcode_base_id"))
+    .where(Deposits.c.deposit_id == bindparam("b_deposit_id"))
+)
+
+UPDATE_DEPOSIT_LINE_CANCELED = (
+    update(Deposit_lines)
+    .values(canceled=True)
+    .where(Deposit_lines.c.deposit_id == bindparam("b_deposit_id"))
+    .where(Deposit_lines.c.deposit_line_id == bindparam("b_deposit_line_id"))
+    .where(Deposit_lines.c.canceled == False)
+    .returning(Deposit_lines.c.product_id, Deposit_lines.c.line_value)
+)
+
+# running totals, see `ConsigneDatabase._update_deposit_totals`.
+# lines carry their value as scanned, totals never read the live product_returns value.
+DEPOSIT_TOTALS = text("""\
+    UPDATE main.deposits SET
+        deposit_lines_count = deposit_lines_count + :sign,
+        deposit_value = deposit_value + CAST(:sign AS INTEGER) * CAST(:value AS REAL)
+    WHERE deposit_id = :did;
+    """)
+
+DEPOSIT_RETURN_TOTALS = text("""\
+    INSERT INTO main.deposit_return_totals (deposit_id, product_return_id, returns_count, returns_value)
+    SELECT CAST(:did AS INTEGER), products.product_return_id, CAST(:sign AS INTEGER), CAST(:sign AS INTEGER) * CAST(:value AS REAL)
+    FROM main.products
+    WHERE products.product_id = :pid
+    ON CONFLICT (deposit_id, product_return_id) DO UPDATE SET
+        returns_count = deposit_return_totals.returns_count + excluded.returns_count,
+        returns_value = deposit_return_totals.returns_value + excluded.returns_value;
+    """)
+
+SELECT_DEPOSIT_TOTALS = (
+    select(Deposits.c.deposit_lines_count, Deposits.c.deposit_value)
+    .where(Deposits.c.deposit_id == bindparam("deposit_id"))
+)
+
+SELECT_DEPOSIT_RETURN_TOTALS = (
+    select(
+        Product_returns.c.product_return_id,
+        Product_returns.c.product_return_name,
+        Deposit_return_totals.c.returns_count,
+        Deposit_return_totals.c.returns_value
+    )
+    .select_from(Deposit_return_totals)
+    .join(Product_returns)
+    .where(Deposit_return_totals.c.deposit_id == bindparam("deposit_id"))
+    .where(Deposit_return_totals.c.returns_count > 0)
+)
+
+SELECT_DEPOSIT_LINE = (
+    select(Deposit_lines)
+    .join(Products)
+    .join(Product_returns)
+    .where(Deposit_lines.c.deposit_id == bindparam("deposit_id"))
+    .where(Deposit_lines.c.deposit_line_id == bindparam("deposit_line_id"))
+)
+
+RETURNS_PER_PRODUCT_TYPE = text("""\
+    SELECT
+        product_returns.product_return_name,
+        deposit_return_totals.returns_count,
+        ROUND(CAST(deposit_return_totals.returns_value AS NUMERIC), 2)
+    FROM main.deposit_return_totals
+    JOIN main.product_returns ON main.deposit_return_totals.product_return_id=main.product_returns.product_return_id
+    WHERE
+        deposit_id = :did
+        AND returns_count > 0
+        AND main.product_returns.product_return_id != 1;
+    """)
+
+
+# DEPOSIT DOCUMENT
+def _json_object(dialect: str, columns: list[Any]) -> Any:
+    """
+    json object of `columns` keyed by their names, repeated names are suffixed like in a select's rows (`product_id_1`).
+    sqlite booleans are stored as integers, they are cast back to json booleans.
+    sqlite timestamps are stored as UTC text, they are rendered in ISO 8601 with their offset like postgresql ones.
+    keys are inlined, postgresql cannot type parameters passed to json_build_object.
+    """
+    values, names = [], set()
+    for c in columns:
+        name = c.name if c.name not in names else f"{c.name}_1"
+        names.add(name)
+        value = c
+        if dialect == "sqlite" and isinstance(c.type, Boolean):
+            value = func.json(case((c.is_(None), None), (c == True, "true"), else_="false"))
+        elif dialect == "sqlite" and isinstance(c.type, Timestamp):
+            value = func.replace(c, " ", "T").op("||")("+00:00")
+        values.extend([literal_column(f"'{name}'"), value])
+
+    if dialect == "postgresql":
+        return func.json_build_object(*values)
+    return func.json_object(*values)
+
+def _deposit_document(dialect: str) -> Select:
+    """
+    deposit, receiver, provider & deposit lines with their product & return type, as one json document.
+    deposit lines are flattened the way `deposit_lines JOIN products JOIN product_returns` rows are,
+    their `return_value` is the one scanned (`line_value`) so that the document agrees with the running totals.
+    """
+    receiver, provider = Users.alias("receiver"), Users.alias("provider")
+    return_type = [c if c.name != "return_value" else Deposit_lines.c.line_value.label("return_value") for c in Product_returns.c]
+    line = _json_object(dialect, list(Deposit_lines.c) + list(Products.c) + return_type)
+    lines_source = (
+        Deposit_lines
+        .join(Products, Products.c.product_id == Deposit_lines.c.product_id)
+        .join(Product_returns, Product_returns.c.product_return_id == Products.c.product_return_id)
+    )
+    if dialect == "postgresql":
+        lines = (
+            select(func.coalesce(func.json_agg(aggregate_order_by(line, Deposit_lines.c.deposit_line_id)), text("'[]'::json")))
+            .select_from(lines_source)
+            .where(Deposit_lines.c.deposit_id == Deposits.c.deposit_id)
+            .scalar_subquery()
+        )
+        document = func.json_build_object
+    else:
+        # lines are scanned in deposit_line_id order along idx_deposit_lines_deposit_id.
+        # subqueries drop the json subtype, json() restores it.
+        lines = func.json(
+            select(func.json_group_array(line))
+            .select_from(lines_source)
+            .where(Deposit_lines.c.deposit_id == Deposits.c.deposit_id)
+            .scalar_subquery()
+        )
+        document = func.json_object
+
+    return (
+        select(document(
+            literal_column("'deposit'"), _json_object(dialect, list(Deposits.c)),
+            literal_column("'provider'"), _json_object(dialect, list(provider.c)),
+            literal_column("'receiver'"), _json_object(dialect, list(receiver.c)),
+            literal_column("'deposit_lines'"), lines,
+        ))
+        .select_from(Deposits)
+        .join(receiver, receiver.c.user_id == Deposits.c.receiver_id)
+        .join(provider, provider.c.user_id == Deposits.c.provider_id)
+        .where(Deposits.c.deposit_id == bindparam("deposit_id"))
+    )
+
+DEPOSIT_DOCUMENT = {dialect: _deposit_document(dialect) for dialect in DIALECTS}
+
+
+# ARCHIVE
+# retention runs from the redeem of a deposit, the expiry of the non redeemed ones from their opening.
+SETTLED_DEPOSITS = (
+    text("""\
+    SELECT deposits.deposit_id, deposits.deposit_datetime
+    FROM main.deposits
+    LEFT JOIN main.redeem ON main.redeem.redeem_id = main.deposits.redeemed
+    WHERE
+        deposits.closed = True
+        AND (redeem.redeem_datetime < :settled OR deposits.deposit_datetime < :expired)
+    ORDER BY deposits.deposit_id
+    LIMIT :batch;
+    """)
+    .bindparams(bindparam("settled", type_=Timestamp), bindparam("expired", type_=Timestamp))
+    .columns(deposit_id=Integer, deposit_datetime=Timestamp)
+)
+
+def _archive_statements(dialect: str) -> tuple[TextClause, TextClause]:
+    """copies of the `ids` deposits & their lines into the archive tables, postgresql ones partitioned by month."""
+    schema = ARCHIVE_SCHEMAS[dialect]
+    deposit_columns = ", ".join([c.name for c in Deposits.c])
+    line_columns = ", ".join([f"deposit_lines.{c.name}" for c in Deposit_lines.c])
+    month, month_column = "", ""
+    if dialect == "postgresql":
+        month, month_column = ", CAST(DATE_TRUNC('month', deposits.deposit_datetime AT TIME ZONE 'UTC') AS DATE)", ", deposit_month"
+
+    deposits = f"""\
+        INSERT INTO {schema}.deposits_archive ({deposit_columns}{month_column})
+        SELECT {deposit_columns}{month} FROM main.deposits WHERE deposit_id IN :ids;
+        """
+    lines = f"""\
+        INSERT INTO {schema}.deposit_lines_archive ({line_columns.replace("deposit_lines.", "")}{month_column})
+        SELECT {line_columns}{month}
+        FROM main.deposit_lines
+        JOIN main.deposits ON main.deposits.deposit_id=main.deposit_lines.deposit_id
+        WHERE deposit_lines.deposit_id IN :ids;
+        """
+    return (
+        text(deposits).bindparams(bindparam("ids", expanding=True)),
+        text(lines).bindparams(bindparam("ids", expanding=True)),
+    )
+
+ARCHIVE_DEPOSITS = {dialect: _archive_statements(dialect) for dialect in DIALECTS}
+
+# archived rows removal from the hot tables, running totals first
+DELETE_ARCHIVED = [
+    table.delete().where(table.c.deposit_id.in_(bindparam("ids", expanding=True)))
+    for table in (Deposit_return_totals, Deposit_lines, Deposits)
+]
+
+
+# GLOBAL
+FIRST_DEPOSIT_DATETIME = {
+    dialect: text(f"""\
+    SELECT MIN(deposit_datetime) AS deposit_datetime
+    FROM (
+        SELECT MIN(deposit_datetime) AS deposit_datetime FROM main.deposits
+        UNION ALL
+        SELECT MIN(deposit_datetime) AS deposit_datetime FROM {schema}.deposits_archive
+    ) AS first_deposits;
+    """).columns(deposit_datetime=Timestamp)
+    for dialect, schema in ARCHIVE_SCHEMAS.items()
+}
+
+SELECT_LAST_REDEEM_DATETIME = select(func.max(Redeem.c.redeem_datetime))
+
+
+# REDEEM
+def _open_deposits(schema: str) -> str:
+    """not redeemed deposits, hot & archived (expired ones), as a `deposits` subquery."""
+    columns = "deposit_id, deposit_barcode, receiver_id, closed, deposit_value"
+    return f"""(
+        SELECT {columns} FROM main.deposits WHERE redeemed IS NULL
+        UNION ALL
+        SELECT {columns} FROM {schema}.deposits_archive WHERE redeemed IS NULL
+    ) AS deposits"""
+
+POS_REDEEM_MATCHING = {
+    dialect: text(f"""\
+    SELECT
+        deposits.deposit_id
+    FROM {_open_deposits(schema)}
+    JOIN main.users ON main.users.user_id=deposits.receiver_id
+    WHERE
+        deposits.deposit_barcode = :barcode
+        AND user_partner_id = :pid
+        AND deposits.closed = True
+        AND ROUND(CAST(deposits.deposit_value AS NUMERIC), 2) = :value
+    ORDER BY deposits.deposit_id;
+    """)
+    for dialect, schema in ARCHIVE_SCHEMAS.items()
+}
+
+# formatted with the pos lines VALUES list of each batch, its size varies.
+POS_REDEEM_BATCH_MATCHING = {
+    dialect: f"""\
+    WITH pos_lines(line, barcode, partner_id, value) AS (VALUES {{values}}),
+    totals AS (
+        SELECT
+            deposits.deposit_id,
+            deposits.deposit_barcode,
+            users.user_partner_id,
+            ROUND(CAST(deposits.deposit_value AS NUMERIC), 2) AS total
+        FROM {_open_deposits(schema)}
+        JOIN main.users ON main.users.user_id=deposits.receiver_id
+        WHERE
+            deposits.deposit_barcode IN (SELECT barcode FROM pos_lines)
+            AND deposits.closed = True
+    )
+    SELECT pos_lines.line, totals.deposit_id
+    FROM pos_lines
+    JOIN totals ON
+        totals.deposit_barcode = pos_lines.barcode
+        AND totals.user_partner_id = pos_lines.partner_id
+        AND totals.total = pos_lines.value
+    ORDER BY pos_lines.line, totals.deposit_id;
+    """
+    for dialect, schema in ARCHIVE_SCHEMAS.items()
+}
+
+OPEN_DEPOSITS = {
+    dialect: text(f"""\
+    SELECT deposit_id FROM {_open_deposits(schema)} WHERE deposit_id IN :ids;
+    """).bindparams(bindparam("ids", expanding=True))
+    for dialect, schema in ARCHIVE_SCHEMAS.items()
+}
+
+INSERT_REDEEM = insert(Redeem).returning(Redeem.c.redeem_id)
+INSERT_REDEEMS = insert(Redeem).returning(Redeem.c.redeem_id, sort_by_parameter_order=True)
+
+UPDATE_DEPOSITS_REDEEM = (
+    update(Deposits)
+    .values(redeemed=bindparam("b_redeem_id"))
+    .where(Deposits.c.deposit_id == bindparam("b_deposit_id"))
+)
+
+ARCHIVED_DEPOSIT_REDEEM = {
+    dialect: text(f"""\
+    UPDATE {schema}.deposits_archive SET redeemed = :b_redeem_id WHERE deposit_id = :b_deposit_id;
+    """)
+    for dialect, schema in ARCHIVE_SCHEMAS.items()
+}
+
+
+# CONSIGNE
+SELECT_CONSIGNE_BARCODES_BASES = select(Consigne.c.consigne_barcode_base)
+SELECT_CONSIGNE_STATES = select(Consigne.c.consigne_barcode_base, Consigne.c.consigne_active)
+
+UPDATE_CONSIGNE_ACTIVE = (
+    update(Consigne)
+    .values(consigne_active=bindparam("b_active"))
+    .where(Consigne.c.consigne_barcode_base.in_(bindparam("b_bases", expanding=True)))
+)
+
+SELECT_BASES_RING = (
+    select(Consigne.c.consigne_id, Consigne.c.consigne_barcode_base)
+    .where(Consigne.c.consigne_active == True)
+    .order_by(Consigne.c.consigne_id)
+)
+
+SELECT_RING_VERSION = select(Consigne_sequence.c.ring_version)
+
+UPDATE_RING_VERSION = (
+    update(Consigne_sequence)
+    .values(ring_version=Consigne_sequence.c.ring_version + 1)
+)
+
+# the position wraps over the ring size, passed along as it is cached by each worker.
+UPDATE_SEQUENCE_POSITION = (
+    update(Consigne_sequence)
+    .values(sequence_position=(Consigne_sequence.c.sequence_position + 1) % bindparam("b_ring_size", type_=Integer))
+    .where(Consigne_sequence.c.sequence_id == 1)
+    .returning(Consigne_sequence.c.sequence_position, Consigne_sequence.c.ring_version)
+)
@@ -0,0 +1,35 @@
+from sqlalchemy import Table
+
+from src import schema
+
+"""
+Static registry of the schema tables, imported where statements are built:
+`from src.tables import Users, Deposits`. Declarative classes of `src.schema` define & create the tables,
+the core `Table` objects below are the ones used in the sql expressions.
+"""
+
+__all__ = [
+    "Users",
+    "Redeem",
+    "Directory",
+    "Consigne",
+    "Consigne_sequence",
+    "Product_returns",
+    "Catalog",
+    "Products",
+    "Deposits",
+    "Deposit_return_totals",
+    "Deposit_lines",
+]
+
+Users: Table = schema.Users.__table__ # pyright: ignore
+Redeem: Table = schema.Redeem.__table__ # pyright: ignore
+Directory: Table = schema.Directory.__table__ # pyright: ignore
+Consigne: Table = schema.Consigne.__table__ # pyright: ignore
+Consigne_sequence: Table = schema.Consigne_sequence.__table__ # pyright: ignore
+Product_returns: Table = schema.Product_returns.__table__ # pyright: ignore
+Catalog: Table = schema.Catalog.__table__ # pyright: ignore
+Products: Table = schema.Products.__table__ # pyright: ignore
+Deposits: Table = schema.Deposits.__table__ # pyright: ignore
+Deposit_return_totals: Table = schema.Deposit_return_totals.__table__ # pyright: ignore
+Deposit_lines: Table = schema.Deposit_lines.__table__ # pyright: ignore
@@ -1,7 +1,10 @@
 import re
+import json
 import random
+from datetime import datetime
 from functools import reduce
 from collections import deque
+from typing import Any
 
 
 def generate_ean(total_value: float, base: str, rule:str = "999....NNNDD") -> str:
@@ -27,3 +30,12 @@ def generate_ean(total_value: float, base: str, rule:str = "999....NNNDD") -> st
 
     ean = re.sub(r"N{1,3}D{1,2}", barcode_value, rule)
     return ean + str(checksum(ean))
+
+
+def json_dumps(obj: Any, **kwargs) -> str:
+    """json responses encoder, timestamps are rendered in ISO 8601 with their offset."""
+    def default(value: Any) -> Any:
+        if isinstance(value, datetime):
+            return value.isoformat()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return json.dumps(obj, default=default, **kwargs)
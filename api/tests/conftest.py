@@ -0,0 +1,39 @@
+import os
+import asyncio
+
+import pytest
+
+os.environ.setdefault("ERP_USERNAME", "tests")
+os.environ.setdefault("ERP_PASSWORD", "tests")
+
+from src.database import ConsigneDatabase
+from src.engine import ConsigneEngine
+from src.odoo import OdooConnector
+
+
+@pytest.fixture
+def database(tmp_path):
+    """migrated sqlite database, its archive attached next to it"""
+    db = ConsigneDatabase("sqlite", str(tmp_path / "consigne.db"))
+    yield db
+    db._engine.dispose()
+
+@pytest.fixture
+def run(database):
+    """
+    run a coroutine to completion. asyncio connections are bound to the event loop that opened them,
+    they are disposed before the loop closes.
+    """
+    def runner(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await database.dispose()
+        return asyncio.run(main())
+    return runner
+
+@pytest.fixture
+def engine(database):
+    """engine on the sqlite database, without odoo, printer nor cache"""
+    return ConsigneEngine(OdooConnector("http://localhost:8069", "tests"), database, None, None) # pyright: ignore
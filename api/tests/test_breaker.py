@@ -0,0 +1,144 @@
+import time
+import asyncio
+
+import pytest
+
+from src.engine import ConsigneEngine
+from src.exceptions import OdooUnavailable
+from src.odoo import BreakerConfigs, CircuitBreaker, OdooConnector, RetryConfigs, RetryPolicy
+
+
+class FakeSession:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(BreakerConfigs(failures=3, reset_timeout=30))
+
+@pytest.fixture
+def odoo_engine(database):
+    """engine whose odoo calls run `f(FakeSession())`, retried without backoff"""
+    policy = RetryPolicy(attempts=3, base_delay=0, max_delay=0, deadline=5)
+    odoo = OdooConnector(
+        "http://localhost:8069", "tests", breaker=BreakerConfigs(failures=2), retry=RetryConfigs(scan=policy, tracker=policy)
+    )
+    odoo.make_session = lambda: FakeSession() # pyright: ignore
+    return ConsigneEngine(odoo, database, None, None) # pyright: ignore
+
+def expire(breaker: CircuitBreaker) -> None:
+    """move an open circuit past its reset timeout"""
+    assert breaker.opened_at is not None
+    breaker.opened_at -= breaker.configs.reset_timeout
+
+
+def test_opens_after_consecutive_failures(breaker):
+    for _ in range(2):
+        breaker.failure()
+        assert breaker.state == "closed" and breaker.allow()
+    breaker.success()
+    for _ in range(3):
+        breaker.failure()
+    assert breaker.state == "open"
+    assert breaker.allow() is False
+    assert 0 < breaker.retry_after() <= 30
+
+def test_half_open_lets_a_single_trial_through(breaker):
+    for _ in range(3):
+        breaker.failure()
+    expire(breaker)
+    assert breaker.state == "half_open"
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+
+    breaker.success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+def test_failed_trial_reopens(breaker):
+    for _ in range(3):
+        breaker.failure()
+    expire(breaker)
+    assert breaker.allow() is True
+    breaker.failure()
+    assert breaker.state == "open"
+
+def test_release_gives_the_trial_back(breaker):
+    for _ in range(3):
+        breaker.failure()
+    expire(breaker)
+    failures = breaker.failures
+    assert breaker.allow() is True
+    breaker.release()
+    assert breaker.state == "half_open" and breaker.failures == failures
+    assert breaker.allow() is True
+
+
+def test_transport_errors_count_and_faults_do_not(odoo_engine):
+    breaker = odoo_engine.odoo.breaker
+
+    def unreachable(session):
+        raise ConnectionError()
+
+    def fault(session):
+        raise ValueError("odoo fault")
+
+    with pytest.raises(OdooUnavailable):
+        asyncio.run(odoo_engine._odoo_call(unreachable))
+    assert breaker.failures == 1
+
+    with pytest.raises(ValueError):
+        asyncio.run(odoo_engine._odoo_call(fault))
+    assert breaker.failures == 0 and breaker.state == "closed"
+
+def test_open_circuit_rejects_without_calling(odoo_engine):
+    breaker = odoo_engine.odoo.breaker
+    breaker.opened_at = time.monotonic()
+    calls = []
+
+    with pytest.raises(OdooUnavailable):
+        asyncio.run(odoo_engine._odoo_call(lambda session: calls.append(session)))
+    assert calls == []
+
+def test_cancelled_call_releases_the_trial_without_failure(odoo_engine):
+    breaker = odoo_engine.odoo.breaker
+    breaker.failures, breaker.opened_at = 2, time.monotonic() - breaker.configs.reset_timeout
+
+    async def main():
+        call = asyncio.create_task(odoo_engine._odoo_call(lambda session: time.sleep(0.2)))
+        await asyncio.sleep(0.05)
+        assert breaker.allow() is False # the trial is in flight
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(main())
+    assert breaker.failures == 2 and breaker.state == "half_open"
+    assert breaker.allow() is True
+
+def test_retry_until_odoo_answers(odoo_engine):
+    attempts = []
+
+    def flaky(session, value):
+        attempts.append(value)
+        if len(attempts) < 2:
+            raise ConnectionError()
+        return value
+
+    assert asyncio.run(odoo_engine._odoo(flaky, 42)) == 42
+    assert len(attempts) == 2
+    assert odoo_engine.odoo.breaker.failures == 0
+
+def test_retry_gives_up_after_its_attempts(odoo_engine):
+    attempts = []
+
+    def unreachable(session):
+        attempts.append(session)
+        raise ConnectionError()
+
+    with pytest.raises(OdooUnavailable):
+        asyncio.run(odoo_engine._odoo(unreachable))
+    assert len(attempts) == 2 # the circuit opens on the second failure, its trial is past the deadline
@@ -0,0 +1,137 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src import cache
+from src.cache import ConsigneCache, single_flight, stale_while_revalidate
+
+
+class MemoryCache(ConsigneCache):
+    """in process stand in of memcached: add, get, gets & cas semantics over a dict"""
+
+    def __init__(self):
+        self.values: dict[str, tuple] = {}
+        self.version = 0
+        self.writes: list[str] = []
+
+    def _store(self, key, value):
+        self.version += 1
+        self.values[key] = (value, self.version)
+
+    def add(self, key, value, expire=0, noreply=None):
+        if key in self.values:
+            return False
+        self._store(key, value)
+        return True
+
+    def set(self, key, value, expire=0, noreply=None):
+        self.writes.append(key)
+        self._store(key, value)
+        return True
+
+    def get(self, key, default=None):
+        return self.values.get(key, (default,))[0]
+
+    def gets(self, key, default=None, cas_default=None):
+        return self.values.get(key, (default, cas_default))
+
+    def cas(self, key, value, cas, expire=0, noreply=None):
+        if self.values.get(key, (None, None))[1] != cas:
+            return False
+        self._store(key, value)
+        return True
+
+
+@pytest.fixture
+def memory_cache():
+    return MemoryCache()
+
+def counting_load(calls: list, delay: float = 0.05):
+    async def load():
+        calls.append(len(calls) + 1)
+        await asyncio.sleep(delay)
+        return len(calls)
+    return load
+
+async def flight(memory_cache, load):
+    return await single_flight(memory_cache, "key", load, lambda: cache._MISS)
+
+
+def test_concurrent_misses_share_one_load(memory_cache):
+    calls = []
+
+    async def main():
+        load = counting_load(calls)
+        return await asyncio.gather(*[flight(memory_cache, load) for _ in range(5)])
+
+    assert asyncio.run(main()) == [1] * 5
+    assert calls == [1]
+    assert cache._inflight == {}
+
+def test_cancelled_leader_hands_over_to_a_waiter(memory_cache):
+    calls = []
+
+    async def main():
+        load = counting_load(calls)
+        leader = asyncio.create_task(flight(memory_cache, load))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(flight(memory_cache, load)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(main()) == [2, 2, 2]
+    assert calls == [1, 2] # one load by the cancelled leader, one by the new one
+    assert cache._inflight == {}
+
+def test_load_errors_reach_every_waiter(memory_cache):
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("odoo fault")
+
+    async def main():
+        return await asyncio.gather(*[flight(memory_cache, failing) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert cache._inflight == {}
+
+
+def test_lock_is_exclusive_until_released(memory_cache):
+    token = memory_cache.acquire_lock("lock_key")
+    assert token is not None and memory_cache.is_locked("lock_key")
+    assert memory_cache.acquire_lock("lock_key") is None
+
+    memory_cache.release_lock("lock_key", token)
+    assert memory_cache.is_locked("lock_key") is False
+
+def test_expired_holder_keeps_the_lock_of_another_worker(memory_cache):
+    expired = memory_cache.acquire_lock("lock_key")
+    del memory_cache.values["lock_key"] # LOCK_TTL elapsed
+    holder = memory_cache.acquire_lock("lock_key")
+
+    memory_cache.release_lock("lock_key", expired) # pyright: ignore
+    assert memory_cache.is_locked("lock_key")
+    memory_cache.release_lock("lock_key", holder) # pyright: ignore
+    assert memory_cache.is_locked("lock_key") is False
+
+
+def test_stale_while_revalidate_stores_a_miss_once(memory_cache):
+    engine = SimpleNamespace(cache=memory_cache)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return {"value": 1}
+
+    async def main():
+        first = await stale_while_revalidate(engine, "key", fetch)
+        second = await stale_while_revalidate(engine, "key", fetch)
+        return first, second
+
+    assert asyncio.run(main()) == ({"value": 1}, {"value": 1})
+    assert calls == [1]
+    assert memory_cache.writes == ["key"]
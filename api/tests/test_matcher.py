@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+RECEIVER = (10, 1010, "Receiver") # odoo partner (id, barcode_base, name)
+PROVIDER = (20, 1020, "Provider")
+
+
+async def closed_deposit(database, barcode: str, values: list[float]) -> int:
+    """closed deposit of RECEIVER holding one line per value, printed with `barcode`"""
+    receiver = await database.get_user_from_partner_id(RECEIVER[0]) or await database.add_user(*RECEIVER)
+    provider = await database.get_user_from_partner_id(PROVIDER[0]) or await database.add_user(*PROVIDER)
+    known = await database.upsert_product_returns([(7, "Bottle", True, 0.25)])
+    product = await database.get_product_from_opid(50) or await database.add_product(50, "Beer", "123", known[7])
+
+    deposit_id = (await database.add_deposit(receiver["user_id"], provider["user_id"]))["deposit_id"]
+    for value in values:
+        await database.add_deposit_line(deposit_id, product["product_id"], value)
+    await database.update_deposit_barcode(deposit_id, barcode, 1)
+    await database.close_deposit(deposit_id)
+    return deposit_id
+
+def pos_line(pos_id: int, barcode: str, value: float, partner: tuple = RECEIVER) -> tuple:
+    return (pos_id, "2026-03-01 10:00:00", value, barcode, partner)
+
+def redeems(database) -> list[tuple]:
+    with database._engine.begin() as c:
+        return [tuple(r) for r in c.execute(text("SELECT odoo_pos_id, redeem_barcode, anomaly FROM main.redeem ORDER BY odoo_pos_id"))]
+
+def redeemed(database) -> dict[int, int | None]:
+    with database._engine.begin() as c:
+        return dict(c.execute(text(
+            "SELECT deposits.deposit_id, redeem.odoo_pos_id FROM main.deposits LEFT JOIN main.redeem ON redeem.redeem_id = deposits.redeemed"
+        )).fetchall())
+
+
+def test_single_candidate_is_redeemed(database, engine, run):
+    async def main():
+        deposit_id = await closed_deposit(database, "9991010000011", [0.25, 0.1])
+        await engine._apply_redeems([pos_line(1, "9991010000011", 0.35)])
+        return deposit_id
+
+    deposit_id = run(main())
+    assert redeemed(database) == {deposit_id: 1}
+    assert redeems(database) == [(1, "9991010000011", False)]
+
+def test_value_partner_and_barcode_must_all_match(database, engine, run):
+    async def main():
+        await closed_deposit(database, "9991010000011", [0.25])
+        await engine._apply_redeems([
+            pos_line(1, "9991010000011", 0.5),
+            pos_line(2, "9991010000028", 0.25),
+            pos_line(3, "9991010000011", 0.25, partner=PROVIDER),
+        ])
+
+    run(main())
+    assert set(redeemed(database).values()) == {None}
+    assert [anomaly for _, _, anomaly in redeems(database)] == [True, True, True]
+
+def test_ambiguous_candidates_are_anomalies(database, engine, run):
+    async def main():
+        await closed_deposit(database, "9991010000011", [0.25])
+        await closed_deposit(database, "9991010000011", [0.25])
+        await engine._apply_redeems([pos_line(1, "9991010000011", 0.25)])
+
+    run(main())
+    assert set(redeemed(database).values()) == {None}
+    assert redeems(database) == [(1, "9991010000011", True)]
+
+def test_a_deposit_is_redeemed_once_per_run(database, engine, run):
+    async def main():
+        deposit_id = await closed_deposit(database, "9991010000011", [0.25])
+        await engine._apply_redeems([pos_line(1, "9991010000011", 0.25), pos_line(2, "9991010000011", 0.25)])
+        await engine._apply_redeems([pos_line(3, "9991010000011", 0.25)])
+        return deposit_id
+
+    deposit_id = run(main())
+    assert redeemed(database) == {deposit_id: 1}
+    assert [anomaly for _, _, anomaly in redeems(database)] == [False, True, True]
+
+def test_lines_without_partner_are_skipped(database, engine, run):
+    async def main():
+        await closed_deposit(database, "9991010000011", [0.25])
+        await engine._apply_redeems([pos_line(1, "9991010000011", 0.25, partner=None)]) # pyright: ignore
+
+    run(main())
+    assert redeems(database) == []
+
+def test_archived_deposits_are_redeemed_in_the_archive(database, engine, run):
+    async def main():
+        deposit_id = await closed_deposit(database, "9991010000011", [0.25])
+        now = datetime.now(timezone.utc)
+        # not redeemed, expired right away
+        assert await database.archive_deposits(now - timedelta(days=30), now + timedelta(days=1)) == 1
+        await engine._apply_redeems([pos_line(1, "9991010000011", 0.25)])
+        return deposit_id
+
+    deposit_id = run(main())
+    with database._engine.begin() as c:
+        archived = c.execute(text("SELECT deposit_id, redeemed FROM archive.deposits_archive")).fetchall()
+    assert [r[0] for r in archived] == [deposit_id] and archived[0][1] is not None
+    assert redeems(database) == [(1, "9991010000011", False)]
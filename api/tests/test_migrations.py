@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from src.migrations import MIGRATIONS, migrate, rollback, table_columns
+
+
+VERSIONS = sorted(m.version for m in MIGRATIONS)
+
+
+def applied(database) -> list[int]:
+    with database._engine.begin() as c:
+        return [r[0] for r in c.execute(text("SELECT version FROM main.schema_migrations ORDER BY version"))]
+
+def indexes(database) -> set[str]:
+    with database._engine.begin() as c:
+        return {r[0] for r in c.execute(text("SELECT name FROM main.sqlite_master WHERE type = 'index'"))}
+
+def archive_tables(database) -> set[str]:
+    with database._engine.begin() as c:
+        return {r[0] for r in c.execute(text("SELECT name FROM archive.sqlite_master WHERE type = 'table'"))}
+
+def seed_deposit(database, line_value: float = 0.0) -> None:
+    with database._engine.begin() as c:
+        c.execute(text(
+            "INSERT INTO main.product_returns (product_return_id, product_return_name, odoo_product_return_id, returnable, return_value) "
+            "VALUES (2, 'Bottle', 7, true, 0.25)"
+        ))
+        c.execute(text("INSERT INTO main.products (product_id, odoo_product_id, product_name, barcode, product_return_id) VALUES (1, 50, 'Beer', '123', 2)"))
+        c.execute(text("INSERT INTO main.users (user_id, user_partner_id, user_code, user_name) VALUES (1, 1, 1001, 'U1')"))
+        c.execute(
+            text(
+                "INSERT INTO main.deposits (deposit_id, receiver_id, provider_id, deposit_datetime, closed) "
+                "VALUES (1, 1, 1, :dt, false)"
+            ),
+            {"dt": "2026-03-01 09:30:00.000000"}
+        )
+        c.execute(
+            text(
+                "INSERT INTO main.deposit_lines (deposit_line_id, deposit_id, product_id, deposit_line_datetime, canceled, line_value) "
+                "VALUES (1, 1, 1, :dt, false, :value)"
+            ),
+            {"dt": "2026-03-01 09:31:00.000000", "value": line_value}
+        )
+
+
+def test_fresh_database_is_fully_migrated(database):
+    assert applied(database) == VERSIONS
+    assert {"idx_deposits_barcode", "idx_redeem_datetime", "idx_deposits_datetime"} <= indexes(database)
+    assert {"deposits_archive", "deposit_lines_archive"} <= archive_tables(database)
+    with database._engine.begin() as c:
+        assert "line_value" in table_columns(c, "deposit_lines")
+        assert "line_value" in table_columns(c, "deposit_lines_archive", schema="archive")
+
+def test_migrate_is_idempotent(database):
+    assert migrate(database._engine, "sqlite") == []
+    assert applied(database) == VERSIONS
+
+def test_rollback_reverts_latest_first_then_migrate_reapplies(database):
+    assert rollback(database._engine, "sqlite") == list(reversed(VERSIONS))
+    assert applied(database) == []
+    assert "idx_deposits_barcode" not in indexes(database)
+    assert "deposits_archive" not in archive_tables(database)
+    with database._engine.begin() as c:
+        assert "deposit_value" not in table_columns(c, "deposits")
+        assert "line_value" not in table_columns(c, "deposit_lines")
+
+    assert migrate(database._engine, "sqlite") == VERSIONS
+    assert applied(database) == VERSIONS
+
+def test_migrate_up_to_target(database):
+    rollback(database._engine, "sqlite", target=2)
+    assert applied(database) == [1, 2]
+    assert migrate(database._engine, "sqlite", target=4) == [3, 4]
+    assert applied(database) == [1, 2, 3, 4]
+
+def test_timestamps_survive_a_rollback(database, run):
+    seed_deposit(database)
+    before = run(database.get_deposit_data(1))["deposit"]["deposit_datetime"]
+    assert datetime.fromisoformat(before) == datetime(2026, 3, 1, 9, 30, tzinfo=timezone.utc)
+
+    rollback(database._engine, "sqlite", target=4)
+    with database._engine.begin() as c:
+        local = c.execute(text("SELECT deposit_datetime FROM main.deposits")).scalar()
+    assert local[10] == "-" # api local time format, `YYYY-MM-DD-HH:MM:SS.ffffff`
+
+    migrate(database._engine, "sqlite")
+    assert run(database.get_deposit_data(1))["deposit"]["deposit_datetime"] == before
+
+def test_line_values_are_backfilled(database, run):
+    seed_deposit(database)
+    rollback(database._engine, "sqlite", target=5)
+    migrate(database._engine, "sqlite")
+
+    document = run(database.get_deposit_data(1))
+    assert [line["line_value"] for line in document["deposit_lines"]] == [0.25]